@@ -9,6 +9,7 @@ from .models import (
     Panolero,
     Prestamo,
     PrestamoDetalle,
+    PeriodoAcademico,
 )
 
 # ---------------------------------------------------
@@ -32,6 +33,15 @@ class HerramientaAdmin(admin.ModelAdmin):
     list_filter = ("tipo",)
     ordering = ("codigo",)
 
+    def delete_queryset(self, request, queryset):
+        # "Eliminar seleccionados" no pasa por Herramienta.delete(): avisamos
+        # al índice del escáner y al delta del catálogo con los códigos borrados
+        codigos = list(queryset.values_list("codigo", flat=True))
+        super().delete_queryset(request, queryset)
+
+        from .indice_herramientas import notificar_cambio
+        notificar_cambio(codigos)
+
 
 # ---------------------------------------------------
 # DOCENTES
@@ -43,6 +53,13 @@ class DocenteAdmin(admin.ModelAdmin):
     list_filter = ("activo",)
     ordering = ("codigo",)
 
+    def delete_queryset(self, request, queryset):
+        # "Eliminar seleccionados" no pasa por Docente.delete()
+        super().delete_queryset(request, queryset)
+
+        from .versiones import notificar_cambio
+        notificar_cambio("docentes")
+
 
 # ---------------------------------------------------
 # ESTUDIANTES
@@ -64,6 +81,13 @@ class AsignaturaAdmin(admin.ModelAdmin):
     search_fields = ("codigo", "nombre")
     ordering = ("nombre",)
 
+    def delete_queryset(self, request, queryset):
+        # "Eliminar seleccionados" no pasa por Asignatura.delete()
+        super().delete_queryset(request, queryset)
+
+        from .versiones import notificar_cambio
+        notificar_cambio("asignaturas")
+
 
 # ---------------------------------------------------
 # PANOLEROS
@@ -111,3 +135,35 @@ class PrestamoAdmin(admin.ModelAdmin):
     )
     inlines = [PrestamoDetalleInline]
     ordering = ("-fecha", "-id")
+
+    def delete_queryset(self, request, queryset):
+        # "Eliminar seleccionados" no pasa por Prestamo.delete(): marcamos
+        # los días borrados en los resúmenes e invalidamos los KPIs en caché
+        fechas = list(queryset.order_by().values_list("fecha", flat=True).distinct())
+        super().delete_queryset(request, queryset)
+
+        from .resumenes import marcar_dia
+        from .cache_kpis import notificar_cambio
+        for fecha in fechas:
+            marcar_dia(fecha)
+        notificar_cambio()
+
+
+# ---------------------------------------------------
+# PERIODOS ACADÉMICOS (calendario para los filtros por semestre)
+# ---------------------------------------------------
+@admin.register(PeriodoAcademico)
+class PeriodoAcademicoAdmin(admin.ModelAdmin):
+    list_display = ("codigo", "nombre", "fecha_inicio", "fecha_fin", "activo")
+    search_fields = ("codigo", "nombre")
+    list_filter = ("activo",)
+    ordering = ("-fecha_inicio",)
+
+    def delete_queryset(self, request, queryset):
+        # "Eliminar seleccionados" borra con queryset.delete(), sin pasar por
+        # PeriodoAcademico.delete(): avisamos igual a los demás procesos.
+        # (Guardar, también desde list_editable, usa save() y ya avisa.)
+        super().delete_queryset(request, queryset)
+
+        from .periodos import notificar_cambio
+        notificar_cambio()
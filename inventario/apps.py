@@ -4,3 +4,9 @@ from django.apps import AppConfig
 class InventarioConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'inventario'
+
+    def ready(self):
+        # Modelo de recomendación ya entrenado (archivo en disco): cada
+        # worker lo tiene listo sin consultar la BD en la primera petición.
+        from . import recomendador
+        recomendador.cargar_modelo()
@@ -0,0 +1,127 @@
+# inventario/cache_kpis.py
+
+import hashlib
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+
+from . import kpis
+from . import series
+from . import versiones
+
+# Caché en memoria (uno por proceso) de los KPIs ya calculados:
+#   clave   = tipo ('kpis' o 'serie') + filtros normalizados (semestre, carrera, fechas, ...)
+#   entrada = (version de 'kpis' con la que se calculó, datos)
+#
+# Préstamos, devoluciones y bajas incrementan la versión 'kpis' en
+# versiones_datos (al confirmar la transacción); una entrada con versión
+# distinta a la vigente ya no sirve y se recalcula.
+CLAVE_VERSION = "kpis"
+
+# Combinaciones de filtros que se guardan como máximo (las menos usadas salen primero)
+MAX_ENTRADAS = getattr(settings, "KPIS_CACHE_MAX_ENTRADAS", 200)
+
+_lock = threading.Lock()
+_entradas = OrderedDict()
+_estadisticas = {"aciertos": 0, "fallos": 0, "vencidas": 0, "descartadas": 0}
+
+
+def normalizar_filtros(filtros):
+    """
+    Clave estable para un conjunto de filtros: sin vacíos, fechas en
+    formato ISO (así '01-03-2025' y '2025-03-01' comparten entrada).
+    """
+    normalizados = {}
+    for nombre, valor in filtros.items():
+        valor = (valor or "").strip()
+        if not valor:
+            continue
+        if nombre in ("fecha_desde", "fecha_hasta"):
+            fecha = kpis.parsear_fecha(valor)
+            if fecha is None:
+                continue   # el motor también ignora fechas inválidas
+            valor = fecha.isoformat()
+        elif nombre in ("estado", "q"):
+            valor = valor.lower()
+        normalizados[nombre] = valor
+    return tuple(sorted(normalizados.items()))
+
+
+def obtener(filtros):
+    """
+    KPIs de 'filtros' (como kpis.calcular), desde el caché si se calcularon
+    con la versión vigente. El resultado se comparte: no modificarlo.
+    """
+    return _obtener(("kpis",) + normalizar_filtros(filtros), lambda: kpis.calcular(filtros))
+
+
+def obtener_serie(filtros):
+    """
+    Serie de tiempo de 'filtros' (como series.calcular), con el mismo
+    caché y la misma versión que los KPIs: un gráfico que se refresca sin
+    préstamos nuevos no vuelve a consultar los resúmenes.
+    """
+    return _obtener(("serie",) + normalizar_filtros(filtros), lambda: series.calcular(filtros))
+
+
+def _obtener(clave, calcular):
+    # Leemos la versión ANTES de calcular: si alguien escribe entremedio,
+    # la entrada queda con una versión vieja y la próxima vez se recalcula.
+    version = versiones.obtener_version(CLAVE_VERSION)
+
+    with _lock:
+        entrada = _entradas.get(clave)
+        if entrada is not None and entrada[0] == version:
+            _entradas.move_to_end(clave)
+            _estadisticas["aciertos"] += 1
+            return entrada[1]
+        _estadisticas["fallos"] += 1
+        if entrada is not None:
+            _estadisticas["vencidas"] += 1
+
+    datos = calcular()
+
+    with _lock:
+        _entradas[clave] = (version, datos)
+        _entradas.move_to_end(clave)
+        while len(_entradas) > MAX_ENTRADAS:
+            _entradas.popitem(last=False)
+            _estadisticas["descartadas"] += 1
+
+    return datos
+
+
+def etag(tipo, filtros):
+    """
+    ETag para respuestas HTTP de 'tipo' ('kpis' / 'serie'): cambia con los
+    filtros y con la versión de los datos, así el navegador puede
+    revalidar con If-None-Match y recibir 304 sin que se calcule nada.
+    """
+    version = versiones.obtener_version(CLAVE_VERSION)
+    huella = hashlib.sha1(repr(normalizar_filtros(filtros)).encode("utf-8")).hexdigest()[:16]
+    return f'"{tipo}-{version}-{huella}"'
+
+
+def notificar_cambio():
+    """Invalida los KPIs en caché (de todos los procesos) al confirmar la transacción."""
+    versiones.notificar_cambio(CLAVE_VERSION)
+
+
+def limpiar():
+    """Vacía el caché de este proceso y reinicia las estadísticas."""
+    with _lock:
+        _entradas.clear()
+        for nombre in _estadisticas:
+            _estadisticas[nombre] = 0
+
+
+def estadisticas():
+    """Aciertos, fallos y tamaño del caché de este proceso."""
+    with _lock:
+        datos = dict(_estadisticas)
+        datos["entradas"] = len(_entradas)
+    consultas = datos["aciertos"] + datos["fallos"]
+    datos["max_entradas"] = MAX_ENTRADAS
+    datos["tasa_aciertos"] = round(datos["aciertos"] / consultas, 3) if consultas else None
+    return datos
@@ -0,0 +1,123 @@
+# inventario/catalogo.py
+
+from django.db.models import Min
+
+from .models import Herramienta, Docente, Asignatura, CambioHerramienta
+from . import indice_herramientas
+from . import versiones
+
+# La versión del catálogo combina las tres versiones de datos:
+#   "<herramientas>.<docentes>.<asignaturas>"   ej: "153.4.20"
+CLAVES = ("herramientas", "docentes", "asignaturas")
+
+CAMPOS_HERRAMIENTA = ("codigo", "codigo_barra", "nombre", "stock_disponible", "tipo")
+
+
+def _formatear(version_h, version_d, version_a):
+    return f"{version_h}.{version_d}.{version_a}"
+
+
+def parsear_version(texto):
+    """'153.4.20' → (153, 4, 20); None si el texto no es una versión válida."""
+    partes = (texto or "").strip().split(".")
+    if len(partes) != len(CLAVES) or not all(p.isdigit() for p in partes):
+        return None
+    return tuple(int(p) for p in partes)
+
+
+def version_actual():
+    """Versión vigente del catálogo (una consulta a versiones_datos)."""
+    v = versiones.obtener_versiones(CLAVES)
+    return _formatear(v["herramientas"], v["docentes"], v["asignaturas"])
+
+
+def _docentes():
+    return list(
+        Docente.objects
+        .filter(activo=True)
+        .order_by("nombre")
+        .values("codigo", "nombre")
+    )
+
+
+def _asignaturas():
+    return list(
+        Asignatura.objects
+        .order_by("nombre")
+        .values("id", "codigo", "nombre")
+    )
+
+
+def _solo_campos(fila):
+    return {c: fila[c] for c in CAMPOS_HERRAMIENTA}
+
+
+def instantanea():
+    """
+    Catálogo completo para las páginas de préstamo / preparación.
+    Las herramientas salen del índice en memoria (sin leer la tabla completa).
+    """
+    v = versiones.obtener_versiones(("docentes", "asignaturas"))
+    version_h, filas = indice_herramientas.instantanea()
+
+    return {
+        "version": _formatear(version_h, v["docentes"], v["asignaturas"]),
+        "completo": True,
+        "herramientas": sorted(
+            (_solo_campos(f) for f in filas),
+            key=lambda h: (h["nombre"] or "").lower(),
+        ),
+        "eliminadas": [],
+        "docentes": _docentes(),
+        "asignaturas": _asignaturas(),
+    }
+
+
+def delta(desde):
+    """
+    Solo lo que cambió desde la versión 'desde' (texto "h.d.a"):
+
+      - herramientas: las filas cuyo código aparece en 'cambios_herramientas'
+        con versión > h; "eliminadas" = códigos que ya no existen.
+      - docentes / asignaturas: la lista completa solo si su versión cambió
+        (son tablas chicas); si no cambió, la clave no se incluye.
+
+    Si 'desde' no es válida, es muy antigua (el registro ya se podó) o hubo
+    un cambio masivo (importación), se devuelve la instantánea completa.
+    """
+    anterior = parsear_version(desde)
+    if anterior is None:
+        return instantanea()
+    desde_h, desde_d, desde_a = anterior
+
+    v = versiones.obtener_versiones(CLAVES)
+    if desde_h > v["herramientas"] or desde_d > v["docentes"] or desde_a > v["asignaturas"]:
+        # Versión del futuro: la BD se reinició o el cliente está corrupto
+        return instantanea()
+
+    resultado = {
+        "version": _formatear(v["herramientas"], v["docentes"], v["asignaturas"]),
+        "completo": False,
+        "herramientas": [],
+        "eliminadas": [],
+    }
+
+    if desde_h < v["herramientas"]:
+        cambios = CambioHerramienta.objects.filter(version__gt=desde_h)
+
+        # ¿El registro todavía cubre desde 'desde_h + 1'?
+        minima = CambioHerramienta.objects.aggregate(minima=Min("version"))["minima"]
+        codigos = set(cambios.values_list("codigo", flat=True))
+        if minima is None or minima > desde_h + 1 or None in codigos:
+            return instantanea()
+
+        filas = list(Herramienta.objects.filter(codigo__in=codigos).values(*CAMPOS_HERRAMIENTA))
+        resultado["herramientas"] = filas
+        resultado["eliminadas"] = sorted(codigos - {f["codigo"] for f in filas})
+
+    if desde_d != v["docentes"]:
+        resultado["docentes"] = _docentes()
+    if desde_a != v["asignaturas"]:
+        resultado["asignaturas"] = _asignaturas()
+
+    return resultado
@@ -0,0 +1,74 @@
+# inventario/codigos.py
+
+import re
+
+from django.utils import timezone
+
+from .models import Prestamo, Preparacion
+from . import secuencias
+
+# Códigos legibles con un contador por día:
+#   P20251017-0001, P20251017-0002, ...   (préstamos)
+#   C20251017-0001, ...                   (preparaciones)
+# El guion los distingue del formato antiguo (P + AAAAMMDDhhmmss),
+# así nunca chocan con códigos ya guardados.
+DIGITOS_CONTADOR = 4
+
+PREFIJO_PRESTAMO = "P"
+PREFIJO_PREPARACION = "C"
+
+_MODELOS = {
+    PREFIJO_PRESTAMO: (Prestamo, "codigo_prestamo"),
+    PREFIJO_PREPARACION: (Preparacion, "codigo_preparacion"),
+}
+
+
+def _prefijo_del_dia(prefijo, fecha):
+    return f"{prefijo}{fecha.strftime('%Y%m%d')}-"
+
+
+def _maximo_del_dia(prefijo, fecha):
+    """
+    Mayor contador ya usado ese día (solo se consulta al crear el contador
+    del día, por si la fila de 'secuencias' se borró a mano).
+    """
+    modelo, campo = _MODELOS[prefijo]
+    inicio = _prefijo_del_dia(prefijo, fecha)
+
+    maximo = 0
+    for codigo in modelo.objects.filter(**{f"{campo}__startswith": inicio}).values_list(campo, flat=True):
+        sufijo = codigo[len(inicio):]
+        if re.fullmatch(r"[0-9]+", sufijo):
+            maximo = max(maximo, int(sufijo))
+    return maximo
+
+
+def generar_codigos(prefijo, fecha=None, cantidad=1):
+    """
+    Devuelve 'cantidad' códigos únicos del día 'fecha' (hoy por defecto).
+
+    El contador diario vive en la tabla 'secuencias' (nombre "P20251017", ...)
+    y se reserva con SELECT ... FOR UPDATE en su propia transacción corta,
+    así dos pañoleros que registran en el mismo segundo reciben códigos
+    distintos. Si la transacción de quien llama se deshace, el número
+    queda sin usar (puede haber saltos, nunca repetidos).
+    """
+    if fecha is None:
+        fecha = timezone.localdate()
+
+    nombre = f"{prefijo}{fecha.strftime('%Y%m%d')}"
+    bloque = secuencias.reservar_bloque(
+        nombre,
+        cantidad,
+        maximo=lambda: _maximo_del_dia(prefijo, fecha),
+    )
+    inicio = _prefijo_del_dia(prefijo, fecha)
+    return [f"{inicio}{valor:0{DIGITOS_CONTADOR}d}" for valor in bloque]
+
+
+def nuevo_codigo_prestamo(fecha=None):
+    return generar_codigos(PREFIJO_PRESTAMO, fecha)[0]
+
+
+def nuevo_codigo_preparacion(fecha=None):
+    return generar_codigos(PREFIJO_PREPARACION, fecha)[0]
@@ -0,0 +1,323 @@
+# inventario/exportaciones.py
+
+import csv
+import json
+import tempfile
+
+from django.db.models import Q
+
+from .models import PrestamoDetalle
+from . import kpis
+from . import marca
+
+# Exportaciones con memoria acotada: las filas se leen con values() en
+# bloques por cursor (WHERE ... < último visto LIMIT n; .iterator() no
+# sirve: mysqlclient trae el resultado completo al cliente) y se escriben
+# a medida que llegan, sin instanciar modelos ni guardar la lista completa.
+TAMANO_BLOQUE = 2000
+
+CAMPOS_PRESTAMO = (
+    "codigo_prestamo", "fecha", "hora_inicio", "hora_fin",
+    "docente__nombre", "estudiante__nombre", "estudiante__carrera",
+    "asignatura__nombre", "panolero__nombre", "estado",
+)
+
+ENCABEZADOS_PRESTAMOS = [
+    "Código", "Fecha", "Hora inicio", "Hora fin",
+    "Solicitante", "Asignatura", "Pañolero", "Estado",
+]
+
+
+def solicitante(fila, prefijo=""):
+    """'Nombre (Docente)', 'Nombre (Carrera)' o '-' a partir de una fila de values()."""
+    docente = fila.get(f"{prefijo}docente__nombre")
+    if docente:
+        return f"{docente} (Docente)"
+    estudiante = fila.get(f"{prefijo}estudiante__nombre")
+    if estudiante:
+        return f"{estudiante} ({fila.get(f'{prefijo}estudiante__carrera')})"
+    return "-"
+
+
+def _fila_prestamo(p):
+    return [
+        p["codigo_prestamo"],
+        p["fecha"].strftime("%Y-%m-%d") if p["fecha"] else "",
+        p["hora_inicio"].strftime("%H:%M") if p["hora_inicio"] else "",
+        p["hora_fin"].strftime("%H:%M") if p["hora_fin"] else "",
+        solicitante(p),
+        p["asignatura__nombre"] or "-",
+        p["panolero__nombre"] or "-",
+        p["estado"],
+    ]
+
+
+def _bloques_prestamos(prestamos, tamano=TAMANO_BLOQUE):
+    """Listas de filas values() de a 'tamano', en orden (-fecha, -id), paginando por cursor."""
+    base = prestamos.values("id", *CAMPOS_PRESTAMO).order_by("-fecha", "-id")
+
+    bloque = list(base[:tamano])
+    while bloque:
+        yield bloque
+        if len(bloque) < tamano:
+            return
+        ultima = bloque[-1]
+        bloque = list(
+            base.filter(
+                Q(fecha__lt=ultima["fecha"]) | Q(fecha=ultima["fecha"], id__lt=ultima["id"])
+            )[:tamano]
+        )
+
+
+def _hoja_kpis(ws, datos):
+    ws.append(["KPI", "Valor"])
+    ws.append(["Total de préstamos", datos["total_prestamos"]])
+    ws.append(["Herramientas entregadas", datos["total_herramientas"]])
+    ws.append(["Préstamos a docentes", datos["total_prest_docente"]])
+    ws.append(["Préstamos a estudiantes", datos["total_prest_estudiante"]])
+    ws.append(["Préstamos otros", datos["total_prest_otros"]])
+    ws.append(["Pañoleros activos", datos["total_panoleros"]])
+
+    rankings = [
+        ("Top 5 docentes", "Préstamos", datos["top_docentes"], "docente__nombre", "total_prestamos"),
+        ("Top 5 carreras", "Préstamos", datos["top_carreras"], "estudiante__carrera", "total_prestamos"),
+        ("Top 5 herramientas", "Cantidad entregada", datos["top_herramientas"], "herramienta__nombre", "total_cant"),
+        ("Top 5 asignaturas", "Préstamos", datos["top_asignaturas"], "asignatura__nombre", "total_prestamos"),
+        ("Top 5 llaves de auto", "Préstamos", datos["top_autos"], "herramienta__nombre", "total_prestamos"),
+        ("Top 5 pañoleros", "Préstamos", datos["top_panoleros"], "panolero__nombre", "total_prestamos"),
+    ]
+    for titulo, columna, filas, campo, valor in rankings:
+        ws.append([])
+        ws.append([titulo, columna])
+        for f in filas:
+            ws.append([f[campo], f[valor]])
+
+
+def kpis_xlsx(datos, prestamos, destino=None):
+    """
+    Arma el Excel del panel (hoja KPIs + hoja Préstamos) con un workbook
+    write-only de openpyxl: cada fila se escribe al disco apenas se lee.
+    Si se indica 'destino' (ruta o archivo) se guarda ahí; si no, devuelve
+    un archivo temporal (ya rebobinado) que se borra al cerrarlo y que la
+    vista entrega en bloques con FileResponse.
+    """
+    import openpyxl
+
+    wb = openpyxl.Workbook(write_only=True)
+
+    _hoja_kpis(wb.create_sheet(title="KPIs"), datos)
+
+    ws = wb.create_sheet(title="Préstamos")
+    ws.append(ENCABEZADOS_PRESTAMOS)
+    for bloque in _bloques_prestamos(prestamos):
+        for p in bloque:
+            ws.append(_fila_prestamo(p))
+
+    if destino is not None:
+        wb.save(destino)
+        return destino
+
+    archivo = tempfile.TemporaryFile()
+    try:
+        wb.save(archivo)
+    except Exception:
+        archivo.close()
+        raise
+    archivo.seek(0)
+    return archivo
+
+
+def kpis_pdf(datos, filtros, destino):
+    """
+    Dibuja el PDF del panel (filtros, KPIs generales y rankings) en
+    'destino' (un HttpResponse o un archivo abierto en modo binario).
+    """
+    from reportlab.pdfgen import canvas
+    from reportlab.lib.pagesizes import letter
+
+    c = canvas.Canvas(destino, pagesize=letter)
+    width, height = letter
+
+    # -------- LOGO (copia local en memoria; nunca espera a la red) --------
+    logo_image = marca.obtener_logo()
+    if logo_image is not None:
+        logo_width = 80
+        logo_height = 40
+        x = width - logo_width - 40
+        y = height - logo_height - 30
+
+        c.drawImage(
+            logo_image,
+            x,
+            y,
+            width=logo_width,
+            height=logo_height,
+            preserveAspectRatio=True,
+            mask="auto",
+        )
+
+    # -------- TÍTULO Y FILTROS --------
+    y = height - 60
+    c.setFont("Helvetica-Bold", 14)
+    c.drawString(40, y, "Panel de KPIs - Resumen")
+    y -= 20
+
+    c.setFont("Helvetica", 9)
+    lineas_filtros = [
+        f"Semestre: {filtros.get('semestre') or 'Todos'}",
+        f"Carrera: {filtros.get('carrera') or 'Todas'}",
+        f"Asignatura: {filtros.get('asignatura') or 'Todas'}",
+        f"Fecha desde: {filtros.get('fecha_desde') or '---'}",
+        f"Fecha hasta: {filtros.get('fecha_hasta') or '---'}",
+    ]
+    for linea in lineas_filtros:
+        c.drawString(40, y, linea)
+        y -= 12
+
+    # -------- KPIs GENERALES (FILTRADOS) --------
+    y -= 8
+    c.setFont("Helvetica-Bold", 11)
+    c.drawString(40, y, "KPIs generales")
+    y -= 15
+    c.setFont("Helvetica", 9)
+
+    lineas_kpis = [
+        f"Total de préstamos: {datos['total_prestamos']}",
+        f"Herramientas entregadas: {datos['total_herramientas']}",
+        f"Préstamos a docentes: {datos['total_prest_docente']}",
+        f"Préstamos a estudiantes: {datos['total_prest_estudiante']}",
+        f"Préstamos otros: {datos['total_prest_otros']}",
+        f"Pañoleros activos: {datos['total_panoleros']}",
+    ]
+    for l in lineas_kpis:
+        c.drawString(40, y, l)
+        y -= 12
+
+    def check_page(y_actual):
+        if y_actual < 60:
+            c.showPage()
+            return height - 40
+        return y_actual
+
+    # -------- RANKINGS (FILTRADOS) --------
+    secciones_rank = [
+        ("Top 5 docentes (por préstamos)", datos["top_docentes"],
+         lambda d: f"{d['docente__nombre']}: {d['total_prestamos']}"),
+        ("Top 5 carreras (préstamos a estudiantes)", datos["top_carreras"],
+         lambda r: f"{r['estudiante__carrera']}: {r['total_prestamos']}"),
+        ("Top 5 herramientas (cantidad entregada)", datos["top_herramientas"],
+         lambda h: f"{h['herramienta__nombre']}: {h['total_cant']}"),
+        ("Top 5 asignaturas (préstamos)", datos["top_asignaturas"],
+         lambda a: f"{a['asignatura__nombre']}: {a['total_prestamos']}"),
+        ("Top 5 llaves de auto (préstamos)", datos["top_autos"],
+         lambda au: f"{au['herramienta__nombre']}: {au['total_prestamos']}"),
+        ("Top 5 pañoleros (préstamos registrados)", datos["top_panoleros"],
+         lambda p: f"{p['panolero__nombre']}: {p['total_prestamos']}"),
+    ]
+
+    for titulo, lista, fmt in secciones_rank:
+        y = check_page(y - 10)
+        c.setFont("Helvetica-Bold", 11)
+        c.drawString(40, y, titulo)
+        y -= 15
+        c.setFont("Helvetica", 9)
+
+        if not lista:
+            c.drawString(50, y, "Sin registros para este ranking.")
+            y -= 12
+        else:
+            for item in lista:
+                y = check_page(y)
+                c.drawString(50, y, f"- {fmt(item)}")
+                y -= 12
+
+    c.showPage()
+    c.save()
+
+
+# ---------------------------------------------------------------
+# Préstamos + líneas de detalle (CSV / NDJSON en streaming)
+#   Se recorre 'prestamo_detalle' unido a 'prestamos' por bloques de
+#   id (WHERE id > último ORDER BY id LIMIT n): cada bloque es una
+#   consulta indexada y solo ese bloque está en memoria.
+# ---------------------------------------------------------------
+COLUMNAS_DETALLE = [
+    # (columna de salida, campo de values())
+    ("codigo_prestamo", "prestamo__codigo_prestamo"),
+    ("fecha", "prestamo__fecha"),
+    ("hora_inicio", "prestamo__hora_inicio"),
+    ("hora_fin", "prestamo__hora_fin"),
+    ("estado", "prestamo__estado"),
+    ("docente_codigo", "prestamo__docente"),
+    ("docente", "prestamo__docente__nombre"),
+    ("estudiante_rut", "prestamo__estudiante"),
+    ("estudiante", "prestamo__estudiante__nombre"),
+    ("carrera", "prestamo__estudiante__carrera"),
+    ("asignatura", "prestamo__asignatura__nombre"),
+    ("panolero", "prestamo__panolero__nombre"),
+    ("herramienta_codigo", "herramienta_id"),
+    ("herramienta", "herramienta__nombre"),
+    ("tipo", "herramienta__tipo"),
+    ("cantidad_solicitada", "cantidad_solicitada"),
+    ("cantidad_entregada", "cantidad_entregada"),
+    ("cantidad_devuelta", "cantidad_devuelta"),
+    ("observacion", "observacion"),
+]
+
+
+def _bloques_detalle(filtros, tamano=TAMANO_BLOQUE):
+    """Listas de filas {columna: valor} de a 'tamano', paginando por id."""
+    base = (
+        PrestamoDetalle.objects
+        .filter(kpis.filtro_prestamos(filtros, prefijo="prestamo__"))
+        .order_by("id")
+    )
+    campos = ["id"] + [campo for _, campo in COLUMNAS_DETALLE]
+
+    ultimo_id = 0
+    while True:
+        bloque = list(base.filter(id__gt=ultimo_id).values(*campos)[:tamano])
+        if not bloque:
+            return
+        ultimo_id = bloque[-1]["id"]
+        yield [
+            {columna: fila[campo] for columna, campo in COLUMNAS_DETALLE}
+            for fila in bloque
+        ]
+        if len(bloque) < tamano:
+            return
+
+
+class _Eco:
+    """Pseudo-archivo para csv.writer: devuelve la línea en vez de guardarla."""
+
+    def write(self, valor):
+        return valor
+
+
+def detalle_csv(filtros):
+    """
+    Genera el CSV línea por línea. El encabezado sale antes de la primera
+    consulta, así el navegador empieza a recibir datos de inmediato.
+    El BOM inicial hace que Excel lea bien los acentos.
+    """
+    escritor = csv.writer(_Eco())
+    yield "\ufeff" + escritor.writerow([columna for columna, _ in COLUMNAS_DETALLE])
+
+    for bloque in _bloques_detalle(filtros):
+        yield "".join(
+            escritor.writerow([
+                "" if fila[columna] is None else fila[columna]
+                for columna, _ in COLUMNAS_DETALLE
+            ])
+            for fila in bloque
+        )
+
+
+def detalle_ndjson(filtros):
+    """Genera un objeto JSON por línea (fechas y horas en formato ISO)."""
+    for bloque in _bloques_detalle(filtros):
+        yield "".join(
+            json.dumps(fila, ensure_ascii=False, default=str) + "\n"
+            for fila in bloque
+        )
@@ -0,0 +1,116 @@
+# inventario/idempotencia.py
+
+import json
+import re
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from .models import SolicitudIdempotente
+
+# Nombre del campo oculto de los formularios y de la cabecera HTTP
+CAMPO_FORMULARIO = "idempotency_key"
+CABECERA = "HTTP_IDEMPOTENCY_KEY"   # "Idempotency-Key: ..."
+
+_CLAVE_VALIDA = re.compile(r"^[A-Za-z0-9_.:-]{8,64}$")
+
+
+class SolicitudDuplicada(Exception):
+    """Otra solicitud con la misma clave ya se registró (o se está registrando)."""
+
+    def __init__(self, clave):
+        self.clave = clave
+        super().__init__(clave)
+
+
+def _horas_vigencia():
+    return getattr(settings, "IDEMPOTENCIA_HORAS", 24)
+
+
+def _limite_vigencia():
+    return timezone.now() - timedelta(hours=_horas_vigencia())
+
+
+def obtener_clave(request):
+    """
+    Clave de idempotencia enviada por el cliente (campo oculto del
+    formulario o cabecera Idempotency-Key). None si no viene o no es válida:
+    en ese caso la solicitud se procesa como siempre, sin protección.
+    """
+    clave = (
+        request.POST.get(CAMPO_FORMULARIO)
+        or request.META.get(CABECERA)
+        or ""
+    ).strip()
+    if not _CLAVE_VALIDA.match(clave):
+        return None
+    return clave
+
+
+def resultado_previo(clave, operacion):
+    """
+    Devuelve el resultado (dict) guardado para 'clave' en 'operacion' si ya
+    se procesó dentro del período de vigencia; None si es una clave nueva.
+    Es una sola consulta por índice único (operacion, clave): el reintento
+    no toca nada más.
+    """
+    if not clave:
+        return None
+
+    fila = (
+        SolicitudIdempotente.objects
+        .filter(clave=clave, operacion=operacion, created_at__gte=_limite_vigencia())
+        .values_list("resultado", flat=True)
+        .first()
+    )
+    if fila is None:
+        return None
+    return json.loads(fila) if fila else {}
+
+
+def registrar(clave, operacion, usuario=None):
+    """
+    Reserva la clave dentro de la transacción de quien llama
+    (llamar al inicio del transaction.atomic() del registro).
+
+    Si otra solicitud con la misma clave y operación ya está en curso, el
+    INSERT espera a que esa transacción termine (índice único): si confirmó, se lanza
+    SolicitudDuplicada; si se deshizo, esta solicitud sigue normalmente.
+    Devuelve la fila creada, o None si no hay clave.
+    """
+    if not clave:
+        return None
+
+    # Una clave vencida que todavía no se limpió no debe bloquear la nueva
+    SolicitudIdempotente.objects.filter(
+        clave=clave, operacion=operacion, created_at__lt=_limite_vigencia()
+    ).delete()
+
+    try:
+        with transaction.atomic():
+            return SolicitudIdempotente.objects.create(
+                clave=clave,
+                operacion=operacion,
+                usuario=usuario if usuario is not None and usuario.is_authenticated else None,
+            )
+    except IntegrityError:
+        raise SolicitudDuplicada(clave)
+
+
+def guardar_resultado(solicitud, **resultado):
+    """Guarda el resultado a devolver en los reintentos (misma transacción)."""
+    if solicitud is None:
+        return
+    SolicitudIdempotente.objects.filter(pk=solicitud.pk).update(
+        resultado=json.dumps(resultado, ensure_ascii=False)
+    )
+
+
+def limpiar_vencidas():
+    """Borra las claves más antiguas que IDEMPOTENCIA_HORAS. Devuelve cuántas."""
+    borradas, _ = SolicitudIdempotente.objects.filter(
+        created_at__lt=_limite_vigencia()
+    ).delete()
+    return borradas
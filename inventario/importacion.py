@@ -0,0 +1,275 @@
+# inventario/importacion.py
+
+import csv
+import io
+import os
+import time
+
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Value, When
+
+from .models import Herramienta
+from . import indice_herramientas
+from . import secuencias
+
+# Filas por INSERT (bulk_create) y por UPDATE de stock
+TAMANO_LOTE = 500
+
+# Nombres de columna aceptados en el archivo → campo del modelo
+ALIAS_COLUMNAS = {
+    "codigo": "codigo",
+    "código": "codigo",
+    "codigo_barra": "codigo_barra",
+    "código_barra": "codigo_barra",
+    "codigo de barra": "codigo_barra",
+    "nombre": "nombre",
+    "herramienta": "nombre",
+    "tipo": "tipo",
+    "stock": "stock",
+    "cantidad": "stock",
+}
+
+
+def _normalizar_encabezado(valor):
+    return ALIAS_COLUMNAS.get(str(valor or "").strip().lower())
+
+
+def _leer_csv(archivo):
+    contenido = archivo.read()
+    if isinstance(contenido, bytes):
+        contenido = contenido.decode("utf-8-sig")
+
+    # Las planillas exportadas desde Excel en español suelen venir con ';'
+    try:
+        dialecto = csv.Sniffer().sniff(contenido[:4096], delimiters=",;\t")
+    except csv.Error:
+        dialecto = csv.excel
+
+    reader = csv.reader(io.StringIO(contenido), dialecto)
+    encabezados = [_normalizar_encabezado(h) for h in next(reader, [])]
+    for fila in reader:
+        yield {
+            campo: valor
+            for campo, valor in zip(encabezados, fila)
+            if campo
+        }
+
+
+def _leer_xlsx(archivo):
+    import openpyxl
+
+    wb = openpyxl.load_workbook(archivo, read_only=True, data_only=True)
+    try:
+        filas = wb.active.iter_rows(values_only=True)
+        encabezados = [_normalizar_encabezado(h) for h in next(filas, ())]
+        for fila in filas:
+            yield {
+                campo: valor
+                for campo, valor in zip(encabezados, fila)
+                if campo
+            }
+    finally:
+        wb.close()
+
+
+def leer_archivo(archivo, nombre_archivo):
+    """
+    Devuelve un iterador de dicts {codigo, codigo_barra, nombre, tipo, stock}
+    a partir de un archivo CSV o XLSX (según la extensión del nombre).
+    """
+    extension = os.path.splitext(nombre_archivo or "")[1].lower()
+    if extension in (".xlsx", ".xlsm"):
+        return _leer_xlsx(archivo)
+    if extension in (".csv", ".txt", ""):
+        return _leer_csv(archivo)
+    raise ValueError(f"Formato de archivo no soportado: {extension}")
+
+
+def _limpiar_fila(fila):
+    """Normaliza una fila leída. Devuelve None si no tiene datos útiles."""
+    codigo = str(fila.get("codigo") or "").strip()
+    codigo_barra = str(fila.get("codigo_barra") or "").strip()
+    nombre = str(fila.get("nombre") or "").strip()
+    tipo = str(fila.get("tipo") or "").strip() or "herramienta"
+
+    try:
+        stock = int(float(str(fila.get("stock") or "0").strip().replace(",", ".")))
+    except ValueError:
+        stock = 0
+    if stock < 0:
+        stock = 0
+
+    # Excel guarda los códigos numéricos como float (10001.0)
+    if codigo.endswith(".0") and codigo[:-2].isdigit():
+        codigo = codigo[:-2]
+
+    if not codigo and not codigo_barra and not nombre:
+        return None
+
+    return {
+        "codigo": codigo,
+        "codigo_barra": codigo_barra,
+        "nombre": nombre,
+        "tipo": tipo,
+        "stock": stock,
+    }
+
+
+def _sumar_stock_en_lote(sumas):
+    """
+    Suma stock a herramientas existentes con UN solo UPDATE por lote:
+        UPDATE herramientas
+           SET stock = stock + CASE codigo WHEN ... END,
+               stock_disponible = stock_disponible + CASE codigo WHEN ... END
+         WHERE codigo IN (...)
+    """
+    codigos = list(sumas)
+    for i in range(0, len(codigos), TAMANO_LOTE):
+        lote = codigos[i:i + TAMANO_LOTE]
+        incremento = Case(
+            *[When(codigo=c, then=Value(sumas[c])) for c in lote],
+            default=Value(0),
+            output_field=IntegerField(),
+        )
+        Herramienta.objects.filter(codigo__in=lote).update(
+            stock=F("stock") + incremento,
+            stock_disponible=F("stock_disponible") + incremento,
+        )
+
+
+def importar_herramientas(filas):
+    """
+    Carga masiva del catálogo de herramientas.
+
+    - Filas cuyo 'codigo' o 'codigo_barra' ya existe → se SUMA su stock
+      a la herramienta existente (igual que "Sumar stock"; las llaves se omiten).
+    - Filas nuevas → se crean con bulk_create; si no traen código se les
+      asigna uno desde un bloque reservado de la secuencia 'herramientas'.
+
+    Devuelve un resumen:
+        {leidas, creadas, actualizadas, omitidas, errores, segundos}
+    """
+    inicio = time.monotonic()
+
+    resumen = {
+        "leidas": 0,
+        "creadas": 0,
+        "actualizadas": 0,
+        "omitidas": 0,
+        "errores": [],
+        "segundos": 0.0,
+    }
+
+    limpias = []
+    for num_linea, fila in enumerate(filas, start=2):  # línea 1 = encabezados
+        resumen["leidas"] += 1
+        limpia = _limpiar_fila(fila)
+        if limpia is None:
+            resumen["omitidas"] += 1
+            continue
+        limpia["linea"] = num_linea
+        limpias.append(limpia)
+
+    # ---- Herramientas ya existentes (una consulta por lote de claves) ----
+    #   Se reconocen por código, por código de barra o, si la fila no trae
+    #   ningún código, por nombre.
+    codigos = {f["codigo"] for f in limpias if f["codigo"]}
+    barras = {f["codigo_barra"] for f in limpias if f["codigo_barra"]}
+    nombres = {
+        f["nombre"] for f in limpias
+        if f["nombre"] and not f["codigo"] and not f["codigo_barra"]
+    }
+
+    existentes_por_codigo = {}
+    existentes_por_barra = {}
+    existentes_por_nombre = {}
+    for grupo, campo in ((codigos, "codigo"), (barras, "codigo_barra"), (nombres, "nombre")):
+        grupo = list(grupo)
+        for i in range(0, len(grupo), TAMANO_LOTE):
+            filtro = {f"{campo}__in": grupo[i:i + TAMANO_LOTE]}
+            for h in Herramienta.objects.filter(**filtro).values("codigo", "codigo_barra", "nombre", "tipo"):
+                existentes_por_codigo[h["codigo"]] = h
+                if h["codigo_barra"]:
+                    existentes_por_barra[h["codigo_barra"]] = h
+                if h["nombre"]:
+                    existentes_por_nombre[h["nombre"].strip().lower()] = h
+
+    sumas = {}         # {codigo_existente: stock a sumar}
+    nuevas = {}        # {clave: fila} (clave = código o nombre, para unir duplicados)
+    for f in limpias:
+        if f["codigo"] or f["codigo_barra"]:
+            existente = (
+                existentes_por_codigo.get(f["codigo"])
+                or existentes_por_barra.get(f["codigo_barra"])
+            )
+        else:
+            existente = existentes_por_nombre.get(f["nombre"].lower())
+
+        if existente is not None:
+            tipo_h = (existente["tipo"] or "").strip().lower()
+            if tipo_h.startswith("llave"):
+                resumen["omitidas"] += 1
+                resumen["errores"].append(
+                    f"Línea {f['linea']}: no se suma stock a llaves ({existente['codigo']})."
+                )
+                continue
+            if f["stock"] > 0:
+                sumas[existente["codigo"]] = sumas.get(existente["codigo"], 0) + f["stock"]
+            continue
+
+        if not f["nombre"]:
+            resumen["omitidas"] += 1
+            resumen["errores"].append(
+                f"Línea {f['linea']}: herramienta nueva sin nombre."
+            )
+            continue
+
+        clave = f["codigo"] or f["codigo_barra"] or f["nombre"].lower()
+        if clave in nuevas:
+            # Misma herramienta repetida en el archivo: acumulamos stock
+            nuevas[clave]["stock"] += f["stock"]
+        else:
+            nuevas[clave] = f
+
+    # ---- Reservar un bloque de códigos para las nuevas sin código ----
+    sin_codigo = [f for f in nuevas.values() if not f["codigo"]]
+    mayor_propio = max(
+        (int(f["codigo"]) for f in nuevas.values() if f["codigo"].isdigit()),
+        default=None,
+    )
+    # Antes de reservar, la secuencia pasa los códigos numéricos del propio
+    # archivo y los cargados a mano: el bloque no puede chocar con ellos
+    if sin_codigo or mayor_propio is not None:
+        secuencias.sincronizar_secuencia("herramientas", minimo=mayor_propio)
+
+    if sin_codigo:
+        ocupados = {f["codigo"] for f in nuevas.values() if f["codigo"]}
+        libres = []
+        while len(libres) < len(sin_codigo):
+            bloque = secuencias.reservar_bloque("herramientas", len(sin_codigo) - len(libres))
+            libres.extend(str(valor) for valor in bloque if str(valor) not in ocupados)
+        for f, codigo in zip(sin_codigo, libres):
+            f["codigo"] = codigo
+
+    a_crear = []
+    for f in nuevas.values():
+        a_crear.append(Herramienta(
+            codigo=f["codigo"],
+            codigo_barra=f["codigo_barra"] or f"*{f['codigo']}*",
+            nombre=f["nombre"],
+            tipo=f["tipo"],
+            stock=f["stock"],
+            stock_disponible=f["stock"],
+        ))
+
+    with transaction.atomic():
+        Herramienta.objects.bulk_create(a_crear, batch_size=TAMANO_LOTE)
+        _sumar_stock_en_lote(sumas)
+
+        # bulk_create/update no pasan por save(): invalidamos el índice del escáner
+        transaction.on_commit(indice_herramientas.invalidar_indice)
+
+    resumen["creadas"] = len(a_crear)
+    resumen["actualizadas"] = len(sumas)
+    resumen["segundos"] = round(time.monotonic() - inicio, 3)
+    return resumen
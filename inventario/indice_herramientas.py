@@ -0,0 +1,310 @@
+# inventario/indice_herramientas.py
+
+import threading
+import time
+
+from django.db import transaction
+from django.db.models import Q
+
+from .models import Herramienta, CambioHerramienta
+from . import versiones
+
+# Índice en memoria (uno por proceso):
+#   INDICE_POR_CODIGO = { codigo: {codigo, codigo_barra, nombre, stock_disponible, stock, tipo} }
+#   INDICE_POR_BARRA  = { codigo_barra: codigo }
+INDICE_POR_CODIGO = {}
+INDICE_POR_BARRA = {}
+
+CLAVE_VERSION = "herramientas"
+
+# Cada cuántos segundos, como máximo, se consulta la versión en la BD
+# para detectar cambios hechos por otros procesos (workers).
+SEGUNDOS_ENTRE_VERIFICACIONES = 2.0
+
+CAMPOS_INDICE = ("codigo", "codigo_barra", "nombre", "stock_disponible", "stock", "tipo")
+
+# Versiones que se conservan en 'cambios_herramientas' para los deltas
+# del catálogo; quien tenga una versión más antigua recibe el catálogo completo.
+VERSIONES_RETENIDAS = 5000
+
+_lock = threading.Lock()
+_version_local = None
+_ultima_verificacion = 0.0
+
+
+def _indexar(fila):
+    """Agrega/actualiza una fila en ambos diccionarios (llamar con _lock tomado)."""
+    codigo = fila["codigo"]
+
+    anterior = INDICE_POR_CODIGO.get(codigo)
+    if anterior and anterior["codigo_barra"] and anterior["codigo_barra"] != fila["codigo_barra"]:
+        INDICE_POR_BARRA.pop(anterior["codigo_barra"], None)
+
+    INDICE_POR_CODIGO[codigo] = fila
+    if fila["codigo_barra"]:
+        INDICE_POR_BARRA[fila["codigo_barra"]] = codigo
+
+
+def reconstruir_indice():
+    """
+    Reconstruye el índice completo desde la tabla 'herramientas'
+    (un solo SELECT) y lo deja asociado a la versión actual de la BD.
+    """
+    global INDICE_POR_CODIGO, INDICE_POR_BARRA, _version_local, _ultima_verificacion
+
+    # Leemos la versión ANTES de los datos: si alguien escribe entremedio,
+    # la próxima verificación verá una versión mayor y volverá a reconstruir.
+    version = versiones.obtener_version(CLAVE_VERSION)
+
+    por_codigo = {}
+    por_barra = {}
+    for fila in Herramienta.objects.values(*CAMPOS_INDICE).iterator():
+        por_codigo[fila["codigo"]] = fila
+        if fila["codigo_barra"]:
+            por_barra[fila["codigo_barra"]] = fila["codigo"]
+
+    with _lock:
+        # Se reemplazan las referencias completas: los lectores nunca ven
+        # un índice a medio construir.
+        INDICE_POR_CODIGO = por_codigo
+        INDICE_POR_BARRA = por_barra
+        _version_local = version
+        _ultima_verificacion = time.monotonic()
+
+
+def _aplicar_cambios(desde, hasta):
+    """
+    Pone el índice en la versión 'hasta' releyendo solo las herramientas
+    registradas en 'cambios_herramientas' con versión en (desde, hasta]
+    (como catalogo.delta). Devuelve False si el registro no alcanza (ya se
+    podó, falta alguna versión o hubo una invalidación masiva): en ese caso
+    hay que reconstruir el índice completo.
+    """
+    global _version_local, _ultima_verificacion
+
+    cambios = list(
+        CambioHerramienta.objects
+        .filter(version__gt=desde, version__lte=hasta)
+        .values_list("version", "codigo")
+    )
+    codigos = {codigo for _, codigo in cambios}
+    if None in codigos or len({version for version, _ in cambios}) != hasta - desde:
+        return False
+
+    filas = list(
+        Herramienta.objects
+        .filter(codigo__in=codigos)
+        .values(*CAMPOS_INDICE)
+    )
+
+    with _lock:
+        if _version_local != desde:
+            # Otro hilo ya lo movió: que la próxima verificación decida
+            return True
+
+        encontrados = set()
+        for fila in filas:
+            _indexar(fila)
+            encontrados.add(fila["codigo"])
+
+        # Herramientas eliminadas
+        for codigo in codigos - encontrados:
+            anterior = INDICE_POR_CODIGO.pop(codigo, None)
+            if anterior and anterior["codigo_barra"]:
+                INDICE_POR_BARRA.pop(anterior["codigo_barra"], None)
+
+        _version_local = hasta
+        _ultima_verificacion = time.monotonic()
+    return True
+
+
+def _asegurar_vigente():
+    """
+    Pone al día el índice si otro proceso cambió la versión en la BD: solo
+    las herramientas cambiadas (cada préstamo sube la versión) y, si el
+    registro de cambios no alcanza, el índice completo.
+    """
+    global _ultima_verificacion
+
+    ahora = time.monotonic()
+    if _version_local is not None and ahora - _ultima_verificacion < SEGUNDOS_ENTRE_VERIFICACIONES:
+        return
+
+    version_local = _version_local
+    version_bd = versiones.obtener_version(CLAVE_VERSION)
+    if version_local is None or version_bd < version_local:
+        reconstruir_indice()
+    elif version_bd != version_local:
+        if not _aplicar_cambios(version_local, version_bd):
+            reconstruir_indice()
+    else:
+        _ultima_verificacion = ahora
+
+
+def buscar_herramienta(codigo):
+    """
+    Busca una herramienta por 'codigo' o por 'codigo_barra'.
+    Devuelve un dict con los campos de CAMPOS_INDICE, o None si no existe.
+
+    Si el código no está en el índice se consulta la BD una vez
+    (por si la herramienta se creó hace menos de SEGUNDOS_ENTRE_VERIFICACIONES).
+    """
+    codigo = (codigo or "").strip()
+    if not codigo:
+        return None
+
+    _asegurar_vigente()
+
+    fila = INDICE_POR_CODIGO.get(codigo)
+    if fila is None:
+        codigo_real = INDICE_POR_BARRA.get(codigo)
+        if codigo_real is not None:
+            fila = INDICE_POR_CODIGO.get(codigo_real)
+
+    if fila is not None:
+        return fila
+
+    fila = (
+        Herramienta.objects
+        .filter(codigo=codigo)
+        .values(*CAMPOS_INDICE)
+        .first()
+    )
+    if fila is None:
+        fila = (
+            Herramienta.objects
+            .filter(codigo_barra=codigo)
+            .values(*CAMPOS_INDICE)
+            .first()
+        )
+    if fila is not None:
+        with _lock:
+            _indexar(fila)
+    return fila
+
+
+def resolver_codigos(codigos):
+    """
+    Resuelve varios códigos / códigos de barra contra la BD con UNA sola
+    consulta (codigo IN (...) OR codigo_barra IN (...)).
+
+    Devuelve { código_escaneado: Herramienta } solo con los encontrados.
+    Igual que la búsqueda individual, 'codigo' tiene prioridad sobre 'codigo_barra'.
+    """
+    codigos = {c for c in codigos if c}
+    if not codigos:
+        return {}
+
+    por_codigo = {}
+    por_barra = {}
+    for h in Herramienta.objects.filter(Q(codigo__in=codigos) | Q(codigo_barra__in=codigos)):
+        por_codigo[h.codigo] = h
+        if h.codigo_barra:
+            por_barra[h.codigo_barra] = h
+
+    resueltos = {}
+    for c in codigos:
+        h = por_codigo.get(c) or por_barra.get(c)
+        if h is not None:
+            resueltos[c] = h
+    return resueltos
+
+
+def _incrementar_y_registrar(codigos):
+    """
+    Incrementa la versión de 'herramientas' y deja en 'cambios_herramientas'
+    qué códigos cambiaron en ella (None = todas). Devuelve la nueva versión.
+    """
+    with transaction.atomic():
+        nueva_version = versiones.incrementar_version(CLAVE_VERSION)
+        CambioHerramienta.objects.bulk_create([
+            CambioHerramienta(version=nueva_version, codigo=c) for c in codigos
+        ])
+
+    # Poda ocasional del registro (1 de cada 500 versiones)
+    if nueva_version % 500 == 0:
+        CambioHerramienta.objects.filter(
+            version__lte=nueva_version - VERSIONES_RETENIDAS
+        ).delete()
+
+    return nueva_version
+
+
+def instantanea():
+    """
+    (version, filas) del índice vigente, sin consultar la tabla completa.
+    Las filas pueden incluir cambios posteriores a 'version' (nunca anteriores
+    faltantes), así un delta pedido desde esa versión siempre queda completo.
+    """
+    _asegurar_vigente()
+    with _lock:
+        version = _version_local
+        filas = list(INDICE_POR_CODIGO.values())
+    if version is None:
+        # Otro hilo invalidó justo ahora: reconstruimos y usamos ese resultado
+        reconstruir_indice()
+        with _lock:
+            version = _version_local
+            filas = list(INDICE_POR_CODIGO.values())
+    return version, filas
+
+
+def refrescar_herramientas(codigos):
+    """
+    Relee desde la BD las herramientas indicadas, actualiza el índice local
+    e incrementa la versión para que los demás procesos relean esos códigos.
+    """
+    global _version_local
+
+    codigos = {c for c in codigos if c}
+    if not codigos:
+        return
+
+    filas = list(
+        Herramienta.objects
+        .filter(codigo__in=codigos)
+        .values(*CAMPOS_INDICE)
+    )
+
+    with _lock:
+        encontrados = set()
+        for fila in filas:
+            _indexar(fila)
+            encontrados.add(fila["codigo"])
+
+        # Herramientas eliminadas
+        for codigo in codigos - encontrados:
+            anterior = INDICE_POR_CODIGO.pop(codigo, None)
+            if anterior and anterior["codigo_barra"]:
+                INDICE_POR_BARRA.pop(anterior["codigo_barra"], None)
+
+    version_anterior = _version_local
+    nueva_version = _incrementar_y_registrar(codigos)
+
+    # Si nadie más escribió entremedio, nuestro índice ya refleja la nueva
+    # versión; si no, dejamos la local desfasada y se reconstruirá.
+    if version_anterior is not None and nueva_version == version_anterior + 1:
+        _version_local = nueva_version
+
+
+def invalidar_indice():
+    """
+    Invalida el índice completo (en este proceso y en los demás).
+    Útil tras cargas masivas (bulk_create / update) que no pasan por save().
+    """
+    global _version_local
+
+    _incrementar_y_registrar([None])
+    with _lock:
+        _version_local = None
+
+
+def notificar_cambio(codigos):
+    """
+    Registra que las herramientas 'codigos' cambiaron.
+    El refresco se hace al confirmar la transacción (on_commit), así un
+    rollback no deja datos falsos en el índice y no se bloquea la fila de
+    versión mientras la transacción está abierta.
+    """
+    codigos = list(codigos)
+    transaction.on_commit(lambda: refrescar_herramientas(codigos))
@@ -0,0 +1,300 @@
+# inventario/kpis.py
+
+import heapq
+from datetime import datetime
+
+from django.db.models import Q, Sum, Count
+from django.db.models.functions import Coalesce
+
+from .models import Prestamo, PrestamoDetalle, ResumenPrestamosDia, ResumenDetalleDia
+from . import periodos
+from . import resumenes
+
+# Motor de KPIs compartido por panel_kpis, exportar_panel_kpis e
+# informe_prestamos. Los filtros se definen una sola vez (como Q) y se
+# aplican tanto a 'prestamos' como a 'prestamos_detalle' (vía JOIN con
+# el prefijo "prestamo__"), así los tres informes cuentan lo mismo.
+#
+# Consultas por cálculo, sin importar el volumen de datos:
+#   1 SELECT con agregación condicional   → KPIs escalares
+#   1 SELECT agrupado sobre prestamos     → tops de docentes/carreras/asignaturas/pañoleros
+#   1 SELECT agrupado sobre el detalle    → total entregado y tops de herramientas
+#
+# Si los filtros lo permiten (sin estado ni búsqueda por texto) y los
+# resúmenes diarios (inventario/resumenes.py) ya se construyeron, esas
+# consultas se hacen sobre ellos en vez de 'prestamos' / 'prestamo_detalle',
+# así el costo depende de los días del rango y no de cuántos préstamos hay
+# en la historia. Los resúmenes los refresca el cron, no estas consultas.
+
+TOP_N = 5
+
+# Filtros que entiende cada pantalla (el resto de parámetros GET se ignora)
+FILTROS_PANEL = ("semestre", "carrera", "asignatura", "fecha_desde", "fecha_hasta")
+FILTROS_INFORME = ("fecha_desde", "fecha_hasta", "estado", "q")
+
+FORMATOS_FECHA = ("%Y-%m-%d", "%d-%m-%Y")
+
+
+def leer_filtros(params, nombres):
+    """Filtros 'nombres' de un request.GET (o dict) como {nombre: texto}, sin espacios."""
+    return {nombre: (params.get(nombre) or "").strip() for nombre in nombres}
+
+
+def parsear_fecha(texto):
+    """'2025-03-01' o '01-03-2025' → date; None si no se puede leer."""
+    for fmt in FORMATOS_FECHA:
+        try:
+            return datetime.strptime(texto, fmt).date()
+        except (TypeError, ValueError):
+            continue
+    return None
+
+
+def _filtro_fechas(filtros, p):
+    """Q de semestre y rango de fechas sobre el campo '<p>fecha'."""
+    condicion = Q()
+
+    # El semestre se resuelve con el calendario académico (periodos.py) a
+    # un rango de fechas: 'fecha BETWEEN inicio AND fin' usa el índice.
+    rango = periodos.rango(filtros.get("semestre"))
+    if rango is not None:
+        condicion &= Q(**{f"{p}fecha__range": rango})
+
+    fecha_desde = parsear_fecha(filtros.get("fecha_desde"))
+    if fecha_desde:
+        condicion &= Q(**{f"{p}fecha__gte": fecha_desde})
+
+    fecha_hasta = parsear_fecha(filtros.get("fecha_hasta"))
+    if fecha_hasta:
+        condicion &= Q(**{f"{p}fecha__lte": fecha_hasta})
+
+    return condicion
+
+
+def filtro_prestamos(filtros, prefijo=""):
+    """
+    Q con los filtros aplicados a Prestamo. Con prefijo="prestamo__" sirve
+    para filtrar PrestamoDetalle por JOIN en vez de 'prestamo__in=...'.
+    Los filtros vacíos o mal escritos se ignoran (igual que antes en las vistas).
+    """
+    p = prefijo
+    condicion = _filtro_fechas(filtros, p)
+
+    if filtros.get("carrera"):
+        condicion &= Q(**{f"{p}estudiante__carrera": filtros["carrera"]})
+
+    if filtros.get("asignatura"):
+        condicion &= Q(**{f"{p}asignatura__nombre": filtros["asignatura"]})
+
+    if filtros.get("estado"):
+        condicion &= Q(**{f"{p}estado__iexact": filtros["estado"]})
+
+    # Búsqueda por texto (docente/estudiante/carrera/asignatura/pañolero)
+    texto = filtros.get("q")
+    if texto:
+        condicion &= (
+            Q(**{f"{p}docente__nombre__icontains": texto})
+            | Q(**{f"{p}estudiante__nombre__icontains": texto})
+            | Q(**{f"{p}estudiante__carrera__icontains": texto})
+            | Q(**{f"{p}asignatura__nombre__icontains": texto})
+            | Q(**{f"{p}panolero__nombre__icontains": texto})
+        )
+
+    return condicion
+
+
+def usa_resumenes(filtros):
+    """
+    Los resúmenes diarios no guardan estado ni nombres para buscar texto,
+    y antes de la primera carga (refrescar_resumenes --todo) están vacíos.
+    """
+    return not filtros.get("estado") and not filtros.get("q") and resumenes.listos()
+
+
+def filtro_resumenes(filtros):
+    """Q con los filtros aplicados a ResumenPrestamosDia / ResumenDetalleDia."""
+    condicion = _filtro_fechas(filtros, "")
+
+    if filtros.get("carrera"):
+        condicion &= Q(carrera=filtros["carrera"])
+
+    if filtros.get("asignatura"):
+        condicion &= Q(asignatura__nombre=filtros["asignatura"])
+
+    return condicion
+
+
+def prestamos_filtrados(filtros):
+    """Préstamos filtrados, con sus relaciones (para tablas y exportaciones)."""
+    return Prestamo.objects.select_related(
+        "docente", "estudiante", "asignatura", "panolero"
+    ).filter(filtro_prestamos(filtros))
+
+
+def resumen(filtros):
+    """
+    KPIs escalares en una sola consulta (COUNT ... FILTER / COUNT DISTINCT):
+    totales por tipo de solicitante y cantidad de docentes, estudiantes,
+    asignaturas y pañoleros distintos.
+    """
+    if usa_resumenes(filtros):
+        return _resumen_desde_resumenes(filtros)
+
+    r = Prestamo.objects.filter(filtro_prestamos(filtros)).aggregate(
+        total_prestamos=Count("id"),
+        total_prest_docente=Count("id", filter=Q(docente__isnull=False)),
+        total_prest_estudiante=Count("id", filter=Q(estudiante__isnull=False)),
+        total_docentes=Count("docente", distinct=True),
+        total_estudiantes=Count("estudiante", distinct=True),
+        total_asignaturas=Count("asignatura", distinct=True),
+        total_panoleros=Count("panolero", distinct=True),
+    )
+    r["total_prest_otros"] = (
+        r["total_prestamos"] - r["total_prest_docente"] - r["total_prest_estudiante"]
+    )
+    return r
+
+
+def _resumen_desde_resumenes(filtros):
+    r = ResumenPrestamosDia.objects.filter(filtro_resumenes(filtros)).aggregate(
+        total_prestamos=Coalesce(Sum("num_prestamos"), 0),
+        total_prest_docente=Coalesce(
+            Sum("num_prestamos", filter=Q(tipo_solicitante="docente")), 0
+        ),
+        total_prest_estudiante=Coalesce(
+            Sum("num_prestamos", filter=Q(tipo_solicitante="estudiante")), 0
+        ),
+        total_docentes=Count("docente", distinct=True),
+        total_asignaturas=Count("asignatura", distinct=True),
+        total_panoleros=Count("panolero", distinct=True),
+    )
+    r["total_prest_otros"] = (
+        r["total_prestamos"] - r["total_prest_docente"] - r["total_prest_estudiante"]
+    )
+
+    # Los estudiantes no están en el resumen (no se pueden sumar distintos
+    # entre días): un COUNT DISTINCT sobre prestamos acotado por las fechas.
+    r["total_estudiantes"] = (
+        Prestamo.objects
+        .filter(filtro_prestamos(filtros))
+        .aggregate(n=Count("estudiante", distinct=True))["n"]
+    )
+    return r
+
+
+def _top(acumulado, campos, orden, n):
+    """{(valores de campos): {metricas}} → las n filas con mayor 'orden'."""
+    filas = [dict(zip(campos, clave), **metricas) for clave, metricas in acumulado.items()]
+    return heapq.nlargest(n, filas, key=lambda f: f[orden])
+
+
+def rankings_prestamos(filtros, n=TOP_N):
+    """
+    Tops por cantidad de préstamos ('total_prestamos') a partir de una sola
+    consulta agrupada por docente, carrera, asignatura y pañolero a la vez.
+    """
+    if usa_resumenes(filtros):
+        grupos = (
+            ResumenPrestamosDia.objects
+            .filter(filtro_resumenes(filtros))
+            .values(
+                "docente__codigo", "docente__nombre",
+                "carrera",
+                "asignatura__id", "asignatura__nombre",
+                "panolero__id", "panolero__nombre",
+            )
+            .annotate(n=Sum("num_prestamos"))
+            .order_by()
+        )
+    else:
+        grupos = (
+            Prestamo.objects
+            .filter(filtro_prestamos(filtros))
+            .values(
+                "docente__codigo", "docente__nombre",
+                "estudiante__carrera",
+                "asignatura__id", "asignatura__nombre",
+                "panolero__id", "panolero__nombre",
+            )
+            .annotate(n=Count("id"))
+            .order_by()
+        )
+
+    dimensiones = {
+        "top_docentes": ("docente__codigo", "docente__nombre"),
+        "top_carreras": ("estudiante__carrera",),
+        "top_asignaturas": ("asignatura__id", "asignatura__nombre"),
+        "top_panoleros": ("panolero__id", "panolero__nombre"),
+    }
+    acumulados = {nombre: {} for nombre in dimensiones}
+
+    for g in grupos:
+        if "carrera" in g:
+            g["estudiante__carrera"] = g.pop("carrera")
+        for nombre, campos in dimensiones.items():
+            clave = tuple(g[c] for c in campos)
+            if clave[0] is None:
+                continue
+            fila = acumulados[nombre].setdefault(clave, {"total_prestamos": 0})
+            fila["total_prestamos"] += g["n"]
+
+    return {
+        nombre: _top(acumulados[nombre], campos, "total_prestamos", n)
+        for nombre, campos in dimensiones.items()
+    }
+
+
+def rankings_detalle(filtros, n=TOP_N):
+    """
+    Total de herramientas entregadas y tops de herramientas a partir de una
+    sola pasada agrupada por herramienta sobre el detalle (JOIN a prestamos):
+
+      - top_herramientas / _fijas / _consumibles → por cantidad ('total_cant')
+      - top_llaves / top_autos                   → por préstamos ('total_prestamos')
+    """
+    if usa_resumenes(filtros):
+        por_herramienta = (
+            ResumenDetalleDia.objects
+            .filter(filtro_resumenes(filtros))
+            .values("herramienta__codigo", "herramienta__nombre", "herramienta__tipo")
+            .annotate(
+                total_cant=Coalesce(Sum("cantidad_entregada"), 0),
+                total_prestamos=Coalesce(Sum("num_prestamos"), 0),
+            )
+            .order_by()
+        )
+    else:
+        por_herramienta = (
+            PrestamoDetalle.objects
+            .filter(filtro_prestamos(filtros, prefijo="prestamo__"))
+            .values("herramienta__codigo", "herramienta__nombre", "herramienta__tipo")
+            .annotate(
+                total_cant=Coalesce(Sum("cantidad_entregada"), 0),
+                total_prestamos=Count("prestamo", distinct=True),
+            )
+            .order_by()
+        )
+    filas = list(por_herramienta)
+
+    def con_tipo(fragmento):
+        return [f for f in filas if fragmento in (f["herramienta__tipo"] or "").lower()]
+
+    def top(lista, orden):
+        return heapq.nlargest(n, lista, key=lambda f: f[orden])
+
+    return {
+        "total_herramientas": sum(f["total_cant"] for f in filas),
+        "top_herramientas": top(filas, "total_cant"),
+        "top_herramientas_fijas": top(con_tipo("fijo"), "total_cant"),
+        "top_herramientas_consumibles": top(con_tipo("consumible"), "total_cant"),
+        "top_llaves": top(con_tipo("llave"), "total_prestamos"),
+        "top_autos": top(con_tipo("llave_auto"), "total_prestamos"),
+    }
+
+
+def calcular(filtros, n=TOP_N):
+    """Todos los KPIs y rankings de los préstamos filtrados."""
+    datos = resumen(filtros)
+    datos.update(rankings_prestamos(filtros, n))
+    datos.update(rankings_detalle(filtros, n))
+    return datos
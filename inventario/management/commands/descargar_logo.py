@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from inventario.marca import descargar_logo, LOGO_URL
+
+
+class Command(BaseCommand):
+    help = (
+        "Descarga una vez el logo de los PDF (settings.LOGO_URL) al caché en "
+        "disco. Alternativa sin red: copiar el archivo a static/img/logo.png."
+    )
+
+    def handle(self, *args, **options):
+        if not descargar_logo():
+            raise CommandError(f"No se pudo descargar el logo desde {LOGO_URL}")
+        self.stdout.write(self.style.SUCCESS("Logo guardado en el caché local."))
@@ -0,0 +1,32 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from inventario import recomendador
+
+
+class Command(BaseCommand):
+    help = (
+        "Entrena el modelo de recomendación de herramientas (histórico de "
+        "preparaciones y préstamos + pesos de los CSV) y lo guarda en disco "
+        "(settings.RECOMENDADOR_MODELO_PATH). Los procesos lo cargan al iniciar."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--ruta", help="Archivo de salida (por defecto RECOMENDADOR_MODELO_PATH)")
+
+    def handle(self, *args, **options):
+        inicio = time.monotonic()
+        try:
+            recomendador.entrenar_modelo()
+        except recomendador.ModeloNoDisponible as e:
+            raise CommandError(f"{e} (detalle en el log).")
+        ruta = recomendador.guardar_modelo(options["ruta"])
+        segundos = time.monotonic() - inicio
+
+        modelo = recomendador.MODELO
+        self.stdout.write(self.style.SUCCESS(
+            f"Modelo guardado en {ruta}: {modelo.asignaturas_con_historial()} asignaturas con "
+            f"historial, {len(modelo.herramientas)} herramientas, {modelo.scores.nnz} pares con "
+            f"score ({segundos:.1f} s)."
+        ))
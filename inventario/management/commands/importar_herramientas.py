@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from inventario.importacion import importar_herramientas, leer_archivo
+
+
+class Command(BaseCommand):
+    help = (
+        "Importa el catálogo de herramientas desde un CSV o XLSX. "
+        "Columnas: codigo (opcional), codigo_barra (opcional), nombre, tipo, stock."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("archivo", help="Ruta al archivo .csv o .xlsx")
+
+    def handle(self, *args, **options):
+        ruta = options["archivo"]
+
+        try:
+            with open(ruta, "rb") as f:
+                resumen = importar_herramientas(leer_archivo(f, ruta))
+        except FileNotFoundError:
+            raise CommandError(f"No existe el archivo: {ruta}")
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        for err in resumen["errores"]:
+            self.stderr.write(f"  - {err}")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Importación terminada en {resumen['segundos']} s: "
+            f"{resumen['leidas']} filas leídas, "
+            f"{resumen['creadas']} herramientas creadas, "
+            f"{resumen['actualizadas']} con stock sumado, "
+            f"{resumen['omitidas']} omitidas."
+        ))
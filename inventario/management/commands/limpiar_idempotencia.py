@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from inventario.idempotencia import limpiar_vencidas
+
+
+class Command(BaseCommand):
+    help = (
+        "Borra las claves de idempotencia más antiguas que "
+        "settings.IDEMPOTENCIA_HORAS (programar con cron, ej. una vez al día)."
+    )
+
+    def handle(self, *args, **options):
+        borradas = limpiar_vencidas()
+        self.stdout.write(self.style.SUCCESS(
+            f"Claves de idempotencia vencidas borradas: {borradas}"
+        ))
@@ -0,0 +1,46 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from inventario import reportes
+
+
+class Command(BaseCommand):
+    help = (
+        "Worker de la cola de reportes: genera los Excel/PDF pedidos desde el "
+        "panel de KPIs. Sin opciones queda escuchando; con --una-vez procesa "
+        "los pendientes y termina (para cron)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--una-vez", action="store_true",
+                            help="Procesar los pendientes actuales y salir")
+        parser.add_argument("--intervalo", type=float, default=2.0,
+                            help="Segundos de espera cuando no hay trabajos (por defecto 2)")
+
+    def handle(self, *args, **options):
+        recuperados = reportes.recuperar_colgados()
+        if recuperados:
+            self.stdout.write(f"Trabajos colgados devueltos a la cola: {recuperados}")
+
+        procesados = 0
+        while True:
+            trabajo = reportes.tomar_siguiente()
+            if trabajo is None:
+                if options["una_vez"]:
+                    break
+                reportes.limpiar_vencidos()
+                time.sleep(options["intervalo"])
+                continue
+
+            ok = reportes.procesar(trabajo)
+            procesados += 1
+            if ok:
+                self.stdout.write(self.style.SUCCESS(f"Listo: {trabajo}"))
+            else:
+                self.stderr.write(f"Error al generar {trabajo}")
+
+        borrados = reportes.limpiar_vencidos()
+        self.stdout.write(self.style.SUCCESS(
+            f"Reportes generados: {procesados}. Vencidos borrados: {borrados}."
+        ))
@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from inventario.kpis import parsear_fecha
+from inventario.resumenes import refrescar_pendientes, reconstruir
+
+
+class Command(BaseCommand):
+    help = (
+        "Recalcula los resúmenes diarios de KPIs de los días con préstamos "
+        "nuevos o modificados (programar con cron, ej. cada minuto: el panel "
+        "no los recalcula). Con --todo (o --desde/--hasta) reconstruye el "
+        "rango completo; hasta el primer --todo los KPIs se calculan sin resúmenes."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--todo", action="store_true",
+                            help="Reconstruir todos los días (primera carga)")
+        parser.add_argument("--desde", help="Fecha inicial YYYY-MM-DD")
+        parser.add_argument("--hasta", help="Fecha final YYYY-MM-DD")
+
+    def handle(self, *args, **options):
+        rango = {}
+        for nombre in ("desde", "hasta"):
+            if options[nombre]:
+                rango[nombre] = parsear_fecha(options[nombre])
+                if rango[nombre] is None:
+                    raise CommandError(f"Fecha inválida en --{nombre}: {options[nombre]}")
+
+        if options["todo"] or rango:
+            dias = reconstruir(**rango)
+        else:
+            dias = refrescar_pendientes()
+
+        self.stdout.write(self.style.SUCCESS(f"Días de resumen recalculados: {dias}"))
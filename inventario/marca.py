@@ -0,0 +1,113 @@
+# inventario/marca.py
+
+import os
+import threading
+import urllib.request
+
+from django.conf import settings
+from django.contrib.staticfiles import finders
+
+# Logo institucional para los PDF, sin depender de la red al exportar.
+# Se busca en este orden:
+#   1. Memoria del proceso (ImageReader ya decodificado).
+#   2. Archivo estático 'img/logo.png' (static/img/logo.png).
+#   3. Copia descargada antes en disco (settings.MARCA_CACHE_DIR).
+# Si no hay ninguno, el PDF sale sin logo y se lanza UNA descarga en
+# segundo plano (con timeout) para que los siguientes PDF sí lo tengan.
+LOGO_URL = getattr(
+    settings,
+    "LOGO_URL",
+    "https://afeva.cl/wp-content/uploads/"
+    "bfi_thumb/logo-02-3de0hedts90kzsj5so5p6cawzz6fhdkja52f67wjd5s94pl8w.png",
+)
+LOGO_ESTATICO = "img/logo.png"
+SEGUNDOS_TIMEOUT = 5
+
+_lock = threading.Lock()
+_logo = None
+_descargando = False
+
+
+def _ruta_cache():
+    directorio = getattr(settings, "MARCA_CACHE_DIR", settings.BASE_DIR / "cache_marca")
+    return os.path.join(directorio, "logo.png")
+
+
+def _ruta_local():
+    """Ruta del logo en disco (estático o descargado); None si no hay."""
+    estatico = finders.find(LOGO_ESTATICO)
+    if estatico:
+        return estatico
+    cache = _ruta_cache()
+    if os.path.exists(cache):
+        return cache
+    return None
+
+
+def descargar_logo():
+    """
+    Descarga LOGO_URL al caché en disco (escritura atómica con os.replace).
+    Devuelve True si quedó guardado. Nunca se llama desde el PDF directamente.
+    """
+    destino = _ruta_cache()
+    temporal = destino + ".tmp"
+    try:
+        os.makedirs(os.path.dirname(destino), exist_ok=True)
+        with urllib.request.urlopen(LOGO_URL, timeout=SEGUNDOS_TIMEOUT) as r:
+            contenido = r.read()
+        with open(temporal, "wb") as f:
+            f.write(contenido)
+        os.replace(temporal, destino)
+        return True
+    except Exception as e:
+        print("No se pudo descargar el logo:", e)
+        if os.path.exists(temporal):
+            os.remove(temporal)
+        return False
+
+
+def _descargar_en_segundo_plano():
+    global _descargando
+
+    def tarea():
+        global _descargando
+        try:
+            descargar_logo()
+        finally:
+            with _lock:
+                _descargando = False
+
+    with _lock:
+        if _descargando:
+            return
+        _descargando = True
+    threading.Thread(target=tarea, name="descarga-logo", daemon=True).start()
+
+
+def obtener_logo():
+    """
+    ImageReader del logo (decodificado una sola vez por proceso) o None
+    si todavía no hay copia local. No bloquea en la red.
+    """
+    global _logo
+
+    if _logo is not None:
+        return _logo
+
+    ruta = _ruta_local()
+    if ruta is None:
+        _descargar_en_segundo_plano()
+        return None
+
+    from reportlab.lib.utils import ImageReader
+
+    try:
+        logo = ImageReader(ruta)
+    except Exception as e:
+        print("No se pudo leer el logo local:", e)
+        return None
+
+    with _lock:
+        if _logo is None:
+            _logo = logo
+    return _logo
@@ -1,7 +1,6 @@
 # inventario/models.py
 
-from django.db import models
-from django.db.models import Max
+from django.db import IntegrityError, models, transaction
 from django.contrib.auth.models import User
 
 
@@ -10,7 +9,7 @@ from django.contrib.auth.models import User
 # ---------------------------------------
 class Herramienta(models.Model):
     codigo = models.CharField(max_length=20, primary_key=True)
-    codigo_barra = models.CharField(max_length=50, blank=True)
+    codigo_barra = models.CharField(max_length=50, blank=True, db_index=True)
     nombre = models.CharField(max_length=255)
     stock_disponible = models.IntegerField(default=0)
     stock = models.IntegerField(default=0)
@@ -26,40 +25,70 @@ class Herramienta(models.Model):
     # ---------------------------------------
     # GENERAR CÓDIGO Y CÓDIGO DE BARRA
     # ---------------------------------------
+    # Veces que se pide otro código si el de la secuencia ya estaba ocupado
+    INTENTOS_CODIGO = 5
+
     def save(self, *args, **kwargs):
-        # Si no viene código, lo generamos
-        if not self.codigo:
-            # Tomamos el mayor código numérico
-            ultimo = Herramienta.objects.aggregate(
-                max_codigo=Max("codigo")
-            )["max_codigo"]
-
-            nuevo = 10000
-            if ultimo:
-                try:
-                    num = int(ultimo)
-                    # Solo si el último es >= 10000 seguimos desde ahí
-                    if num >= 10000:
-                        nuevo = num + 1
-                except ValueError:
-                    # Si hay códigos no numéricos, partimos en 10000
-                    nuevo = 10000
-
-            # Por seguridad, evitar colisiones
-            while Herramienta.objects.filter(codigo=str(nuevo)).exists():
-                nuevo += 1
-
-            self.codigo = str(nuevo)
+        # Si no viene código, lo pedimos al asignador de secuencias
+        # (tabla 'secuencias' con bloqueo de fila; sin Max() ni sondeo)
+        codigo_automatico = not self.codigo
+        if codigo_automatico:
+            from .secuencias import siguiente_valor
+            self.codigo = str(siguiente_valor("herramientas"))
 
         # Si no hay código de barra, usar *codigo*
-        if not self.codigo_barra:
+        barra_automatica = not self.codigo_barra
+        if barra_automatica:
             self.codigo_barra = f"*{self.codigo}*"
 
         # Si es nuevo registro y stock_disponible está en 0, igualarlo a stock
         if self._state.adding and self.stock_disponible == 0:
             self.stock_disponible = self.stock
 
-        super().save(*args, **kwargs)
+        if codigo_automatico:
+            self._insertar_con_codigo_nuevo(barra_automatica, *args, **kwargs)
+        else:
+            super().save(*args, **kwargs)
+
+        # Mantener al día el índice en memoria del escáner
+        # (import local para evitar import circular)
+        from .indice_herramientas import notificar_cambio
+        notificar_cambio([self.codigo])
+
+    def delete(self, *args, **kwargs):
+        codigo = self.codigo
+        resultado = super().delete(*args, **kwargs)
+
+        # El índice y el delta del catálogo la informan como eliminada
+        from .indice_herramientas import notificar_cambio
+        notificar_cambio([codigo])
+        return resultado
+
+    def _insertar_con_codigo_nuevo(self, barra_automatica, *args, **kwargs):
+        """
+        Guarda con INSERT (nunca UPDATE) el código entregado por la secuencia.
+        La secuencia no ve los códigos cargados a mano (formulario, admin,
+        phpMyAdmin); si el código ya existe, se adelanta la secuencia hasta
+        el mayor código real y se pide otro, en vez de pisar esa herramienta.
+        """
+        from .secuencias import siguiente_valor, sincronizar_secuencia
+
+        kwargs["force_insert"] = True
+        kwargs.pop("force_update", None)
+
+        for intento in range(self.INTENTOS_CODIGO):
+            try:
+                # Savepoint: el error de PK duplicada no rompe la transacción externa
+                with transaction.atomic():
+                    super().save(*args, **kwargs)
+                return
+            except IntegrityError:
+                if intento == self.INTENTOS_CODIGO - 1:
+                    raise
+                sincronizar_secuencia("herramientas")
+                self.codigo = str(siguiente_valor("herramientas"))
+                if barra_automatica:
+                    self.codigo_barra = f"*{self.codigo}*"
 
 
 # ---------------------------------------
@@ -78,6 +107,40 @@ class Docente(models.Model):
     def __str__(self):
         return f"{self.nombre} ({self.codigo})"
 
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+
+        # El catálogo en caché de las estaciones usa esta versión
+        from .versiones import notificar_cambio
+        notificar_cambio("docentes")
+
+    def delete(self, *args, **kwargs):
+        resultado = super().delete(*args, **kwargs)
+
+        from .versiones import notificar_cambio
+        notificar_cambio("docentes")
+        return resultado
+
+    @classmethod
+    def crear_con_codigo_nuevo(cls, **campos):
+        """
+        Crea un docente con el siguiente código de la secuencia 'docentes'.
+        La secuencia no ve los códigos escritos a mano (admin, phpMyAdmin);
+        si el código ya existe, se adelanta la secuencia hasta el mayor
+        código real y se pide otro (como Herramienta._insertar_con_codigo_nuevo).
+        """
+        from .secuencias import siguiente_valor, sincronizar_secuencia
+
+        for intento in range(Herramienta.INTENTOS_CODIGO):
+            try:
+                # Savepoint: el error de PK duplicada no rompe la transacción externa
+                with transaction.atomic():
+                    return cls.objects.create(codigo=siguiente_valor("docentes"), **campos)
+            except IntegrityError:
+                if intento == Herramienta.INTENTOS_CODIGO - 1:
+                    raise
+                sincronizar_secuencia("docentes")
+
 
 # ---------------------------------------
 # ESTUDIANTES  (NUEVA TABLA MYSQL)
@@ -112,6 +175,20 @@ class Asignatura(models.Model):
     def __str__(self):
         return self.nombre
 
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+
+        # El catálogo en caché de las estaciones usa esta versión
+        from .versiones import notificar_cambio
+        notificar_cambio("asignaturas")
+
+    def delete(self, *args, **kwargs):
+        resultado = super().delete(*args, **kwargs)
+
+        from .versiones import notificar_cambio
+        notificar_cambio("asignaturas")
+        return resultado
+
 
 # ---------------------------------------
 # PANOLEROS  (NUEVA TABLA MYSQL)
@@ -210,6 +287,39 @@ class Prestamo(models.Model):
         db_table = "prestamos"
         managed = False
 
+    def save(self, *args, **kwargs):
+        # Si se edita la fecha, el día anterior también debe recalcularse
+        fecha_anterior = None
+        update_fields = kwargs.get("update_fields")
+        if not self._state.adding and (update_fields is None or "fecha" in update_fields):
+            fecha_anterior = (
+                Prestamo.objects
+                .filter(pk=self.pk)
+                .values_list("fecha", flat=True)
+                .first()
+            )
+
+        super().save(*args, **kwargs)
+
+        # El día del préstamo queda pendiente de recalcular en los resúmenes
+        # de KPIs y los KPIs en caché dejan de valer (incluye devoluciones)
+        from .resumenes import marcar_dia
+        from .cache_kpis import notificar_cambio
+        marcar_dia(self.fecha)
+        if fecha_anterior is not None and fecha_anterior != self.fecha:
+            marcar_dia(fecha_anterior)
+        notificar_cambio()
+
+    def delete(self, *args, **kwargs):
+        fecha = self.fecha
+        resultado = super().delete(*args, **kwargs)
+
+        from .resumenes import marcar_dia
+        from .cache_kpis import notificar_cambio
+        marcar_dia(fecha)
+        notificar_cambio()
+        return resultado
+
 
 # ---------------------------------------
 # DETALLE DE PRESTAMO
@@ -371,6 +481,20 @@ class Baja(models.Model):
         db_table = "bajas"
         managed = False
 
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+
+        # Los KPIs en caché dejan de valer
+        from .cache_kpis import notificar_cambio
+        notificar_cambio()
+
+    def delete(self, *args, **kwargs):
+        resultado = super().delete(*args, **kwargs)
+
+        from .cache_kpis import notificar_cambio
+        notificar_cambio()
+        return resultado
+
 class BajaDetalle(models.Model):
     id = models.AutoField(primary_key=True)
 
@@ -396,3 +520,271 @@ class BajaDetalle(models.Model):
     class Meta:
         db_table = "baja_detalle"
         managed = False
+
+
+# ---------------------------------------
+# VERSIONES DE DATOS (NUEVA TABLA MYSQL)
+#   Un contador por "clave" (ej: 'herramientas') que se incrementa
+#   cada vez que cambian esos datos. Lo usan los cachés en memoria
+#   de cada proceso para saber si deben reconstruirse.
+# ---------------------------------------
+class VersionDato(models.Model):
+    clave = models.CharField(max_length=50, primary_key=True)
+    version = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True, db_column="updated_at")
+
+    class Meta:
+        db_table = "versiones_datos"
+        managed = False
+
+    def __str__(self):
+        return f"{self.clave} v{self.version}"
+
+
+# ---------------------------------------
+# SECUENCIAS (NUEVA TABLA MYSQL)
+#   Contadores para asignar códigos (herramientas, docentes, ...)
+#   sin calcular Max() ni probar códigos libres uno a uno.
+# ---------------------------------------
+class Secuencia(models.Model):
+    nombre = models.CharField(max_length=50, primary_key=True)
+    ultimo_valor = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True, db_column="updated_at")
+
+    class Meta:
+        db_table = "secuencias"
+        managed = False
+
+    def __str__(self):
+        return f"{self.nombre}: {self.ultimo_valor}"
+
+
+# ---------------------------------------
+# SOLICITUDES IDEMPOTENTES (NUEVA TABLA MYSQL)
+#   Una fila por envío de formulario/API con clave de idempotencia.
+#   Si la estación reintenta con la misma clave se devuelve el
+#   resultado guardado en vez de registrar otro préstamo.
+# ---------------------------------------
+class SolicitudIdempotente(models.Model):
+    clave = models.CharField(max_length=64)
+    operacion = models.CharField(max_length=30)
+    usuario = models.ForeignKey(
+        User,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        db_column="usuario_id",
+    )
+    resultado = models.TextField(blank=True, default="")   # JSON
+    created_at = models.DateTimeField(auto_now_add=True, db_column="created_at")
+
+    class Meta:
+        db_table = "solicitudes_idempotentes"
+        managed = False
+        # La misma clave puede usarse en operaciones distintas
+        unique_together = ("operacion", "clave")
+
+    def __str__(self):
+        return f"{self.operacion} {self.clave}"
+
+
+# ---------------------------------------
+# CAMBIOS DE HERRAMIENTAS (NUEVA TABLA MYSQL)
+#   Registro de qué herramientas cambiaron en cada versión de
+#   'herramientas' (versiones_datos). Permite que las estaciones
+#   pidan solo lo modificado desde la versión que ya tienen.
+#   codigo NULL = cambio masivo (hay que recargar todo).
+# ---------------------------------------
+class CambioHerramienta(models.Model):
+    version = models.BigIntegerField(db_index=True)
+    codigo = models.CharField(max_length=20, null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True, db_column="created_at")
+
+    class Meta:
+        db_table = "cambios_herramientas"
+        managed = False
+
+    def __str__(self):
+        return f"v{self.version} {self.codigo or '(todas)'}"
+
+
+# ---------------------------------------
+# RESÚMENES DIARIOS DE PRÉSTAMOS (NUEVAS TABLAS MYSQL)
+#   Tablas de hechos pre-agregadas para los KPIs (inventario/resumenes.py).
+#   Una fila por día × asignatura × docente × pañolero × tipo de solicitante
+#   (× carrera, para el filtro del panel) y, en el detalle, × herramienta.
+#   Se recalculan por día: 'kpi_dias_pendientes' guarda los días que
+#   cambiaron desde el último refresco.
+# ---------------------------------------
+class ResumenPrestamosDia(models.Model):
+    TIPO_SOLICITANTE_CHOICES = [
+        ('docente', 'Docente'),
+        ('estudiante', 'Estudiante'),
+        ('otro', 'Otro'),
+    ]
+
+    id = models.BigAutoField(primary_key=True)
+    fecha = models.DateField(db_index=True)
+    tipo_solicitante = models.CharField(max_length=10, choices=TIPO_SOLICITANTE_CHOICES)
+
+    docente = models.ForeignKey(
+        Docente, on_delete=models.DO_NOTHING, db_column="docente_codigo",
+        to_field="codigo", null=True, blank=True, related_name="+",
+    )
+    carrera = models.CharField(max_length=255, blank=True, null=True)
+    asignatura = models.ForeignKey(
+        Asignatura, on_delete=models.DO_NOTHING, db_column="asignatura_id",
+        null=True, blank=True, related_name="+",
+    )
+    panolero = models.ForeignKey(
+        Panolero, on_delete=models.DO_NOTHING, db_column="panolero_id",
+        null=True, blank=True, related_name="+",
+    )
+
+    num_prestamos = models.IntegerField(default=0)
+
+    class Meta:
+        db_table = "kpi_prestamos_dia"
+        managed = False
+
+    def __str__(self):
+        return f"{self.fecha} {self.tipo_solicitante}: {self.num_prestamos}"
+
+
+class ResumenDetalleDia(models.Model):
+    id = models.BigAutoField(primary_key=True)
+    fecha = models.DateField(db_index=True)
+    tipo_solicitante = models.CharField(
+        max_length=10, choices=ResumenPrestamosDia.TIPO_SOLICITANTE_CHOICES
+    )
+
+    herramienta = models.ForeignKey(
+        Herramienta, on_delete=models.DO_NOTHING, db_column="herramienta_codigo",
+        to_field="codigo", related_name="+",
+    )
+    docente = models.ForeignKey(
+        Docente, on_delete=models.DO_NOTHING, db_column="docente_codigo",
+        to_field="codigo", null=True, blank=True, related_name="+",
+    )
+    carrera = models.CharField(max_length=255, blank=True, null=True)
+    asignatura = models.ForeignKey(
+        Asignatura, on_delete=models.DO_NOTHING, db_column="asignatura_id",
+        null=True, blank=True, related_name="+",
+    )
+    panolero = models.ForeignKey(
+        Panolero, on_delete=models.DO_NOTHING, db_column="panolero_id",
+        null=True, blank=True, related_name="+",
+    )
+
+    num_lineas = models.IntegerField(default=0)
+    # préstamos distintos del grupo (un préstamo cae en un solo grupo por herramienta)
+    num_prestamos = models.IntegerField(default=0)
+    cantidad_entregada = models.IntegerField(default=0)
+
+    class Meta:
+        db_table = "kpi_detalle_dia"
+        managed = False
+
+    def __str__(self):
+        return f"{self.fecha} {self.herramienta_id}: {self.cantidad_entregada}"
+
+
+class DiaResumenPendiente(models.Model):
+    fecha = models.DateField(primary_key=True)
+    # cuántas veces se marcó; el refresco solo borra la marca si no cambió
+    cambios = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True, db_column="updated_at")
+
+    class Meta:
+        db_table = "kpi_dias_pendientes"
+        managed = False
+
+    def __str__(self):
+        return f"{self.fecha} ({self.cambios})"
+
+
+# ---------------------------------------
+# TRABAJOS DE REPORTES (NUEVA TABLA MYSQL)
+#   Cola local de exportaciones pesadas (Excel / PDF del panel).
+#   La vista crea el trabajo y el comando 'procesar_reportes' lo
+#   genera en segundo plano; el usuario consulta el estado y descarga
+#   el archivo cuando está listo (inventario/reportes.py).
+#   clave_en_curso = clave mientras está pendiente/en proceso (UNIQUE),
+#   así dos solicitudes iguales simultáneas comparten el mismo trabajo.
+# ---------------------------------------
+class TrabajoReporte(models.Model):
+    ESTADO_CHOICES = [
+        ('pendiente', 'Pendiente'),
+        ('en_proceso', 'En proceso'),
+        ('listo', 'Listo'),
+        ('error', 'Error'),
+    ]
+
+    id = models.BigAutoField(primary_key=True)
+    tipo = models.CharField(max_length=30)
+    formato = models.CharField(max_length=10)
+    filtros = models.TextField(blank=True, default="")   # JSON
+    clave = models.CharField(max_length=64, db_index=True)
+    clave_en_curso = models.CharField(max_length=64, unique=True, null=True, blank=True)
+    estado = models.CharField(max_length=20, choices=ESTADO_CHOICES, default='pendiente')
+
+    usuario = models.ForeignKey(
+        User,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        db_column="usuario_id",
+    )
+
+    version_datos = models.BigIntegerField(null=True, blank=True)
+    archivo = models.CharField(max_length=255, blank=True, default="")
+    error = models.TextField(blank=True, default="")
+
+    created_at = models.DateTimeField(auto_now_add=True, db_column="created_at")
+    iniciado_at = models.DateTimeField(null=True, blank=True, db_column="iniciado_at")
+    terminado_at = models.DateTimeField(null=True, blank=True, db_column="terminado_at")
+
+    class Meta:
+        db_table = "trabajos_reportes"
+        managed = False
+
+    def __str__(self):
+        return f"#{self.id} {self.tipo}.{self.formato} ({self.estado})"
+
+
+# ---------------------------------------
+# PERIODOS ACADÉMICOS (NUEVA TABLA MYSQL)
+#   Calendario académico: cada semestre ("2025-1", "2025-2", ...) con
+#   sus fechas reales de inicio y término. Los filtros por semestre se
+#   traducen a 'fecha BETWEEN inicio AND fin' (inventario/periodos.py)
+#   y los select de semestre se arman desde esta tabla.
+# ---------------------------------------
+class PeriodoAcademico(models.Model):
+    id = models.AutoField(primary_key=True)
+    codigo = models.CharField(max_length=20, unique=True)   # ej. "2025-1"
+    nombre = models.CharField(max_length=100, blank=True, default="")
+    fecha_inicio = models.DateField()
+    fecha_fin = models.DateField()
+    activo = models.BooleanField(default=True)
+
+    class Meta:
+        db_table = "periodos_academicos"
+        managed = False
+        ordering = ["-fecha_inicio"]
+
+    def __str__(self):
+        return f"{self.codigo} ({self.fecha_inicio} a {self.fecha_fin})"
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+
+        # Caché de periodos de cada proceso y KPIs ya calculados por semestre
+        from .periodos import notificar_cambio
+        notificar_cambio()
+
+    def delete(self, *args, **kwargs):
+        resultado = super().delete(*args, **kwargs)
+
+        from .periodos import notificar_cambio
+        notificar_cambio()
+        return resultado
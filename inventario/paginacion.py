@@ -0,0 +1,129 @@
+# inventario/paginacion.py
+
+from datetime import date
+
+from django.db.models import Q
+
+# Paginación por cursor (keyset) para los listados ordenados por
+# (-fecha, -id). En vez de OFFSET, cada página pide
+#
+#   WHERE (fecha, id) < (fecha_cursor, id_cursor)  ORDER BY fecha DESC, id DESC  LIMIT n+1
+#
+# así la página 500 cuesta lo mismo que la primera, y no hace falta COUNT.
+# Los cursores viajan en la URL: ?despues=2025-03-01_1234  /  ?antes=...
+POR_PAGINA = 100
+
+# Tope del conteo aproximado (COUNT sobre un LIMIT): más allá se muestra "N+"
+LIMITE_CONTEO = 10000
+
+PARAM_DESPUES = "despues"
+PARAM_ANTES = "antes"
+
+
+class Pagina:
+    """Filas de una página y los enlaces para moverse (se itera como una lista)."""
+
+    def __init__(self, filas, url_siguiente=None, url_anterior=None, url_primera=None,
+                 total=None, total_exacto=True):
+        self.filas = filas
+        self.url_siguiente = url_siguiente
+        self.url_anterior = url_anterior
+        self.url_primera = url_primera
+        self.total = total
+        self.total_exacto = total_exacto
+
+    def __iter__(self):
+        return iter(self.filas)
+
+    def __len__(self):
+        return len(self.filas)
+
+    def __bool__(self):
+        return bool(self.filas)
+
+    @property
+    def hay_mas_paginas(self):
+        return bool(self.url_siguiente or self.url_anterior)
+
+
+def _cursor(fila, campo_fecha):
+    return f"{getattr(fila, campo_fecha).isoformat()}_{fila.pk}"
+
+
+def _leer_cursor(texto):
+    """'2025-03-01_1234' → (date, 1234); None si no es válido."""
+    try:
+        fecha_str, id_str = (texto or "").split("_")
+        return date.fromisoformat(fecha_str), int(id_str)
+    except ValueError:
+        return None
+
+
+def _url(params, **cambios):
+    params = params.copy()
+    for nombre in (PARAM_DESPUES, PARAM_ANTES, "page"):
+        params.pop(nombre, None)
+    for nombre, valor in cambios.items():
+        params[nombre] = valor
+    consulta = params.urlencode()
+    return f"?{consulta}" if consulta else "?"
+
+
+def contar_aproximado(queryset, limite=LIMITE_CONTEO):
+    """
+    (total, exacto): COUNT acotado a 'limite' filas, para mostrar
+    "1.234 registros" o "10.000+ registros" sin recorrer toda la tabla.
+    """
+    total = queryset.order_by()[:limite + 1].count()
+    if total > limite:
+        return limite, False
+    return total, True
+
+
+def paginar(queryset, params, campo_fecha="fecha", por_pagina=POR_PAGINA, contar=False):
+    """
+    Página de 'queryset' ordenada por (-campo_fecha, -id) según los
+    cursores de 'params' (request.GET). Con contar=True agrega el total
+    aproximado (ver contar_aproximado).
+    """
+    despues = _leer_cursor(params.get(PARAM_DESPUES))
+    antes = None if despues else _leer_cursor(params.get(PARAM_ANTES))
+
+    if despues:
+        fecha, id_ = despues
+        filas = list(
+            queryset
+            .filter(Q(**{f"{campo_fecha}__lt": fecha}) | Q(**{campo_fecha: fecha, "id__lt": id_}))
+            .order_by(f"-{campo_fecha}", "-id")[:por_pagina + 1]
+        )
+        hay_siguiente = len(filas) > por_pagina
+        hay_anterior = True
+        filas = filas[:por_pagina]
+    elif antes:
+        fecha, id_ = antes
+        filas = list(
+            queryset
+            .filter(Q(**{f"{campo_fecha}__gt": fecha}) | Q(**{campo_fecha: fecha, "id__gt": id_}))
+            .order_by(campo_fecha, "id")[:por_pagina + 1]
+        )
+        hay_anterior = len(filas) > por_pagina
+        hay_siguiente = True
+        filas = list(reversed(filas[:por_pagina]))
+    else:
+        filas = list(queryset.order_by(f"-{campo_fecha}", "-id")[:por_pagina + 1])
+        hay_siguiente = len(filas) > por_pagina
+        hay_anterior = False
+        filas = filas[:por_pagina]
+
+    pagina = Pagina(filas)
+    if filas and hay_siguiente:
+        pagina.url_siguiente = _url(params, **{PARAM_DESPUES: _cursor(filas[-1], campo_fecha)})
+    if filas and hay_anterior:
+        pagina.url_anterior = _url(params, **{PARAM_ANTES: _cursor(filas[0], campo_fecha)})
+    if despues or antes:
+        pagina.url_primera = _url(params)
+
+    if contar:
+        pagina.total, pagina.total_exacto = contar_aproximado(queryset)
+
+    return pagina
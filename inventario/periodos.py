@@ -0,0 +1,113 @@
+# inventario/periodos.py
+
+import threading
+import time
+
+from django.db import transaction
+
+from .models import PeriodoAcademico
+from . import versiones
+
+# Calendario académico en memoria (uno por proceso), cargado desde
+# 'periodos_academicos' con un solo SELECT:
+#   PERIODOS = [ {codigo, nombre, fecha_inicio, fecha_fin}, ... ]  (más reciente primero)
+#   _POR_CODIGO = { codigo: fila }
+#
+# El filtro "semestre" se resuelve aquí a un rango de fechas, así la
+# consulta queda como 'fecha BETWEEN inicio AND fin' (usa el índice de
+# fecha) en vez de YEAR(fecha) = ... AND MONTH(fecha) IN (...).
+PERIODOS = []
+_POR_CODIGO = {}
+
+CLAVE_VERSION = "periodos"
+
+# Los periodos cambian pocas veces al año: basta con revisar la versión
+# cada tanto para ver cambios hechos desde otro proceso.
+SEGUNDOS_ENTRE_VERIFICACIONES = 30.0
+
+CAMPOS_PERIODO = ("codigo", "nombre", "fecha_inicio", "fecha_fin")
+
+_lock = threading.Lock()
+_version_local = None
+_ultima_verificacion = 0.0
+
+
+def recargar():
+    """Vuelve a leer los periodos activos y los asocia a la versión actual de la BD."""
+    global PERIODOS, _POR_CODIGO, _version_local, _ultima_verificacion
+
+    # Versión ANTES de los datos (igual que el índice de herramientas)
+    version = versiones.obtener_version(CLAVE_VERSION)
+
+    periodos = list(
+        PeriodoAcademico.objects
+        .filter(activo=True)
+        .order_by("-fecha_inicio")
+        .values(*CAMPOS_PERIODO)
+    )
+    por_codigo = {p["codigo"]: p for p in periodos}
+
+    with _lock:
+        PERIODOS = periodos
+        _POR_CODIGO = por_codigo
+        _version_local = version
+        _ultima_verificacion = time.monotonic()
+
+
+def _asegurar_vigente():
+    """Recarga los periodos si otro proceso cambió la versión en la BD."""
+    global _ultima_verificacion
+
+    ahora = time.monotonic()
+    if _version_local is not None and ahora - _ultima_verificacion < SEGUNDOS_ENTRE_VERIFICACIONES:
+        return
+
+    version_bd = versiones.obtener_version(CLAVE_VERSION)
+    if _version_local is None or version_bd != _version_local:
+        recargar()
+    else:
+        _ultima_verificacion = ahora
+
+
+def listar():
+    """Periodos activos, del más reciente al más antiguo (para los select)."""
+    _asegurar_vigente()
+    return PERIODOS
+
+
+def codigos():
+    """Solo los códigos ("2025-2", "2025-1", ...), en el mismo orden que listar()."""
+    return [p["codigo"] for p in listar()]
+
+
+def rango(codigo):
+    """(fecha_inicio, fecha_fin) del periodo 'codigo'; None si no existe o está inactivo."""
+    codigo = (codigo or "").strip()
+    if not codigo:
+        return None
+
+    _asegurar_vigente()
+
+    periodo = _POR_CODIGO.get(codigo)
+    if periodo is None:
+        return None
+    return periodo["fecha_inicio"], periodo["fecha_fin"]
+
+
+def notificar_cambio():
+    """
+    Al confirmar la transacción: los demás procesos recargan el calendario
+    y los KPIs calculados con las fechas anteriores dejan de valer.
+    """
+    from . import cache_kpis
+
+    versiones.notificar_cambio(CLAVE_VERSION)
+    cache_kpis.notificar_cambio()
+    # Este proceso no espera a la próxima verificación
+    transaction.on_commit(_olvidar)
+
+
+def _olvidar():
+    global _version_local
+    with _lock:
+        _version_local = None
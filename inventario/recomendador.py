@@ -1,10 +1,19 @@
 # inventario/recomendador.py
 
 from collections import defaultdict
+import hashlib
 import os
 import csv
+import logging
+import pickle
+import threading
+import time
 
-from django.db.models import Count
+import numpy as np
+from scipy import sparse
+
+from django.db import connection, transaction
+from django.db.models import Count, Max
 from django.conf import settings
 
 from .models import (
@@ -13,18 +22,65 @@ from .models import (
     Asignatura,
     Herramienta,
 )
-
-# "Modelo" en memoria:
-# { asignatura_id: [ {herramienta_id, nombre, score}, ... ] }
-MODELO_RECOMENDACION = {}
-TOP_GLOBAL_DEFAULT = []          # ranking global de herramientas
-PESOS_EXCEL = {}                 # {(asig_id, herramienta_id): factor}
+from . import versiones
+
+logger = logging.getLogger(__name__)
+
+# Modelo en memoria (MatrizScores, ver abajo): matriz dispersa
+# asignaturas × herramientas con el score de cada par, más la matriz de
+# pesos de los CSV. El top-k de una asignatura se saca de su fila con
+# argpartition, sin ordenar listas completas.
+#
+# MODELO es una instantánea que nunca se modifica: los entrenamientos y
+# las actualizaciones arman una nueva en un hilo aparte y la publican con
+# una sola asignación. Quien recomienda toma la referencia una vez y
+# trabaja con ella, sin locks ni modelos a medio construir.
+MODELO = None
+PESOS_EXCEL = None               # ({herramienta_id: extra}, {(asig_id, herramienta_id): extra})
+
+# Préstamos, preparaciones (y reentrenamientos) incrementan esta versión
+# en versiones_datos; cada proceso la revisa cada tanto para ponerse al día.
+CLAVE_VERSION = "recomendador"
+SEGUNDOS_ENTRE_VERIFICACIONES = 2.0
+
+# Préstamos generados para pruebas que no deben influir en el modelo
+MARCA_SINTETICO = "sintético"
+
+# Lo ya contado de cada tabla de detalle se guarda como un "piso" (todo
+# id <= piso está contado) más los ids contados por encima del piso.
+# InnoDB asigna los id AUTO_INCREMENT antes del COMMIT: una transacción
+# lenta puede confirmar un id menor que otro ya contado. Por eso el piso
+# queda VENTANA_IDS por debajo del mayor id visto y cada actualización
+# vuelve a revisar esa ventana, descartando los ids ya contados.
+VENTANA_IDS = getattr(settings, "RECOMENDADOR_VENTANA_IDS", 1000)
+
+# Un solo hilo de refresco por proceso (ver refrescar_en_segundo_plano)
+_lock = threading.Lock()
+_hilo = None
+_completo_pedido = False
+_pasada_pedida = False
+_ultimo_error = None
+_version_local = None
+_ultima_verificacion = 0.0
 
 # Ruta de los CSV (ajusta si los tienes en otra carpeta)
 BASE_DATA_DIR = os.path.join(settings.BASE_DIR, "data")
 RUTA_PESOS = os.path.join(BASE_DATA_DIR, "pesos_herramientas_por_asignatura.csv")
 RUTA_RANKING = os.path.join(BASE_DATA_DIR, "ranking_herramientas_uso_mecanica.csv")
 
+# Modelo entrenado en disco (lo genera: python manage.py entrenar_recomendador).
+# Cada proceso lo carga al iniciar (apps.py) en milisegundos, sin consultar
+# la BD ni leer los CSV. Si se cambia la estructura del modelo hay que
+# subir FORMATO_MODELO: los archivos de otro formato se ignoran.
+RUTA_MODELO = getattr(
+    settings, "RECOMENDADOR_MODELO_PATH", os.path.join(settings.BASE_DIR, "modelos", "recomendador.pkl")
+)
+FORMATO_MODELO = 5
+
+
+class ModeloNoDisponible(RuntimeError):
+    """No hay modelo cargado y el entrenamiento falló (el detalle queda en el log)."""
+
 
 def _float_safe(value, default=0.0):
     """Convierte a float de forma segura (acepta coma, vacíos, etc.)."""
@@ -39,21 +95,12 @@ def _float_safe(value, default=0.0):
         return default
 
 
-def _cargar_pesos_desde_excel():
+def _leer_csv_pesos():
     """
-    Lee los 2 CSV y construye un diccionario:
-
-        {(asignatura_id, herramienta_id): factor_peso}
-
-    El factor combina:
-      - 'nivel_uso' de ranking_herramientas_uso_mecanica.csv
-      - 'Peso_sugerido_1a5' por Asignatura/Familia_herramienta
-        de pesos_herramientas_por_asignatura.csv
+    Lee los 2 CSV:
+      - ranking_por_codigo     {codigo: {nivel_uso, categoria}}
+      - pesos_asig_categoria   {(nombre_asignatura, familia): peso 1–5}
     """
-    global PESOS_EXCEL
-    if PESOS_EXCEL:
-        return PESOS_EXCEL
-
     # 1) ranking por código de herramienta (uso global y categoría/familia)
     ranking_por_codigo = {}
     if os.path.exists(RUTA_RANKING):
@@ -83,171 +130,534 @@ def _cargar_pesos_desde_excel():
                 peso = _float_safe(row.get("Peso_sugerido_1a5"), 0.0)
                 pesos_asig_categoria[(asignatura_nombre, familia)] = peso
 
-    pesos = {}
+    return ranking_por_codigo, pesos_asig_categoria
 
-    if not ranking_por_codigo and not pesos_asig_categoria:
-        PESOS_EXCEL = pesos
-        return pesos
 
-    # Cache de asignaturas por nombre
-    asignaturas_por_nombre = {}
-    for asig in Asignatura.objects.all():
-        asignaturas_por_nombre[asig.nombre.strip()] = asig
+def combinar_pesos(ranking_por_codigo, pesos_asig_categoria, ids_por_asignatura, codigos_existentes):
+    """
+    Arma los pesos como dos tablas, en vez de un factor por cada par
+    asignatura × herramienta:
 
-    herramientas = list(Herramienta.objects.all())
+        por_herramienta  {herramienta_id: extra}            ← nivel_uso (1–4)
+        por_par          {(asignatura_id, herramienta_id): extra}  ← peso de la familia (1–5)
 
-    # 3) Combinar para cada asignatura / herramienta
-    for asig_nombre, asig in asignaturas_por_nombre.items():
-        for h in herramientas:
-            info_rank = ranking_por_codigo.get(str(h.codigo).strip())
-            if not info_rank:
-                continue
+    y el factor de un par es 1 + por_herramienta[h] + por_par[(a, h)]
+    (0 si no está). Es la misma combinación de siempre:
 
-            categoria = info_rank["categoria"]
-            nivel_uso = info_rank["nivel_uso"]  # 1–4 aprox
-            peso_familia = pesos_asig_categoria.get((asig_nombre, categoria), 0.0)  # 1–5
+      - 70% peso de la familia en esa asignatura (0–5)
+      - 30% nivel de uso global (1–4)
+      → factor alrededor de 1.x
 
-            # Si no hay ninguna información, no aportamos nada
-            if peso_familia == 0 and nivel_uso == 0:
-                continue
+    por_par sale de "unir" los pesos del CSV con las asignaturas (por
+    nombre) y con las herramientas agrupadas por categoría: solo se
+    recorren los pares (asignatura, familia) que están en el CSV.
 
-            # Combinación sencilla:
-            #   - 70% peso de la familia en esa asignatura (0–5)
-            #   - 30% nivel de uso global (1–4)
-            #   → factor alrededor de 1.x
-            factor = 1.0 + (peso_familia / 5.0) * 0.7 + (nivel_uso / 4.0) * 0.3
-            pesos[(asig.id, h.id)] = factor
+    'ids_por_asignatura' = {nombre: [asignatura_id, ...]};
+    'codigos_existentes' = códigos del ranking que existen en 'herramientas'.
+    """
+    por_herramienta = {}
+    codigos_por_categoria = defaultdict(list)
+    for codigo in codigos_existentes:
+        info_rank = ranking_por_codigo.get(codigo)
+        if not info_rank:
+            continue
+        nivel_uso = info_rank["nivel_uso"]
+        if nivel_uso:
+            por_herramienta[codigo] = (nivel_uso / 4.0) * 0.3
+        codigos_por_categoria[info_rank["categoria"]].append(codigo)
+
+    por_par = {}
+    for (asig_nombre, familia), peso_familia in pesos_asig_categoria.items():
+        if not peso_familia:
+            continue
+        codigos = codigos_por_categoria.get(familia)
+        asig_ids = ids_por_asignatura.get(asig_nombre)
+        if not codigos or not asig_ids:
+            continue
+        extra = (peso_familia / 5.0) * 0.7
+        for asig_id in asig_ids:
+            for codigo in codigos:
+                por_par[(asig_id, codigo)] = extra
 
-    PESOS_EXCEL = pesos
-    return pesos
+    return por_herramienta, por_par
 
 
-def entrenar_modelo():
+def _cargar_pesos_desde_excel():
     """
-    Entrena (o reentrena) el modelo de recomendación.
-
-    - Usa histórico real (Preparaciones y Préstamos),
-      excluyendo los préstamos sintéticos.
-    - Ajusta los scores con los pesos de los 2 CSV.
-    - Calcula un ranking global y un ranking por asignatura.
+    Pesos de los 2 CSV como (por_herramienta, por_par); ver combinar_pesos().
+    Dos consultas livianas: nombres de asignaturas y códigos de las
+    herramientas del ranking que existen (sin instanciar modelos).
     """
-    global MODELO_RECOMENDACION, TOP_GLOBAL_DEFAULT
+    global PESOS_EXCEL
+    if PESOS_EXCEL is not None:
+        return PESOS_EXCEL
 
-    MODELO_RECOMENDACION = {}
-    TOP_GLOBAL_DEFAULT = []
+    ranking_por_codigo, pesos_asig_categoria = _leer_csv_pesos()
 
-    # datos[asignatura_id][herramienta_id] = {nombre, score}
-    datos = defaultdict(lambda: defaultdict(lambda: {"nombre": "", "score": 0.0}))
-    # global_scores[herramienta_id] = {nombre, score}
-    global_scores = defaultdict(lambda: {"nombre": "", "score": 0.0})
+    if not ranking_por_codigo:
+        PESOS_EXCEL = ({}, {})
+        return PESOS_EXCEL
 
-    pesos_excel = _cargar_pesos_desde_excel()
+    ids_por_asignatura = defaultdict(list)
+    for asig_id, nombre in Asignatura.objects.values_list("id", "nombre"):
+        ids_por_asignatura[(nombre or "").strip()].append(asig_id)
 
-    # ============================
-    # 1) HISTÓRICO DESDE PREPARACIONES
-    # ============================
-    prep_qs = (
-        PreparacionDetalle.objects
-        .filter(preparacion__asignatura__isnull=False)
-        .values(
-            "preparacion__asignatura_id",
-            "herramienta_id",
-            "herramienta__nombre",
-        )
-        .annotate(total_usos=Count("id"))
+    codigos_existentes = (
+        Herramienta.objects
+        .filter(codigo__in=list(ranking_por_codigo))
+        .values_list("codigo", flat=True)
     )
 
-    for row in prep_qs:
-        asig_id = row["preparacion__asignatura_id"]
-        h_id = row["herramienta_id"]
-        if asig_id is None or h_id is None:
-            continue
+    PESOS_EXCEL = combinar_pesos(
+        ranking_por_codigo, pesos_asig_categoria, ids_por_asignatura, codigos_existentes
+    )
+    return PESOS_EXCEL
 
-        nombre = row["herramienta__nombre"]
-        usos = row["total_usos"] or 0
 
-        factor = pesos_excel.get((asig_id, h_id), 1.0)
-        score_inc = usos * factor
+# {ruta: ((mtime, tamaño), sha256)}: el contenido solo se vuelve a leer si el archivo cambió
+_hash_por_archivo = {}
 
-        # Por asignatura
-        datos[asig_id][h_id]["nombre"] = nombre
-        datos[asig_id][h_id]["score"] += score_inc
 
-        # Global
-        global_scores[h_id]["nombre"] = nombre
-        global_scores[h_id]["score"] += score_inc
+def _hash_archivo(ruta):
+    info = os.stat(ruta)
+    clave = (info.st_mtime, info.st_size)
+    guardado = _hash_por_archivo.get(ruta)
+    if guardado is not None and guardado[0] == clave:
+        return guardado[1]
 
-    # ============================
-    # 2) HISTÓRICO DESDE PRÉSTAMOS (EXCLUIMOS SINTÉTICOS)
-    # ============================
-    prest_qs = (
+    h = hashlib.sha256()
+    with open(ruta, "rb") as f:
+        for bloque in iter(lambda: f.read(65536), b""):
+            h.update(bloque)
+    _hash_por_archivo[ruta] = (clave, h.hexdigest())
+    return h.hexdigest()
+
+
+def _firma_pesos():
+    """
+    (nombre, sha256) de cada CSV de pesos que existe. Depende solo del
+    contenido: un checkout, un deploy u otra carpeta de instalación no
+    invalidan un modelo guardado.
+    """
+    return tuple(
+        (os.path.basename(ruta), _hash_archivo(ruta))
+        for ruta in (RUTA_RANKING, RUTA_PESOS)
+        if os.path.exists(ruta)
+    )
+
+
+# Tablas de detalle que cuentan como uso (claves de las marcas)
+FUENTES = ("preparaciones", "prestamos")
+
+
+def _detalles(fuente):
+    """Detalles con asignatura que cuentan como uso, y el prefijo hacia su cabecera."""
+    if fuente == "preparaciones":
+        return PreparacionDetalle.objects.filter(preparacion__asignatura__isnull=False), "preparacion__"
+    return (
         PrestamoDetalle.objects
         .filter(prestamo__asignatura__isnull=False)
-        .exclude(prestamo__observaciones__icontains="sintético")
-        .values(
-            "prestamo__asignatura_id",
-            "herramienta_id",
-            "herramienta__nombre",
+        .exclude(prestamo__observaciones__icontains=MARCA_SINTETICO)
+    ), "prestamo__"
+
+
+def _max_ids():
+    """Último id de cada tabla de detalle (una consulta por tabla)."""
+    return {
+        "preparaciones": PreparacionDetalle.objects.aggregate(m=Max("id"))["m"] or 0,
+        "prestamos": PrestamoDetalle.objects.aggregate(m=Max("id"))["m"] or 0,
+    }
+
+
+def _usos_hasta(pisos):
+    """
+    Usos agrupados (asig_id, herramienta_id, nombre, usos) de preparaciones
+    y préstamos (sin los sintéticos) con id de detalle <= pisos[fuente].
+    """
+    for fuente in FUENTES:
+        qs, p = _detalles(fuente)
+        filas = (
+            qs.filter(id__lte=pisos[fuente])
+            .values(f"{p}asignatura_id", "herramienta_id", "herramienta__nombre")
+            .annotate(total_usos=Count("id"))
+            .order_by()
+        )
+        for row in filas:
+            yield (
+                row[f"{p}asignatura_id"], row["herramienta_id"],
+                row["herramienta__nombre"], row["total_usos"] or 0,
+            )
+
+
+def _usos_nuevos(marcas):
+    """
+    Usos (asig_id, herramienta_id, nombre, usos) de los detalles por encima
+    del piso de 'marcas' que todavía no se contaron, y las marcas nuevas
+    {fuente: {"piso", "contados"}}. Revisa fila a fila la ventana de
+    VENTANA_IDS ids más lo nuevo, así un id confirmado tarde no se pierde.
+    """
+    maximos = _max_ids()   # ANTES de leer: los ids mayores quedan en "contados"
+
+    usos = defaultdict(int)
+    nombres = {}
+    nuevas = {}
+    for fuente in FUENTES:
+        qs, p = _detalles(fuente)
+        piso = marcas[fuente]["piso"]
+        contados = set(marcas[fuente]["contados"])
+
+        filas = qs.filter(id__gt=piso).values_list(
+            "id", f"{p}asignatura_id", "herramienta_id", "herramienta__nombre"
         )
-        .annotate(total_usos=Count("id"))
+        for id_detalle, asig_id, herramienta_id, nombre in filas:
+            if id_detalle in contados:
+                continue
+            contados.add(id_detalle)
+            usos[(asig_id, herramienta_id)] += 1
+            nombres[herramienta_id] = nombre
+
+        piso = max(piso, maximos[fuente] - VENTANA_IDS)
+        nuevas[fuente] = {
+            "piso": piso,
+            "contados": frozenset(i for i in contados if i > piso),
+        }
+
+    filas = [(a, h, nombres[h], n) for (a, h), n in usos.items()]
+    return filas, nuevas
+
+
+def _agrandar(matriz, forma):
+    """La misma matriz CSR con más filas/columnas vacías al final (sin copiar datos)."""
+    if matriz.shape == forma:
+        return matriz
+    filas_nuevas = forma[0] - matriz.shape[0]
+    indptr = matriz.indptr
+    if filas_nuevas:
+        indptr = np.concatenate([indptr, np.full(filas_nuevas, indptr[-1], dtype=indptr.dtype)])
+    return sparse.csr_matrix((matriz.data, matriz.indices, indptr), shape=forma)
+
+
+def _top_indices(valores, n):
+    """Posiciones de los 'n' mayores de 'valores', de mayor a menor (argpartition + orden de n)."""
+    if n <= 0 or len(valores) == 0:
+        return np.empty(0, dtype=np.intp)
+    if n < len(valores):
+        candidatos = np.argpartition(-valores, n - 1)[:n]
+    else:
+        candidatos = np.arange(len(valores))
+    return candidatos[np.argsort(-valores[candidatos], kind="stable")]
+
+
+class MatrizScores:
+    """
+    Modelo de recomendación como matrices dispersas (CSR):
+
+      scores             asignaturas × herramientas = usos × factor de peso
+      pesos              asignaturas × herramientas = extra por familia (vacío = 0)
+      pesos_herramienta  herramientas               = extra por nivel de uso
+      globales           herramientas               = suma de scores por herramienta
+
+    El factor de un par es 1 + pesos_herramienta[h] + pesos[a, h]
+    (ver combinar_pesos).
+
+    'asignaturas' / 'herramientas' traducen fila / columna a id, e
+    'idx_asig' / 'idx_herr' al revés. Una vez creada no se modifica:
+    sumar() devuelve una matriz nueva.
+    """
+
+    def __init__(self, asignaturas, herramientas, nombres, scores, pesos, pesos_herramienta,
+                 marcas, firma_pesos):
+        self.asignaturas = asignaturas
+        self.herramientas = herramientas
+        self.nombres = nombres
+        self.idx_asig = {a: i for i, a in enumerate(asignaturas)}
+        self.idx_herr = {h: j for j, h in enumerate(herramientas)}
+        self.scores = scores
+        self.pesos = pesos
+        self.pesos_herramienta = pesos_herramienta
+        self.globales = np.asarray(scores.sum(axis=0)).ravel()
+        self.marcas = marcas
+        self.firma_pesos = firma_pesos
+
+    @classmethod
+    def entrenar(cls, usos, pesos_excel, marcas, firma_pesos):
+        """Modelo completo desde filas (asig_id, herramienta_id, nombre, usos) y los pesos."""
+        vacia = cls(
+            [], [], [], sparse.csr_matrix((0, 0)), sparse.csr_matrix((0, 0)), np.zeros(0),
+            {}, firma_pesos,
+        )
+        return vacia.sumar(usos, marcas, pesos_excel=pesos_excel)
+
+    def _ubicar(self, asig_ids, herr_ids, nombres_nuevos):
+        """Listas de ids/nombres agrandadas con los que falten (copias, no se toca self)."""
+        asignaturas = list(self.asignaturas)
+        idx_asig = dict(self.idx_asig)
+        for a in asig_ids:
+            if a not in idx_asig:
+                idx_asig[a] = len(asignaturas)
+                asignaturas.append(a)
+
+        herramientas = list(self.herramientas)
+        nombres = list(self.nombres)
+        idx_herr = dict(self.idx_herr)
+        for h in herr_ids:
+            if h not in idx_herr:
+                idx_herr[h] = len(herramientas)
+                herramientas.append(h)
+                nombres.append("")
+        for h, nombre in nombres_nuevos.items():
+            nombres[idx_herr[h]] = nombre
+
+        return asignaturas, idx_asig, herramientas, idx_herr, nombres
+
+    def sumar(self, usos, marcas, pesos_excel=None):
+        """
+        Modelo nuevo con los 'usos' (asig_id, herramienta_id, nombre, usos)
+        sumados: cada uso aporta usos × factor en un solo
+        multiplicar-y-acumular disperso. 'pesos_excel' (por_herramienta,
+        por_par) arma las tablas de pesos; solo se pasa al entrenar desde
+        cero (no reescala los scores ya acumulados).
+        """
+        filas = [u for u in usos if u[0] is not None and u[1] is not None]
+        por_herramienta, por_par = pesos_excel if pesos_excel is not None else ({}, {})
+
+        asignaturas, idx_asig, herramientas, idx_herr, nombres = self._ubicar(
+            [u[0] for u in filas] + [a for a, _ in por_par],
+            [u[1] for u in filas] + list(por_herramienta) + [h for _, h in por_par],
+            {u[1]: u[2] for u in filas},
+        )
+        forma = (len(asignaturas), len(herramientas))
+
+        if pesos_excel is not None:
+            claves = list(por_par)
+            pesos = sparse.csr_matrix(
+                (
+                    np.fromiter((por_par[k] for k in claves), dtype=np.float64, count=len(claves)),
+                    (
+                        np.fromiter((idx_asig[a] for a, _ in claves), dtype=np.intp, count=len(claves)),
+                        np.fromiter((idx_herr[h] for _, h in claves), dtype=np.intp, count=len(claves)),
+                    ),
+                ),
+                shape=forma,
+            )
+            pesos_herramienta = np.zeros(forma[1])
+            for h, extra in por_herramienta.items():
+                pesos_herramienta[idx_herr[h]] = extra
+        else:
+            pesos = _agrandar(self.pesos, forma)
+            pesos_herramienta = np.concatenate(
+                [self.pesos_herramienta, np.zeros(forma[1] - len(self.pesos_herramienta))]
+            )
+
+        scores = _agrandar(self.scores, forma)
+        if filas:
+            i = np.fromiter((idx_asig[u[0]] for u in filas), dtype=np.intp, count=len(filas))
+            j = np.fromiter((idx_herr[u[1]] for u in filas), dtype=np.intp, count=len(filas))
+            cantidades = np.fromiter((u[3] for u in filas), dtype=np.float64, count=len(filas))
+            usos_matriz = sparse.csr_matrix((cantidades, (i, j)), shape=forma)   # suma duplicados
+            scores = (
+                scores
+                + usos_matriz
+                + usos_matriz @ sparse.diags(pesos_herramienta)
+                + usos_matriz.multiply(pesos)
+            )
+
+        return MatrizScores(
+            asignaturas, herramientas, nombres, sparse.csr_matrix(scores), pesos,
+            pesos_herramienta, marcas, self.firma_pesos,
+        )
+
+    def _lista(self, columnas, valores):
+        return [
+            {
+                "herramienta_id": self.herramientas[j],
+                "nombre": self.nombres[j],
+                "score": float(v),
+            }
+            for j, v in zip(columnas, valores)
+        ]
+
+    def top_global(self, n):
+        """Las 'n' herramientas con más score sumando todas las asignaturas."""
+        usadas = np.flatnonzero(self.globales > 0)
+        orden = _top_indices(self.globales[usadas], n)
+        return self._lista(usadas[orden], self.globales[usadas[orden]])
+
+    def top(self, asig_id, n):
+        """Top 'n' de la asignatura; sin histórico, el ranking global."""
+        i = self.idx_asig.get(asig_id)
+        if i is None:
+            return self.top_global(n)
+
+        inicio, fin = self.scores.indptr[i], self.scores.indptr[i + 1]
+        if inicio == fin:
+            return self.top_global(n)
+
+        valores = self.scores.data[inicio:fin]
+        columnas = self.scores.indices[inicio:fin]
+        orden = _top_indices(valores, n)
+        return self._lista(columnas[orden], valores[orden])
+
+    def asignaturas_con_historial(self):
+        return int(np.count_nonzero(np.diff(self.scores.indptr)))
+
+
+def _entrenar():
+    """
+    Instantánea nueva desde cero (histórico completo + CSV de pesos, que se
+    vuelven a leer) y la versión de datos con que se armó.
+    """
+    global PESOS_EXCEL
+
+    # Versión ANTES de leer: lo que llegue entremedio queda para la
+    # próxima actualización incremental (sin contarlo dos veces).
+    version = versiones.obtener_version(CLAVE_VERSION)
+    firma = _firma_pesos()
+
+    PESOS_EXCEL = None
+    pesos_excel = _cargar_pesos_desde_excel()
+
+    # Lo viejo agrupado en la BD; la ventana reciente fila a fila, con sus ids
+    pisos = {fuente: max(0, maximo - VENTANA_IDS) for fuente, maximo in _max_ids().items()}
+    recientes, marcas = _usos_nuevos(
+        {fuente: {"piso": piso, "contados": frozenset()} for fuente, piso in pisos.items()}
     )
 
-    for row in prest_qs:
-        asig_id = row["prestamo__asignatura_id"]
-        h_id = row["herramienta_id"]
-        if asig_id is None or h_id is None:
-            continue
+    modelo = MatrizScores.entrenar(
+        list(_usos_hasta(pisos)) + recientes, pesos_excel, marcas, firma,
+    )
+    return modelo, version
+
+
+def _actualizar(modelo):
+    """
+    Instantánea con los detalles de préstamo/preparación todavía no contados
+    en modelo.marcas sumados (la misma si no hay nada nuevo), y su versión.
+
+    Las ediciones o borrados de detalles ya contados no se descuentan:
+    quedan corregidos en el siguiente entrenamiento completo.
+    """
+    version = versiones.obtener_version(CLAVE_VERSION)
+    if version == _version_local:
+        return modelo, version
+
+    usos, marcas = _usos_nuevos(modelo.marcas)
+    if marcas == modelo.marcas:
+        return modelo, version
+    return modelo.sumar(usos, marcas), version
 
-        nombre = row["herramienta__nombre"]
-        usos = row["total_usos"] or 0
-
-        factor = pesos_excel.get((asig_id, h_id), 1.0)
-        score_inc = usos * factor
-
-        # Por asignatura
-        datos[asig_id][h_id]["nombre"] = nombre
-        datos[asig_id][h_id]["score"] += score_inc
-
-        # Global
-        global_scores[h_id]["nombre"] = nombre
-        global_scores[h_id]["score"] += score_inc
-
-    # ============================
-    # 3) RANKING GLOBAL
-    # ============================
-    lista_global = []
-    for h_id, info in global_scores.items():
-        lista_global.append({
-            "herramienta_id": h_id,
-            "nombre": info["nombre"],
-            "score": float(info["score"]),
-        })
-    lista_global.sort(key=lambda x: x["score"], reverse=True)
-    TOP_GLOBAL_DEFAULT = lista_global
-
-    # ============================
-    # 4) RANKING POR ASIGNATURA
-    #    (si no hay histórico, se usa el global)
-    # ============================
-    modelo_final = {}
-    for asig in Asignatura.objects.all():
-        asig_id = asig.id
-        herramientas_dict = datos.get(asig_id)
-
-        if herramientas_dict:
-            lista = []
-            for h_id, info in herramientas_dict.items():
-                lista.append({
-                    "herramienta_id": h_id,
-                    "nombre": info["nombre"],
-                    "score": float(info["score"]),
-                })
-            lista.sort(key=lambda x: x["score"], reverse=True)
-            modelo_final[asig_id] = lista
+
+def _refrescar(completo):
+    """Arma la instantánea que corresponda y la publica (una asignación)."""
+    global MODELO, _version_local, _ultima_verificacion
+
+    modelo = MODELO
+    if completo or modelo is None or modelo.firma_pesos != _firma_pesos():
+        nuevo, version = _entrenar()
+    else:
+        nuevo, version = _actualizar(modelo)
+
+    MODELO = nuevo
+    _version_local = version
+    _ultima_verificacion = time.monotonic()
+
+
+def _hilo_refresco():
+    global _hilo, _completo_pedido, _pasada_pedida, _ultimo_error
+
+    try:
+        while True:
+            with _lock:
+                completo = _completo_pedido
+                _completo_pedido = False
+                _pasada_pedida = False
+
+            try:
+                _refrescar(completo)
+                _ultimo_error = None
+            except Exception as e:
+                logger.exception("No se pudo %s el modelo de recomendación",
+                                 "entrenar" if completo or MODELO is None else "actualizar")
+                _ultimo_error = e
+
+            with _lock:
+                # Si alguien pidió otra pasada (un préstamo confirmado cuando
+                # ya habíamos leído la versión) o un entrenamiento completo
+                # mientras trabajábamos, la hace este mismo hilo; si no, se libera.
+                if not (_completo_pedido or _pasada_pedida):
+                    _hilo = None
+                    return
+    finally:
+        with _lock:
+            if _hilo is threading.current_thread():
+                _hilo = None
+        connection.close()
+
+
+def refrescar_en_segundo_plano(completo=False):
+    """
+    Pone al día el modelo en un hilo aparte y devuelve ese hilo. Hay como
+    máximo uno por proceso: si ya está corriendo se devuelve el mismo, que
+    al terminar hace una pasada más (puede haber leído la versión antes de
+    este pedido) o, con completo=True, vuelve a entrenar desde cero.
+    """
+    global _hilo, _completo_pedido, _pasada_pedida
+
+    with _lock:
+        if completo:
+            _completo_pedido = True
+        if _hilo is None:
+            _hilo = threading.Thread(target=_hilo_refresco, name="recomendador", daemon=True)
+            _hilo.start()
         else:
-            modelo_final[asig_id] = lista_global
+            _pasada_pedida = True
+        return _hilo
+
 
-    MODELO_RECOMENDACION = modelo_final
+def entrenar_modelo():
+    """
+    Entrena (o reentrena) el modelo de recomendación desde cero y espera
+    a que quede publicado.
+
+    - Usa histórico real (Preparaciones y Préstamos),
+      excluyendo los préstamos sintéticos.
+    - Ajusta los scores con los pesos de los 2 CSV (se vuelven a leer).
+    - Arma la matriz asignaturas × herramientas de la que salen los tops.
+
+    Corre en el hilo de refresco: si ya hay uno en curso en este proceso
+    se espera ese, no se lanza otro. Solo hace falta cuando cambian los CSV
+    de pesos (o para la primera carga): los préstamos y preparaciones
+    nuevos se suman solos en segundo plano. Lanza ModeloNoDisponible si
+    el entrenamiento falló.
+    """
+    refrescar_en_segundo_plano(completo=True).join()
+    if _ultimo_error is not None:
+        raise ModeloNoDisponible(f"No se pudo entrenar el modelo de recomendación: {_ultimo_error}")
+
+
+def _programar_refresco():
+    """
+    Cada SEGUNDOS_ENTRE_VERIFICACIONES como máximo, lanza el refresco en
+    segundo plano (revisa los CSV de pesos y la versión en la BD). La
+    petición no espera: sigue con la instantánea actual.
+    """
+    global _ultima_verificacion
+
+    ahora = time.monotonic()
+    if _version_local is not None and ahora - _ultima_verificacion < SEGUNDOS_ENTRE_VERIFICACIONES:
+        return
+    _ultima_verificacion = ahora
+    refrescar_en_segundo_plano()
+
+
+def notificar_uso():
+    """
+    Llamar dentro de la transacción que crea un préstamo o una preparación:
+    al confirmarse, este proceso suma el uso en segundo plano y los demás
+    lo ven en su próxima verificación (versión en versiones_datos).
+    """
+    versiones.notificar_cambio(CLAVE_VERSION)
+    transaction.on_commit(refrescar_en_segundo_plano)
 
 
 def construir_mapa_herramientas_por_asignatura():
@@ -290,12 +700,77 @@ def construir_mapa_herramientas_por_asignatura():
     return dict(mapa)
 
 
+def guardar_modelo(ruta=None):
+    """
+    Guarda el modelo de este proceso (matrices de scores y pesos, marcas
+    de lo ya contado) en 'ruta' (por defecto RUTA_MODELO).
+    Se escribe a un temporal y se reemplaza con os.replace, así ningún
+    proceso lee un archivo a medio escribir. Devuelve la ruta.
+    """
+    ruta = str(ruta or RUTA_MODELO)
+    os.makedirs(os.path.dirname(ruta), exist_ok=True)
+
+    contenido = {
+        "formato": FORMATO_MODELO,
+        "creado": time.time(),
+        "modelo": MODELO,   # instantánea inmutable: no hace falta lock
+    }
+    temporal = ruta + ".tmp"
+    try:
+        with open(temporal, "wb") as f:
+            pickle.dump(contenido, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temporal, ruta)
+    finally:
+        if os.path.exists(temporal):
+            os.remove(temporal)
+    return ruta
+
+
+def cargar_modelo(ruta=None):
+    """
+    Carga el modelo guardado con guardar_modelo(). Devuelve True si quedó
+    cargado; False si no hay archivo, es de otro formato o no se puede leer
+    (en ese caso se entrenará desde la BD en la primera recomendación).
+    Lo registrado después de guardarlo se suma en segundo plano desde la
+    primera recomendación, sin reentrenar.
+    """
+    global MODELO, _version_local
+
+    ruta = str(ruta or RUTA_MODELO)
+    if not os.path.exists(ruta):
+        return False
+
+    try:
+        with open(ruta, "rb") as f:
+            contenido = pickle.load(f)
+    except Exception:
+        logger.exception("No se pudo leer el modelo de recomendación %s; se entrenará desde la BD", ruta)
+        return False
+
+    formato = contenido.get("formato") if isinstance(contenido, dict) else None
+    if formato != FORMATO_MODELO:
+        logger.warning(
+            "Modelo de recomendación %s con formato %s (se espera %s): se ignora y se "
+            "entrenará desde la BD (python manage.py entrenar_recomendador)",
+            ruta, formato, FORMATO_MODELO,
+        )
+        return False
+
+    # Sin versión local: la primera recomendación lanza la puesta al día
+    _version_local = None
+    MODELO = contenido["modelo"]
+    return True
+
+
 def recomendar_herramientas(asignatura, top_n=10):
     """
     Devuelve una lista de hasta 'top_n' herramientas recomendadas para una asignatura.
     - 'asignatura' puede ser objeto Asignatura o un ID.
-    - Si el modelo no está entrenado, se entrena en el momento.
+    - Si el proceso no tiene modelo, se lee del archivo (RUTA_MODELO) y, si
+      no existe, se entrena (una sola vez aunque lleguen varias peticiones).
+      Después las actualizaciones corren en segundo plano.
     - Retorna lista de dicts: [{herramienta_id, nombre, score}, ...]
+    - Lanza ModeloNoDisponible si no hay modelo y no se pudo entrenar.
     """
     if isinstance(asignatura, Asignatura):
         asig_id = asignatura.id
@@ -305,8 +780,18 @@ def recomendar_herramientas(asignatura, top_n=10):
         except (TypeError, ValueError):
             return []
 
-    if not MODELO_RECOMENDACION:
-        entrenar_modelo()
+    modelo = MODELO
+    if modelo is None:
+        if not cargar_modelo():
+            # Sin modelo, el refresco entrena desde cero; las peticiones
+            # simultáneas esperan el mismo hilo en vez de entrenar cada una.
+            refrescar_en_segundo_plano().join()
+        modelo = MODELO
+        if modelo is None:
+            raise ModeloNoDisponible(
+                f"El modelo de recomendación no está disponible: {_ultimo_error}"
+            )
+    else:
+        _programar_refresco()
 
-    lista = MODELO_RECOMENDACION.get(asig_id, TOP_GLOBAL_DEFAULT)
-    return lista[:top_n]
+    return modelo.top(asig_id, top_n)
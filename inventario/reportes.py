@@ -0,0 +1,207 @@
+# inventario/reportes.py
+
+import hashlib
+import json
+import os
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from .models import TrabajoReporte
+from . import cache_kpis
+from . import exportaciones
+from . import kpis
+from . import versiones
+
+# Cola local (en la BD) de reportes pesados:
+#   1. La vista llama a solicitar(): reutiliza un archivo ya generado con
+#      los mismos filtros y los mismos datos, o un trabajo igual en curso,
+#      o crea uno nuevo 'pendiente'.
+#   2. El comando 'procesar_reportes' toma los pendientes uno a uno
+#      (UPDATE condicional, sin bloquear la tabla) y genera el archivo
+#      en settings.REPORTES_DIR.
+#   3. El navegador consulta el estado y descarga el archivo.
+
+# tipo → formatos soportados: {formato: (extensión, content_type)}
+FORMATOS = {
+    "panel_kpis": {
+        "excel": ("xlsx", "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"),
+        "pdf": ("pdf", "application/pdf"),
+    },
+}
+
+
+class ReporteInvalido(ValueError):
+    """Tipo o formato de reporte no soportado."""
+
+
+def _directorio():
+    directorio = getattr(settings, "REPORTES_DIR", settings.BASE_DIR / "reportes_generados")
+    os.makedirs(directorio, exist_ok=True)
+    return directorio
+
+
+def _horas_vigencia():
+    return getattr(settings, "REPORTES_HORAS", 24)
+
+
+def _clave(tipo, formato, filtros):
+    texto = json.dumps([tipo, formato, cache_kpis.normalizar_filtros(filtros)])
+    return hashlib.sha256(texto.encode("utf-8")).hexdigest()
+
+
+def nombre_descarga(trabajo):
+    extension, _ = FORMATOS[trabajo.tipo][trabajo.formato]
+    return f"{trabajo.tipo}.{extension}"
+
+
+def content_type(trabajo):
+    return FORMATOS[trabajo.tipo][trabajo.formato][1]
+
+
+def _artefacto_vigente(clave):
+    """Último trabajo listo con esa clave, de datos aún vigentes y con su archivo."""
+    trabajo = (
+        TrabajoReporte.objects
+        .filter(
+            clave=clave,
+            estado="listo",
+            terminado_at__gte=timezone.now() - timedelta(hours=_horas_vigencia()),
+        )
+        .order_by("-id")
+        .first()
+    )
+    if trabajo is None:
+        return None
+    if trabajo.version_datos != versiones.obtener_version(cache_kpis.CLAVE_VERSION):
+        return None
+    if not os.path.exists(trabajo.archivo):
+        return None
+    return trabajo
+
+
+def solicitar(tipo, formato, filtros, usuario=None):
+    """
+    Devuelve el trabajo que atenderá el reporte pedido:
+      - uno ya listo con los mismos filtros y datos sin cambios, o
+      - uno igual que todavía está pendiente / en proceso, o
+      - uno nuevo en estado 'pendiente'.
+    """
+    if formato not in FORMATOS.get(tipo, {}):
+        raise ReporteInvalido(f"Reporte no soportado: {tipo}.{formato}")
+
+    clave = _clave(tipo, formato, filtros)
+
+    listo = _artefacto_vigente(clave)
+    if listo is not None:
+        return listo
+
+    en_curso = TrabajoReporte.objects.filter(clave_en_curso=clave).first()
+    if en_curso is not None:
+        return en_curso
+
+    try:
+        with transaction.atomic():
+            return TrabajoReporte.objects.create(
+                tipo=tipo,
+                formato=formato,
+                filtros=json.dumps(filtros, ensure_ascii=False),
+                clave=clave,
+                clave_en_curso=clave,
+                usuario=usuario if usuario is not None and usuario.is_authenticated else None,
+            )
+    except IntegrityError:
+        # Otra solicitud igual lo creó al mismo tiempo: usamos ese
+        return TrabajoReporte.objects.get(clave_en_curso=clave)
+
+
+def tomar_siguiente():
+    """
+    Marca como 'en_proceso' el pendiente más antiguo y lo devuelve
+    (None si no hay). El UPDATE condicional evita que dos workers
+    tomen el mismo trabajo.
+    """
+    while True:
+        trabajo = TrabajoReporte.objects.filter(estado="pendiente").order_by("id").first()
+        if trabajo is None:
+            return None
+        tomado = TrabajoReporte.objects.filter(id=trabajo.id, estado="pendiente").update(
+            estado="en_proceso", iniciado_at=timezone.now()
+        )
+        if tomado:
+            trabajo.refresh_from_db()
+            return trabajo
+
+
+def _generar_panel_kpis(formato, filtros, destino):
+    datos = kpis.calcular(filtros)
+    if formato == "excel":
+        exportaciones.kpis_xlsx(datos, kpis.prestamos_filtrados(filtros), destino)
+    else:
+        with open(destino, "wb") as f:
+            exportaciones.kpis_pdf(datos, filtros, f)
+
+
+GENERADORES = {
+    "panel_kpis": _generar_panel_kpis,
+}
+
+
+def procesar(trabajo):
+    """Genera el archivo del trabajo y lo deja 'listo' (o 'error')."""
+    # Versión ANTES de leer los datos: si cambian entremedio, el archivo
+    # queda asociado a una versión vieja y no se reutiliza.
+    version = versiones.obtener_version(cache_kpis.CLAVE_VERSION)
+
+    extension, _ = FORMATOS[trabajo.tipo][trabajo.formato]
+    destino = os.path.join(_directorio(), f"{trabajo.id}.{extension}")
+    temporal = destino + ".tmp"
+
+    try:
+        filtros = json.loads(trabajo.filtros or "{}")
+        GENERADORES[trabajo.tipo](trabajo.formato, filtros, temporal)
+        os.replace(temporal, destino)
+    except Exception as e:
+        if os.path.exists(temporal):
+            os.remove(temporal)
+        TrabajoReporte.objects.filter(id=trabajo.id).update(
+            estado="error",
+            error=str(e)[:2000],
+            clave_en_curso=None,
+            terminado_at=timezone.now(),
+        )
+        return False
+
+    TrabajoReporte.objects.filter(id=trabajo.id).update(
+        estado="listo",
+        archivo=destino,
+        version_datos=version,
+        clave_en_curso=None,
+        terminado_at=timezone.now(),
+    )
+    return True
+
+
+def recuperar_colgados(minutos=30):
+    """Devuelve a 'pendiente' los trabajos de un worker que se cayó a mitad."""
+    return TrabajoReporte.objects.filter(
+        estado="en_proceso",
+        iniciado_at__lt=timezone.now() - timedelta(minutes=minutos),
+    ).update(estado="pendiente", iniciado_at=None)
+
+
+def limpiar_vencidos():
+    """Borra los trabajos terminados (y sus archivos) más antiguos que REPORTES_HORAS."""
+    vencidos = TrabajoReporte.objects.filter(
+        estado__in=["listo", "error"],
+        terminado_at__lt=timezone.now() - timedelta(hours=_horas_vigencia()),
+    )
+    borrados = 0
+    for trabajo in vencidos.only("id", "archivo"):
+        if trabajo.archivo and os.path.exists(trabajo.archivo):
+            os.remove(trabajo.archivo)
+        trabajo.delete()
+        borrados += 1
+    return borrados
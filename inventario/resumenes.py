@@ -0,0 +1,186 @@
+# inventario/resumenes.py
+
+from django.db import IntegrityError, transaction
+from django.db.models import Case, CharField, Count, F, Sum, Value, When
+from django.db.models.functions import Coalesce
+
+from .models import (
+    Prestamo,
+    PrestamoDetalle,
+    ResumenPrestamosDia,
+    ResumenDetalleDia,
+    DiaResumenPendiente,
+)
+from . import versiones
+
+# Resúmenes diarios de préstamos para los KPIs (tablas kpi_*):
+#   - Cada escritura de un préstamo marca su día en 'kpi_dias_pendientes'.
+#   - refrescar_pendientes() recalcula SOLO esos días (borra e inserta
+#     las filas del día en una transacción) y quita la marca.
+#   - El comando 'refrescar_resumenes' lo ejecuta por cron (nunca una
+#     vista: dos requests recalculando el mismo día se bloquean entre sí);
+#     con --todo reconstruye toda la historia (primera carga).
+#   - Hasta esa primera carga las tablas están vacías: listos() es False y
+#     los KPIs se calculan directo sobre 'prestamos' / 'prestamo_detalle'.
+
+# Versión que queda > 0 cuando la historia completa ya se reconstruyó
+CLAVE_LISTOS = "kpi_resumenes"
+
+_listos = False
+
+
+def listos():
+    """True si los resúmenes ya se construyeron con 'refrescar_resumenes --todo'."""
+    global _listos
+    if not _listos:
+        # Una vez construidos quedan así: después no se vuelve a consultar
+        _listos = versiones.obtener_version(CLAVE_LISTOS) > 0
+    return _listos
+
+
+def _resumenes_cambiaron():
+    """Los KPIs en caché se calcularon con los resúmenes anteriores."""
+    from .cache_kpis import CLAVE_VERSION
+    versiones.incrementar_version(CLAVE_VERSION)
+
+
+def _marcar(fecha):
+    actualizadas = DiaResumenPendiente.objects.filter(fecha=fecha).update(cambios=F("cambios") + 1)
+    if actualizadas:
+        return
+    try:
+        with transaction.atomic():
+            DiaResumenPendiente.objects.create(fecha=fecha, cambios=1)
+    except IntegrityError:
+        # Otro proceso marcó el mismo día al mismo tiempo
+        DiaResumenPendiente.objects.filter(fecha=fecha).update(cambios=F("cambios") + 1)
+
+
+def marcar_dia(fecha):
+    """
+    Deja 'fecha' pendiente de recalcular al confirmar la transacción actual
+    (on_commit), igual que el índice de herramientas.
+    """
+    if fecha is None:
+        return
+    transaction.on_commit(lambda: _marcar(fecha))
+
+
+def _tipo_solicitante(prefijo=""):
+    """CASE docente → 'docente', estudiante → 'estudiante', si no 'otro'."""
+    return Case(
+        When(**{f"{prefijo}docente__isnull": False}, then=Value("docente")),
+        When(**{f"{prefijo}estudiante__isnull": False}, then=Value("estudiante")),
+        default=Value("otro"),
+        output_field=CharField(),
+    )
+
+
+def _filas_prestamos(fecha):
+    grupos = (
+        Prestamo.objects
+        .filter(fecha=fecha)
+        .annotate(tipo=_tipo_solicitante())
+        .values("tipo", "docente_id", "estudiante__carrera", "asignatura_id", "panolero_id")
+        .annotate(n=Count("id"))
+        .order_by()
+    )
+    return [
+        ResumenPrestamosDia(
+            fecha=fecha,
+            tipo_solicitante=g["tipo"],
+            docente_id=g["docente_id"],
+            carrera=g["estudiante__carrera"],
+            asignatura_id=g["asignatura_id"],
+            panolero_id=g["panolero_id"],
+            num_prestamos=g["n"],
+        )
+        for g in grupos
+    ]
+
+
+def _filas_detalle(fecha):
+    grupos = (
+        PrestamoDetalle.objects
+        .filter(prestamo__fecha=fecha)
+        .annotate(tipo=_tipo_solicitante("prestamo__"))
+        .values(
+            "herramienta_id", "tipo",
+            "prestamo__docente_id", "prestamo__estudiante__carrera",
+            "prestamo__asignatura_id", "prestamo__panolero_id",
+        )
+        .annotate(
+            num_lineas=Count("id"),
+            num_prestamos=Count("prestamo", distinct=True),
+            cantidad=Coalesce(Sum("cantidad_entregada"), 0),
+        )
+        .order_by()
+    )
+    return [
+        ResumenDetalleDia(
+            fecha=fecha,
+            tipo_solicitante=g["tipo"],
+            herramienta_id=g["herramienta_id"],
+            docente_id=g["prestamo__docente_id"],
+            carrera=g["prestamo__estudiante__carrera"],
+            asignatura_id=g["prestamo__asignatura_id"],
+            panolero_id=g["prestamo__panolero_id"],
+            num_lineas=g["num_lineas"],
+            num_prestamos=g["num_prestamos"],
+            cantidad_entregada=g["cantidad"],
+        )
+        for g in grupos
+    ]
+
+
+def refrescar_dia(fecha):
+    """Recalcula los resúmenes de un día (2 SELECT agrupados + borrar/insertar)."""
+    with transaction.atomic():
+        ResumenPrestamosDia.objects.filter(fecha=fecha).delete()
+        ResumenDetalleDia.objects.filter(fecha=fecha).delete()
+        ResumenPrestamosDia.objects.bulk_create(_filas_prestamos(fecha), batch_size=500)
+        ResumenDetalleDia.objects.bulk_create(_filas_detalle(fecha), batch_size=500)
+
+
+def refrescar_pendientes():
+    """
+    Recalcula los días marcados desde el último refresco y devuelve
+    cuántos se procesaron. Si un préstamo vuelve a marcar el día mientras
+    se recalcula, la marca se conserva para el siguiente refresco.
+    """
+    pendientes = list(DiaResumenPendiente.objects.values_list("fecha", "cambios"))
+
+    for fecha, cambios in pendientes:
+        refrescar_dia(fecha)
+        DiaResumenPendiente.objects.filter(fecha=fecha, cambios=cambios).delete()
+
+    if pendientes:
+        _resumenes_cambiaron()
+    return len(pendientes)
+
+
+def reconstruir(desde=None, hasta=None):
+    """
+    Recalcula todos los días con préstamos (opcionalmente entre 'desde' y
+    'hasta') y borra los resúmenes de días que ya no tienen préstamos.
+    Devuelve cuántos días se recalcularon.
+    """
+    prestamos = Prestamo.objects.all()
+    resumenes = ResumenPrestamosDia.objects.all()
+    if desde:
+        prestamos = prestamos.filter(fecha__gte=desde)
+        resumenes = resumenes.filter(fecha__gte=desde)
+    if hasta:
+        prestamos = prestamos.filter(fecha__lte=hasta)
+        resumenes = resumenes.filter(fecha__lte=hasta)
+
+    fechas = set(prestamos.values_list("fecha", flat=True).distinct())
+    fechas |= set(resumenes.values_list("fecha", flat=True).distinct())
+
+    for fecha in sorted(fechas):
+        refrescar_dia(fecha)
+
+    if not desde and not hasta:
+        versiones.incrementar_version(CLAVE_LISTOS)
+    _resumenes_cambiaron()
+    return len(fechas)
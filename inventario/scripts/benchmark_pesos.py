@@ -0,0 +1,111 @@
+import random
+import time
+from collections import namedtuple
+
+from inventario import recomendador as rec
+
+# Compara el armado de pesos del recomendador:
+#   - antes: un recorrido asignaturas × herramientas (como el antiguo
+#     _cargar_pesos_desde_excel), con un factor por cada par
+#   - ahora: rec.combinar_pesos (herramientas agrupadas por categoría y
+#     solo los pares (asignatura, familia) que están en el CSV)
+# sobre datos sintéticos, sin tocar la BD.
+#
+# Uso (python manage.py shell):
+#   from inventario.scripts.benchmark_pesos import comparar
+#   comparar()                                   # 200 asignaturas × 20.000 herramientas
+
+AsignaturaFalsa = namedtuple("AsignaturaFalsa", "id nombre")
+HerramientaFalsa = namedtuple("HerramientaFalsa", "codigo")
+
+
+def datos_sinteticos(n_asignaturas=200, n_herramientas=20000, n_categorias=30,
+                     familias_por_asignatura=8, semilla=1):
+    """CSV de ranking / pesos, asignaturas y herramientas inventados (reproducibles)."""
+    azar = random.Random(semilla)
+    categorias = [f"Categoría {i}" for i in range(n_categorias)]
+
+    ranking_por_codigo = {
+        str(10000 + i): {
+            "nivel_uso": float(azar.randint(0, 4)),
+            "categoria": azar.choice(categorias),
+        }
+        for i in range(n_herramientas)
+    }
+    asignaturas = [AsignaturaFalsa(i + 1, f"Asignatura {i + 1}") for i in range(n_asignaturas)]
+    pesos_asig_categoria = {
+        (a.nombre, familia): float(azar.randint(1, 5))
+        for a in asignaturas
+        for familia in azar.sample(categorias, familias_por_asignatura)
+    }
+    herramientas = [HerramientaFalsa(codigo) for codigo in ranking_por_codigo]
+    return ranking_por_codigo, pesos_asig_categoria, asignaturas, herramientas
+
+
+def pesos_por_producto(ranking_por_codigo, pesos_asig_categoria, asignaturas, herramientas):
+    """El recorrido anterior: un factor por cada asignatura × herramienta con información."""
+    asignaturas_por_nombre = {a.nombre.strip(): a for a in asignaturas}
+
+    pesos = {}
+    for asig_nombre, asig in asignaturas_por_nombre.items():
+        for h in herramientas:
+            info_rank = ranking_por_codigo.get(str(h.codigo).strip())
+            if not info_rank:
+                continue
+
+            categoria = info_rank["categoria"]
+            nivel_uso = info_rank["nivel_uso"]
+            peso_familia = pesos_asig_categoria.get((asig_nombre, categoria), 0.0)
+
+            if peso_familia == 0 and nivel_uso == 0:
+                continue
+
+            factor = 1.0 + (peso_familia / 5.0) * 0.7 + (nivel_uso / 4.0) * 0.3
+            pesos[(asig.id, h.codigo)] = factor
+    return pesos
+
+
+def comparar(n_asignaturas=200, n_herramientas=20000, repeticiones=3, **opciones):
+    """Mide ambos métodos, verifica que den los mismos factores e imprime el resultado."""
+    ranking, pesos_csv, asignaturas, herramientas = datos_sinteticos(
+        n_asignaturas, n_herramientas, **opciones
+    )
+
+    ids_por_asignatura = {}
+    for a in asignaturas:
+        ids_por_asignatura.setdefault(a.nombre.strip(), []).append(a.id)
+    codigos = [h.codigo for h in herramientas]
+
+    def medir(funcion):
+        mejor = None
+        for _ in range(repeticiones):
+            inicio = time.perf_counter()
+            resultado = funcion()
+            segundos = time.perf_counter() - inicio
+            mejor = segundos if mejor is None else min(mejor, segundos)
+        return resultado, mejor
+
+    antes, t_antes = medir(lambda: pesos_por_producto(ranking, pesos_csv, asignaturas, herramientas))
+    (por_herramienta, por_par), t_ahora = medir(
+        lambda: rec.combinar_pesos(ranking, pesos_csv, ids_por_asignatura, codigos)
+    )
+
+    # Mismo factor para cada par que tenía peso antes
+    diferencias = sum(
+        1
+        for (asig_id, codigo), factor in antes.items()
+        if abs(1.0 + por_herramienta.get(codigo, 0.0) + por_par.get((asig_id, codigo), 0.0) - factor) > 1e-9
+    )
+
+    print(f"{n_asignaturas} asignaturas × {n_herramientas} herramientas")
+    print(f"  producto A×H    : {t_antes:8.3f} s  ({len(antes):,} pares con peso)")
+    print(f"  combinar_pesos  : {t_ahora:8.3f} s  ({len(por_herramienta):,} herramientas + {len(por_par):,} pares)")
+    print(f"  aceleración     : {t_antes / t_ahora:8.1f}x")
+    print(f"  diferencias     : {diferencias}")
+    return {
+        "segundos_antes": t_antes,
+        "segundos_ahora": t_ahora,
+        "pares_antes": len(antes),
+        "pares_ahora": len(por_par),
+        "diferencias": diferencias,
+    }
@@ -11,6 +11,7 @@ from inventario.models import (
     Panolero,
 )
 from inventario import recomendador as rec
+from inventario.codigos import nuevo_codigo_prestamo
 
 
 def generar_prestamos_sinteticos(n_pedidos=1000):
@@ -77,13 +78,8 @@ def generar_prestamos_sinteticos(n_pedidos=1000):
                 minute=hora_inicio.minute,
             )
 
-            # 5) Código de préstamo tipo PYYYYMMDDhhmmssXXX
-            codigo_prestamo = (
-                "P"
-                + fecha.strftime("%Y%m%d")
-                + f"{hora_inicio.hour:02d}{hora_inicio.minute:02d}"
-                + f"{i:03d}"
-            )
+            # 5) Código de préstamo con el contador diario (P20250401-0001, ...)
+            codigo_prestamo = nuevo_codigo_prestamo(fecha)
 
             prestamo = Prestamo.objects.create(
                 codigo_prestamo=codigo_prestamo,
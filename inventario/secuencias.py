@@ -0,0 +1,109 @@
+# inventario/secuencias.py
+
+from django.db import IntegrityError, transaction
+from django.db.models import BigIntegerField, Max
+from django.db.models.functions import Cast
+
+from .models import Secuencia, Herramienta, Docente
+
+
+def _max_codigo_herramienta():
+    """Mayor código NUMÉRICO de herramienta (ignora códigos con letras)."""
+    return (
+        Herramienta.objects
+        .filter(codigo__regex=r"^[0-9]+$")
+        .annotate(codigo_num=Cast("codigo", BigIntegerField()))
+        .aggregate(maximo=Max("codigo_num"))["maximo"]
+    )
+
+
+def _max_codigo_docente():
+    return Docente.objects.aggregate(maximo=Max("codigo"))["maximo"]
+
+
+# Secuencias conocidas:
+#   "inicio"  → primer valor que se entrega si la tabla está vacía
+#   "maximo"  → función que devuelve el mayor código ya usado
+#               (solo se usa la primera vez, para sembrar el contador)
+SECUENCIAS = {
+    "herramientas": {"inicio": 10000, "maximo": _max_codigo_herramienta},
+    "docentes": {"inicio": 1, "maximo": _max_codigo_docente},
+}
+
+
+def _valor_inicial(nombre, maximo=None):
+    """
+    Último valor 'ya usado' con el que se siembra una secuencia nueva.
+    'maximo' permite sembrar secuencias que no están en SECUENCIAS
+    (por ejemplo, los contadores diarios de inventario/codigos.py).
+    """
+    config = SECUENCIAS.get(nombre)
+    if config is None:
+        valor = maximo() if maximo is not None else None
+        return valor or 0
+
+    ultimo = config["inicio"] - 1
+    maximo = config["maximo"]()
+    if maximo is not None and maximo > ultimo:
+        ultimo = maximo
+    return ultimo
+
+
+def _crear_si_no_existe(nombre, maximo=None):
+    if Secuencia.objects.filter(nombre=nombre).exists():
+        return
+    try:
+        with transaction.atomic():
+            Secuencia.objects.create(nombre=nombre, ultimo_valor=_valor_inicial(nombre, maximo))
+    except IntegrityError:
+        # Otro proceso la sembró al mismo tiempo: usamos la suya
+        pass
+
+
+def reservar_bloque(nombre, cantidad=1, maximo=None):
+    """
+    Reserva 'cantidad' valores consecutivos de la secuencia 'nombre'
+    y devuelve un range con ellos. 'maximo' (opcional) siembra la
+    secuencia la primera vez si no está registrada en SECUENCIAS.
+
+    La fila del contador se bloquea (SELECT ... FOR UPDATE) solo mientras
+    se incrementa, así dos procesos nunca reciben el mismo valor.
+    Para cargas masivas conviene pedir un bloque grande de una vez
+    en lugar de llamar muchas veces con cantidad=1.
+    """
+    if cantidad < 1:
+        raise ValueError("La cantidad a reservar debe ser mayor a 0.")
+
+    _crear_si_no_existe(nombre, maximo)
+
+    with transaction.atomic():
+        fila = Secuencia.objects.select_for_update().get(nombre=nombre)
+        inicio = fila.ultimo_valor + 1
+        fin = fila.ultimo_valor + cantidad
+        Secuencia.objects.filter(nombre=nombre).update(ultimo_valor=fin)
+
+    return range(inicio, fin + 1)
+
+
+def siguiente_valor(nombre):
+    """Devuelve un único valor nuevo de la secuencia 'nombre'."""
+    return reservar_bloque(nombre, 1)[0]
+
+
+def sincronizar_secuencia(nombre, minimo=None):
+    """
+    Adelanta el contador si en la tabla real hay códigos mayores
+    (por ejemplo, cargados a mano en phpMyAdmin). Nunca lo retrocede.
+    'minimo' (opcional) lo adelanta además hasta ese valor, para códigos
+    que todavía no están en la tabla (por ejemplo, los de un archivo a importar).
+    Devuelve el último valor resultante.
+    """
+    _crear_si_no_existe(nombre)
+
+    with transaction.atomic():
+        fila = Secuencia.objects.select_for_update().get(nombre=nombre)
+        ultimo = max(fila.ultimo_valor, _valor_inicial(nombre), minimo or 0)
+        if ultimo != fila.ultimo_valor:
+            Secuencia.objects.filter(nombre=nombre).update(ultimo_valor=ultimo)
+
+    return ultimo
@@ -0,0 +1,224 @@
+# inventario/series.py
+
+from datetime import timedelta
+
+from django.db.models import Count, F, Q, Sum
+from django.db.models.functions import Coalesce, TruncMonth, TruncWeek
+from django.utils import timezone
+
+from .models import Prestamo, PrestamoDetalle, ResumenPrestamosDia, ResumenDetalleDia
+from . import kpis
+from . import periodos
+from . import resumenes
+
+# Series de tiempo para los gráficos del panel: préstamos y unidades
+# entregadas por día, semana o mes. Se leen de los resúmenes diarios
+# (kpi_prestamos_dia / kpi_detalle_dia), que ya vienen agrupados por día:
+# agrupar por semana o mes recorre unas pocas filas por día del rango,
+# no la tabla de préstamos.
+#
+#   préstamos  → kpi_prestamos_dia.num_prestamos
+#                (con herramienta: kpi_detalle_dia.num_prestamos de esa herramienta)
+#   unidades   → kpi_detalle_dia.cantidad_entregada
+#
+# Hasta la primera carga de los resúmenes (resumenes.listos()) se agrupan
+# directamente 'prestamos' y 'prestamo_detalle', igual que los KPIs.
+
+# Mismos filtros que el panel + las dimensiones propias de la serie
+FILTROS_SERIE = kpis.FILTROS_PANEL + ("herramienta", "tipo_solicitante", "granularidad")
+
+GRANULARIDADES = ("dia", "semana", "mes")
+GRANULARIDAD_DEFECTO = "dia"
+
+TIPOS_SOLICITANTE = [valor for valor, _ in ResumenPrestamosDia.TIPO_SOLICITANTE_CHOICES]
+
+# Sin fechas ni semestre: últimos 90 días (igual que el panel)
+DIAS_POR_DEFECTO = 90
+
+
+class SerieInvalida(ValueError):
+    """Granularidad o tipo de solicitante desconocido."""
+
+
+def leer_parametros(params):
+    """
+    Filtros de la serie desde request.GET, validados. Si no viene ningún
+    rango (fechas o semestre) se usan los últimos DIAS_POR_DEFECTO días.
+    """
+    filtros = kpis.leer_filtros(params, FILTROS_SERIE)
+
+    filtros["granularidad"] = filtros["granularidad"].lower() or GRANULARIDAD_DEFECTO
+    if filtros["granularidad"] not in GRANULARIDADES:
+        raise SerieInvalida(
+            f"granularidad debe ser una de: {', '.join(GRANULARIDADES)}"
+        )
+
+    filtros["tipo_solicitante"] = filtros["tipo_solicitante"].lower()
+    if filtros["tipo_solicitante"] and filtros["tipo_solicitante"] not in TIPOS_SOLICITANTE:
+        raise SerieInvalida(
+            f"tipo_solicitante debe ser uno de: {', '.join(TIPOS_SOLICITANTE)}"
+        )
+
+    if not (filtros["semestre"] or filtros["fecha_desde"] or filtros["fecha_hasta"]):
+        hoy = timezone.localdate()
+        filtros["fecha_desde"] = (hoy - timedelta(days=DIAS_POR_DEFECTO)).isoformat()
+        filtros["fecha_hasta"] = hoy.isoformat()
+
+    return filtros
+
+
+def _rango(filtros):
+    """(desde, hasta) efectivos del semestre y las fechas; None en un extremo abierto."""
+    desde = kpis.parsear_fecha(filtros.get("fecha_desde"))
+    hasta = kpis.parsear_fecha(filtros.get("fecha_hasta"))
+
+    rango_semestre = periodos.rango(filtros.get("semestre"))
+    if rango_semestre is not None:
+        inicio, fin = rango_semestre
+        desde = max(desde, inicio) if desde else inicio
+        hasta = min(hasta, fin) if hasta else fin
+
+    return desde, hasta
+
+
+def _inicio_periodo(fecha, granularidad):
+    if granularidad == "semana":
+        return fecha - timedelta(days=fecha.weekday())   # lunes, como TruncWeek
+    if granularidad == "mes":
+        return fecha.replace(day=1)
+    return fecha
+
+
+def _siguiente_periodo(fecha, granularidad):
+    if granularidad == "semana":
+        return fecha + timedelta(days=7)
+    if granularidad == "mes":
+        return (fecha.replace(day=28) + timedelta(days=4)).replace(day=1)
+    return fecha + timedelta(days=1)
+
+
+def _agrupar(queryset, granularidad, campo_fecha="fecha", **metricas):
+    """{inicio_del_periodo: {metrica: total}} agregando las filas por periodo de 'campo_fecha'."""
+    if granularidad == "semana":
+        queryset = queryset.annotate(periodo=TruncWeek(campo_fecha))
+    elif granularidad == "mes":
+        queryset = queryset.annotate(periodo=TruncMonth(campo_fecha))
+    else:
+        queryset = queryset.annotate(periodo=F(campo_fecha))
+
+    filas = (
+        queryset
+        .values("periodo")
+        .annotate(**{nombre: Coalesce(agregado, 0) for nombre, agregado in metricas.items()})
+        .order_by()
+    )
+    resultado = {}
+    for fila in filas:
+        periodo = fila.pop("periodo")
+        if hasattr(periodo, "date"):   # TruncWeek/TruncMonth pueden devolver datetime
+            periodo = periodo.date()
+        resultado[periodo] = fila
+    return resultado
+
+
+def _filtro_tipo(tipo, prefijo=""):
+    """Q del tipo de solicitante sobre 'prestamos' (mismo CASE que los resúmenes)."""
+    p = prefijo
+    if tipo == "docente":
+        return Q(**{f"{p}docente__isnull": False})
+    if tipo == "estudiante":
+        return Q(**{f"{p}docente__isnull": True, f"{p}estudiante__isnull": False})
+    return Q(**{f"{p}docente__isnull": True, f"{p}estudiante__isnull": True})
+
+
+def _por_periodo_resumenes(filtros, granularidad):
+    condicion = kpis.filtro_resumenes(filtros)
+    if filtros.get("tipo_solicitante"):
+        condicion &= Q(tipo_solicitante=filtros["tipo_solicitante"])
+
+    detalle = ResumenDetalleDia.objects.filter(condicion)
+    if filtros.get("herramienta"):
+        # Un préstamo cae en un solo grupo por herramienta y día: sumar
+        # num_prestamos de esa herramienta da los préstamos distintos.
+        return _agrupar(
+            detalle.filter(herramienta_id=filtros["herramienta"]),
+            granularidad,
+            prestamos=Sum("num_prestamos"),
+            unidades=Sum("cantidad_entregada"),
+        )
+
+    por_periodo = _agrupar(
+        ResumenPrestamosDia.objects.filter(condicion),
+        granularidad,
+        prestamos=Sum("num_prestamos"),
+    )
+    for periodo, fila in _agrupar(detalle, granularidad, unidades=Sum("cantidad_entregada")).items():
+        por_periodo.setdefault(periodo, {"prestamos": 0})["unidades"] = fila["unidades"]
+    return por_periodo
+
+
+def _por_periodo_prestamos(filtros, granularidad):
+    condicion = kpis.filtro_prestamos(filtros)
+    condicion_detalle = kpis.filtro_prestamos(filtros, prefijo="prestamo__")
+    if filtros.get("tipo_solicitante"):
+        condicion &= _filtro_tipo(filtros["tipo_solicitante"])
+        condicion_detalle &= _filtro_tipo(filtros["tipo_solicitante"], prefijo="prestamo__")
+
+    detalle = PrestamoDetalle.objects.filter(condicion_detalle)
+    if filtros.get("herramienta"):
+        return _agrupar(
+            detalle.filter(herramienta_id=filtros["herramienta"]),
+            granularidad,
+            campo_fecha="prestamo__fecha",
+            prestamos=Count("prestamo", distinct=True),
+            unidades=Sum("cantidad_entregada"),
+        )
+
+    por_periodo = _agrupar(
+        Prestamo.objects.filter(condicion),
+        granularidad,
+        prestamos=Count("id"),
+    )
+    unidades = _agrupar(
+        detalle, granularidad, campo_fecha="prestamo__fecha", unidades=Sum("cantidad_entregada")
+    )
+    for periodo, fila in unidades.items():
+        por_periodo.setdefault(periodo, {"prestamos": 0})["unidades"] = fila["unidades"]
+    return por_periodo
+
+
+def calcular(filtros):
+    """
+    Serie {granularidad, desde, hasta, puntos: [{periodo, prestamos, unidades}]}
+    con un punto por periodo del rango (los periodos sin préstamos van en 0).
+    Los resúmenes los refresca el cron (refrescar_resumenes), no esta consulta.
+    """
+    granularidad = filtros.get("granularidad") or GRANULARIDAD_DEFECTO
+    if resumenes.listos():
+        por_periodo = _por_periodo_resumenes(filtros, granularidad)
+    else:
+        por_periodo = _por_periodo_prestamos(filtros, granularidad)
+
+    desde, hasta = _rango(filtros)
+    if por_periodo:
+        desde = desde or min(por_periodo)
+        hasta = hasta or max(por_periodo)
+
+    puntos = []
+    if desde and hasta and desde <= hasta:
+        periodo = _inicio_periodo(desde, granularidad)
+        while periodo <= hasta:
+            fila = por_periodo.get(periodo, {})
+            puntos.append({
+                "periodo": periodo.isoformat(),
+                "prestamos": fila.get("prestamos", 0),
+                "unidades": fila.get("unidades", 0),
+            })
+            periodo = _siguiente_periodo(periodo, granularidad)
+
+    return {
+        "granularidad": granularidad,
+        "desde": desde.isoformat() if desde else None,
+        "hasta": hasta.isoformat() if hasta else None,
+        "puntos": puntos,
+    }
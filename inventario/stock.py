@@ -0,0 +1,104 @@
+# inventario/stock.py
+
+from django.db.models import Case, F, IntegerField, Value, When
+
+from .models import Herramienta
+
+
+class StockInsuficiente(ValueError):
+    """
+    No había stock suficiente al momento de descontar.
+    'codigos' son las herramientas involucradas en el descuento fallido.
+    """
+
+    def __init__(self, codigos):
+        if isinstance(codigos, str):
+            codigos = [codigos]
+        self.codigos = list(codigos)
+        super().__init__(", ".join(self.codigos))
+
+
+def descontar_stock(codigo, cantidad, reservado=0, es_consumible=False):
+    """
+    Descuenta 'cantidad' del stock_disponible de una herramienta con un
+    UPDATE condicional (sin leer-modificar-guardar en Python):
+
+        UPDATE herramientas
+           SET stock_disponible = stock_disponible - n
+               [, stock = stock - n]            -- solo consumibles
+         WHERE codigo = ...
+           AND stock_disponible >= n + reservado
+           [AND stock >= n]                     -- solo consumibles
+
+    'reservado' es lo que debe quedar libre para preparaciones próximas.
+    Si ninguna fila cumple la condición (otro pañolero se llevó el stock
+    en paralelo) se lanza StockInsuficiente.
+    """
+    filtros = {
+        "codigo": codigo,
+        "stock_disponible__gte": cantidad + reservado,
+    }
+    cambios = {"stock_disponible": F("stock_disponible") - cantidad}
+
+    if es_consumible:
+        filtros["stock__gte"] = cantidad
+        cambios["stock"] = F("stock") - cantidad
+
+    actualizadas = Herramienta.objects.filter(**filtros).update(**cambios)
+    if not actualizadas:
+        raise StockInsuficiente(codigo)
+
+
+def _por_codigo(valores, default=0):
+    """CASE codigo WHEN 'a' THEN valor_a ... ELSE default END"""
+    return Case(
+        *[When(codigo=c, then=Value(v)) for c, v in valores.items()],
+        default=Value(default),
+        output_field=IntegerField(),
+    )
+
+
+def descontar_stock_lote(movimientos):
+    """
+    Versión en lote de descontar_stock: descuenta varias herramientas
+    con UN solo UPDATE condicional.
+
+    movimientos = {
+        codigo: {"cantidad": n, "reservado": r, "es_consumible": bool},
+        ...
+    }
+
+        UPDATE herramientas
+           SET stock_disponible = stock_disponible - CASE codigo WHEN ... END,
+               stock            = stock            - CASE codigo WHEN ... END
+         WHERE codigo IN (...)
+           AND stock_disponible >= CASE codigo WHEN ... THEN n + r END
+           AND stock            >= CASE codigo WHEN ... THEN n (consumibles) ELSE 0 END
+
+    Si alguna fila no cumple su condición, el número de filas afectadas
+    es menor al de herramientas y se lanza StockInsuficiente: quien llama
+    debe estar dentro de transaction.atomic() para deshacer el resto.
+    """
+    if not movimientos:
+        return
+
+    cantidades = {c: m["cantidad"] for c, m in movimientos.items()}
+    minimos_disponible = {
+        c: m["cantidad"] + m.get("reservado", 0) for c, m in movimientos.items()
+    }
+    consumo_stock = {
+        c: m["cantidad"] for c, m in movimientos.items() if m.get("es_consumible")
+    }
+
+    cambios = {"stock_disponible": F("stock_disponible") - _por_codigo(cantidades)}
+    qs = Herramienta.objects.filter(
+        codigo__in=list(movimientos),
+        stock_disponible__gte=_por_codigo(minimos_disponible),
+    )
+    if consumo_stock:
+        cambios["stock"] = F("stock") - _por_codigo(consumo_stock)
+        qs = qs.filter(stock__gte=_por_codigo(consumo_stock))
+
+    actualizadas = qs.update(**cambios)
+    if actualizadas != len(movimientos):
+        raise StockInsuficiente(movimientos)
@@ -0,0 +1,58 @@
+# inventario/versiones.py
+
+from django.db import IntegrityError, transaction
+from django.db.models import F
+
+from .models import VersionDato
+
+
+def obtener_version(clave):
+    """Devuelve la versión actual de 'clave' (0 si todavía no existe)."""
+    version = (
+        VersionDato.objects
+        .filter(clave=clave)
+        .values_list("version", flat=True)
+        .first()
+    )
+    return version or 0
+
+
+def obtener_versiones(claves):
+    """Versiones de varias claves en una sola consulta: {clave: version}."""
+    versiones = dict.fromkeys(claves, 0)
+    versiones.update(
+        VersionDato.objects
+        .filter(clave__in=list(versiones))
+        .values_list("clave", "version")
+    )
+    return versiones
+
+
+def notificar_cambio(clave):
+    """
+    Incrementa la versión de 'clave' al confirmar la transacción actual
+    (on_commit), igual que el índice de herramientas.
+    """
+    transaction.on_commit(lambda: incrementar_version(clave))
+
+
+def incrementar_version(clave):
+    """
+    Incrementa en 1 la versión de 'clave' con un UPDATE atómico
+    (version = version + 1) y devuelve la nueva versión.
+    Si la fila no existe, la crea.
+    """
+    actualizadas = VersionDato.objects.filter(clave=clave).update(
+        version=F("version") + 1
+    )
+    if not actualizadas:
+        try:
+            with transaction.atomic():
+                VersionDato.objects.create(clave=clave, version=1)
+        except IntegrityError:
+            # Otro proceso la creó al mismo tiempo: incrementamos sobre la suya
+            VersionDato.objects.filter(clave=clave).update(
+                version=F("version") + 1
+            )
+
+    return obtener_version(clave)
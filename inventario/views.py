@@ -1,11 +1,12 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required, user_passes_test
 from django.db import transaction
-from django.db.models import Q, Sum, Count, Max
+from django.db.models import Q, Sum
 from django.utils import timezone
+from django.conf import settings
 from django.http import JsonResponse
 from datetime import timedelta
-from django.db.models.functions import TruncMonth
+from django.db.models.functions import Coalesce
 from django.contrib.auth.decorators import login_required, user_passes_test
 from django.contrib import messages
 from django.contrib.auth.models import Group
@@ -13,15 +14,22 @@ from .forms import HerramientaForm
 from django.http import JsonResponse
 from .recomendador import recomendar_herramientas
 from . import recomendador as rec
-from datetime import datetime
-from django.core.paginator import Paginator
+from . import indice_herramientas
+from .codigos import nuevo_codigo_prestamo, nuevo_codigo_preparacion
+from . import importacion
+from . import idempotencia
+from . import catalogo
+from . import kpis
+from . import cache_kpis
+from . import exportaciones
+from . import reportes
+from . import paginacion
+from . import periodos
+from . import series
+from .stock import descontar_stock_lote, StockInsuficiente
+from django.urls import reverse
 #
-from django.http import HttpResponse
-import io
-import openpyxl
-from openpyxl.utils import get_column_letter
-
-from xhtml2pdf import pisa
+from django.http import HttpResponse, FileResponse, StreamingHttpResponse, Http404
 
 from .models import (
     Herramienta,
@@ -34,7 +42,8 @@ from .models import (
     Preparacion,
     PreparacionDetalle,
     Baja,
-    BajaDetalle
+    BajaDetalle,
+    TrabajoReporte,
 )
 
 ## Nuevo
@@ -94,14 +103,10 @@ def administracion(request):
                     grupo, _ = Group.objects.get_or_create(name="Docente")
                     user.groups.add(grupo)
 
-                    # Buscamos el último código numérico y sumamos 1
-                    ultimo_codigo = Docente.objects.aggregate(
-                        max_codigo=Max("codigo")
-                    )["max_codigo"] or 0
-                    nuevo_codigo = ultimo_codigo + 1
-
-                    Docente.objects.create(
-                        codigo=nuevo_codigo,      # ej: 40001, 40002, ...
+                    # Código nuevo desde el asignador de secuencias
+                    # (evita dos docentes con el mismo Max()+1 en paralelo;
+                    # si el código ya se usó a mano, se pide otro)
+                    Docente.crear_con_codigo_nuevo(
                         nombre=nombre_completo,   # ej: "JUAN PÉREZ"
                         activo=True,
                     )
@@ -176,12 +181,9 @@ def api_herramienta_por_codigo(request):
             status=400
         )
 
-    # 1) Buscamos por 'codigo'
-    h = Herramienta.objects.filter(codigo=codigo).first()
-
-    # 2) Si no está, probamos por 'codigo_barra'
-    if h is None:
-        h = Herramienta.objects.filter(codigo_barra=codigo).first()
+    # Buscamos por 'codigo' o 'codigo_barra' en el índice en memoria
+    # (sin ir a la BD en cada escaneo)
+    h = indice_herramientas.buscar_herramienta(codigo)
 
     if h is None:
         return JsonResponse(
@@ -191,13 +193,114 @@ def api_herramienta_por_codigo(request):
 
     return JsonResponse({
         "ok": True,
-        "codigo": h.codigo,
-        "codigo_barra": h.codigo_barra,
-        "nombre": h.nombre,
-        "stock_disponible": h.stock_disponible,
+        "codigo": h["codigo"],
+        "codigo_barra": h["codigo_barra"],
+        "nombre": h["nombre"],
+        "stock_disponible": h["stock_disponible"],
     })
 
 
+# Máximo de códigos aceptados por llamada al API en lote
+MAX_CODIGOS_LOTE = 200
+
+
+@login_required
+def api_herramientas_por_codigos(request):
+    """
+    Versión en lote de api_herramienta_por_codigo (ráfagas del escáner).
+
+    Recibe varios códigos o códigos de barra, ya sea:
+      - GET  ?codigos=10001,*10002*,...   (o ?codigo=...&codigo=...)
+      - POST codigo=...&codigo=...
+    y los resuelve TODOS con una sola consulta
+    (codigo IN (...) OR codigo_barra IN (...)).
+
+    Respuesta:
+    {
+        "ok": true,
+        "encontradas": { "<código escaneado>": {codigo, codigo_barra, nombre, stock_disponible}, ... },
+        "no_encontradas": ["<código escaneado>", ...]
+    }
+    """
+    datos = request.POST if request.method == "POST" else request.GET
+
+    crudos = list(datos.getlist("codigo"))
+    for grupo in datos.getlist("codigos"):
+        crudos.extend(grupo.split(","))
+
+    # Limpiamos y quitamos duplicados manteniendo el orden de escaneo
+    codigos = []
+    vistos = set()
+    for c in crudos:
+        c = c.strip()
+        if c and c not in vistos:
+            vistos.add(c)
+            codigos.append(c)
+
+    if not codigos:
+        return JsonResponse(
+            {"ok": False, "error": "Debe indicar al menos un código."},
+            status=400
+        )
+
+    if len(codigos) > MAX_CODIGOS_LOTE:
+        return JsonResponse(
+            {"ok": False, "error": f"Máximo {MAX_CODIGOS_LOTE} códigos por consulta."},
+            status=400
+        )
+
+    resueltos = indice_herramientas.resolver_codigos(codigos)
+
+    encontradas = {}
+    no_encontradas = []
+    for c in codigos:
+        h = resueltos.get(c)
+        if h is None:
+            no_encontradas.append(c)
+        else:
+            encontradas[c] = {
+                "codigo": h.codigo,
+                "codigo_barra": h.codigo_barra,
+                "nombre": h.nombre,
+                "stock_disponible": h.stock_disponible,
+            }
+
+    return JsonResponse({
+        "ok": True,
+        "encontradas": encontradas,
+        "no_encontradas": no_encontradas,
+    })
+
+
+@login_required
+def api_catalogo(request):
+    """
+    Catálogo (herramientas, docentes activos, asignaturas) para las páginas
+    de préstamo y preparación, que lo guardan en el navegador.
+
+      - GET                    → catálogo completo
+      - GET ?desde=<version>   → solo lo cambiado desde esa versión (delta)
+
+    Cada respuesta trae "version" y la cabecera ETag; si el cliente manda
+    If-None-Match con la versión vigente se responde 304 sin leer datos.
+    """
+    version = catalogo.version_actual()
+    etag = f'"catalogo-{version}"'
+
+    desde = request.GET.get("desde", "").strip()
+    if desde == version or etag in request.headers.get("If-None-Match", ""):
+        respuesta = HttpResponse(status=304)
+    else:
+        datos = catalogo.delta(desde) if desde else catalogo.instantanea()
+        respuesta = JsonResponse(datos)
+        etag = f'"catalogo-{datos["version"]}"'
+
+    respuesta["ETag"] = etag
+    # El navegador puede guardarla, pero debe revalidar siempre con ETag
+    respuesta["Cache-Control"] = "private, no-cache"
+    return respuesta
+
+
 
 # ---------------------------------------------------
 # HELPERS PARA ROLES
@@ -310,6 +413,29 @@ def gestionar_herramienta(request):
                         f"Stock actual: {herramienta.stock}."
                     )
 
+        # 3) IMPORTAR CATÁLOGO DESDE CSV / XLSX (carga masiva)
+        elif accion == "importar":
+            archivo = request.FILES.get("archivo")
+
+            if archivo is None:
+                error = "Debes seleccionar un archivo CSV o Excel (.xlsx)."
+            else:
+                try:
+                    resumen = importacion.importar_herramientas(
+                        importacion.leer_archivo(archivo, archivo.name)
+                    )
+                    mensaje = (
+                        f"Importación terminada en {resumen['segundos']} s: "
+                        f"{resumen['leidas']} filas leídas, "
+                        f"{resumen['creadas']} herramientas creadas, "
+                        f"{resumen['actualizadas']} con stock sumado, "
+                        f"{resumen['omitidas']} omitidas."
+                    )
+                    if resumen["errores"]:
+                        error = " | ".join(resumen["errores"][:10])
+                except Exception as e:
+                    error = f"No se pudo importar el archivo: {e}"
+
     context = {
         "herramientas": herramientas,              # para tabla de inventario
         "herramientas_busqueda": herramientas_busqueda,  # para el <select>
@@ -344,10 +470,12 @@ def lista_prestamos(request):
             | Q(asignatura__nombre__icontains=q)
         )
 
-    prestamos = prestamos.order_by("-fecha", "-id")
+    # Página por cursor sobre (-fecha, -id): no se cargan todos los préstamos
+    pagina = paginacion.paginar(prestamos, request.GET, contar=True)
 
     return render(request, "inventario/lista_prestamos.html", {
-        "prestamos": prestamos,
+        "prestamos": pagina,
+        "pagina": pagina,
         "query": q,
     })
 
@@ -356,7 +484,8 @@ def lista_prestamos(request):
 # ---------------------------------------------------
 # 4) CREAR PRÉSTAMO (REGISTRAR SALIDA)
 #   Formulario tipo planilla VACÍO.
-#   El JS usa 'herramientas' sólo para armar el diccionario INVENTARIO.
+#   Las herramientas no van en el contexto: el JS usa el catálogo
+#   versionado de /inventario/api/catalogo/ (static/js/catalogo.js).
 # ---------------------------------------------------
 @login_required
 def crear_prestamo(request):
@@ -375,10 +504,21 @@ def crear_prestamo(request):
             "error": error,
             "docentes": Docente.objects.filter(activo=True).order_by("nombre"),
             "asignaturas": Asignatura.objects.all().order_by("nombre"),
-            "herramientas": Herramienta.objects.all().order_by("nombre"),
         })
 
     if request.method == "POST":
+        # Reintento de un envío ya registrado (doble clic, Wi-Fi inestable):
+        # se devuelve el resultado original sin volver a ejecutar nada.
+        clave_idempotencia = idempotencia.obtener_clave(request)
+        previo = idempotencia.resultado_previo(clave_idempotencia, "prestamo")
+        if previo is not None:
+            return render(request, "inventario/crear_prestamo.html", {
+                "mensaje": previo.get("mensaje"),
+                "error": None,
+                "docentes": Docente.objects.filter(activo=True).order_by("nombre"),
+                "asignaturas": Asignatura.objects.all().order_by("nombre"),
+            })
+
         tipo_solicitante   = request.POST.get("tipo_solicitante", "docente")
         docente_codigo     = request.POST.get("docente_codigo", "").strip()
 
@@ -415,7 +555,6 @@ def crear_prestamo(request):
                 "error": error,
                 "docentes": Docente.objects.filter(activo=True).order_by("nombre"),
                 "asignaturas": Asignatura.objects.all().order_by("nombre"),
-                "herramientas": Herramienta.objects.all().order_by("nombre"),
             })
 
         # Si el tipo es estudiante, no debería usar preparación anticipada
@@ -426,7 +565,6 @@ def crear_prestamo(request):
                 "error": error,
                 "docentes": Docente.objects.filter(activo=True).order_by("nombre"),
                 "asignaturas": Asignatura.objects.all().order_by("nombre"),
-                "herramientas": Herramienta.objects.all().order_by("nombre"),
             })
 
         codigos    = request.POST.getlist("codigo_herramienta")
@@ -537,16 +675,81 @@ def crear_prestamo(request):
                 "error": error,
                 "docentes": Docente.objects.filter(activo=True).order_by("nombre"),
                 "asignaturas": Asignatura.objects.all().order_by("nombre"),
-                "herramientas": Herramienta.objects.all().order_by("nombre"),
             })
 
         # ---------------------------------------------
         # REGISTRO DEL PRÉSTAMO
         # ---------------------------------------------
+        # Todas las líneas se resuelven y validan en bloque, con un número
+        # FIJO de consultas sin importar cuántas herramientas tenga el préstamo:
+        #   1 SELECT herramientas (codigo IN ... OR codigo_barra IN ...)
+        #   1 SELECT agrupado de reservas próximas
+        #   1 INSERT préstamo + 1 INSERT masivo de detalles
+        #   1 UPDATE condicional de stock para todas las herramientas
+        movimientos = {}       # {codigo: {cantidad, reservado, es_consumible}}
+        # True si viene de una preparación (el stock_disponible NO se tocó en la preparación)
+        desde_preparacion = prep_origen is not None
+
         try:
+            # -------- RESOLVER LÍNEAS (UNA CONSULTA) --------
+            resueltos = indice_herramientas.resolver_codigos(c for c, _ in lineas_validas)
+
+            lineas = []            # [(herramienta, cantidad)]
+            # Flag para ver si TODAS las líneas son consumibles
+            solo_consumibles = True
+
+            for codigo, cantidad in lineas_validas:
+                herramienta = resueltos.get(codigo)
+                if herramienta is None:
+                    raise ValueError(
+                        f"No se encontró ninguna herramienta con código/código de barra '{codigo}'."
+                    )
+
+                tipo_herr = (herramienta.tipo or "").strip().lower()
+                # 👇 más tolerante: cualquier tipo que contenga "consum"
+                es_consumible = "consum" in tipo_herr
+
+                # 🚫 Estudiante no puede pedir llaves / llaves de auto
+                if tipo_solicitante == "estudiante" and tipo_herr.startswith("llave"):
+                    raise ValueError(
+                        f"Las llaves solo pueden ser prestadas a docentes. "
+                        f"Herramienta: {herramienta.nombre}"
+                    )
+
+                # Ajuste de stock TOTAL:
+                # - Consumible: se consume al prestar (venga o no de preparación)
+                # - No consumible: stock total no cambia, solo disponible.
+                if not es_consumible:
+                    solo_consumibles = False
+
+                # Una misma herramienta puede venir en varias líneas
+                mov = movimientos.setdefault(herramienta.codigo, {
+                    "cantidad": 0,
+                    "reservado": 0,
+                    "es_consumible": es_consumible,
+                })
+                mov["cantidad"] += cantidad
+                lineas.append((herramienta, cantidad))
+
+            # -------- RESERVAS PRÓXIMAS (UNA CONSULTA AGRUPADA) --------
+            if not desde_preparacion:
+                # Préstamo directo: respetar preparaciones en los próximos 15 minutos.
+                # Si viene de una preparación, la planificación ya consideró disponibilidad.
+                reservas = reservas_proximas_lote(movimientos)
+                for codigo_h, mov in movimientos.items():
+                    mov["reservado"] = reservas.get(codigo_h, 0)
+
+            # El código se reserva fuera de la transacción para no dejar
+            # bloqueado el contador del día mientras se registra el préstamo.
+            codigo_prestamo = nuevo_codigo_prestamo()
+
             with transaction.atomic():
-                codigo_prestamo = "P" + timezone.now().strftime("%Y%m%d%H%M%S")
+                # Primero la clave: un envío duplicado en paralelo espera aquí
+                # y termina en SolicitudDuplicada sin tocar el stock.
+                solicitud = idempotencia.registrar(clave_idempotencia, "prestamo", request.user)
 
+                # ⬇⬇⬇ CIERRE AUTOMÁTICO SI TODO ES CONSUMIBLE
+                # Si hay mezcla o solo no-consumibles, queda "pendiente"
                 prestamo = Prestamo.objects.create(
                     codigo_prestamo=codigo_prestamo,
                     fecha=fecha,
@@ -556,100 +759,49 @@ def crear_prestamo(request):
                     docente=docente if tipo_solicitante == "docente" else None,
                     estudiante=estudiante if tipo_solicitante == "estudiante" else None,
                     asignatura=asignatura,
-                    estado="pendiente",
+                    estado="devuelto" if solo_consumibles else "pendiente",
                     observaciones=observaciones or (
                         prep_origen.observaciones if prep_origen else ""
                     ),
                 )
 
-                # Flag para ver si TODAS las líneas son consumibles
-                solo_consumibles  = True
-                # True si viene de una preparación (el stock_disponible NO se tocó en la preparación)
-                desde_preparacion = prep_origen is not None
-
-                for codigo, cantidad in lineas_validas:
-                    # Buscar por código o código de barra
-                    herramienta = Herramienta.objects.filter(codigo=codigo).first()
-                    if herramienta is None:
-                        herramienta = Herramienta.objects.filter(
-                            codigo_barra=codigo
-                        ).first()
-
-                    if herramienta is None:
-                        raise ValueError(
-                            f"No se encontró ninguna herramienta con código/código de barra '{codigo}'."
-                        )
-
-                    tipo_herr = (herramienta.tipo or "").strip().lower()
-                    # 👇 más tolerante: cualquier tipo que contenga "consum"
-                    es_consumible = "consum" in tipo_herr
-
-                    # 🚫 Estudiante no puede pedir llaves / llaves de auto
-                    if tipo_solicitante == "estudiante" and tipo_herr.startswith("llave"):
-                        raise ValueError(
-                            f"Las llaves solo pueden ser prestadas a docentes. "
-                            f"Herramienta: {herramienta.nombre}"
-                        )
-
-                    # -------- VALIDACIÓN DE STOCK --------
-                    if desde_preparacion:
-                        # Viene de una preparación: usamos stock físico disponible,
-                        # la planificación ya consideró disponibilidad.
-                        if herramienta.stock_disponible < cantidad:
-                            raise ValueError(
-                                f"No hay suficiente stock disponible para {herramienta.nombre} "
-                                f"al momento de entregar la preparación. "
-                                f"Disponible: {herramienta.stock_disponible}, solicitado: {cantidad}"
-                            )
-                    else:
-                        # Préstamo directo: respetar preparaciones en los próximos 15 minutos
-                        stock_efectivo = stock_disponible_respetando_preps(herramienta)
-                        if stock_efectivo < cantidad:
-                            raise ValueError(
-                                f"No hay suficiente stock disponible para {herramienta.nombre} "
-                                f"considerando preparaciones próximas. "
-                                f"Disponible efectivo: {max(stock_efectivo, 0)}, "
-                                f"solicitado: {cantidad}"
-                            )
-
-                    # Descontar SIEMPRE del stock_disponible al concretar el préstamo
-                    herramienta.stock_disponible -= cantidad
-                    if herramienta.stock_disponible < 0:
-                        herramienta.stock_disponible = 0
-
-                    # Ajuste de stock TOTAL:
-                    # - Consumible: se consume al prestar (venga o no de preparación)
-                    # - No consumible: stock total no cambia, solo disponible.
-                    if es_consumible:
-                        herramienta.stock -= cantidad
-                        if herramienta.stock < 0:
-                            herramienta.stock = 0
-                    else:
-                        solo_consumibles = False
-
-                    herramienta.save()
-
-                    # Crear detalle de préstamo
-                    PrestamoDetalle.objects.create(
+                PrestamoDetalle.objects.bulk_create([
+                    PrestamoDetalle(
                         prestamo=prestamo,
                         herramienta=herramienta,
                         cantidad_solicitada=cantidad,
                         cantidad_entregada=cantidad,
-                        cantidad_devuelta=0
+                        cantidad_devuelta=0,
                     )
+                    for herramienta, cantidad in lineas
+                ])
 
-                # ⬇⬇⬇ CIERRE AUTOMÁTICO SI TODO ES CONSUMIBLE
-                if solo_consumibles:
-                    prestamo.estado = "devuelto"
-                    prestamo.save(update_fields=["estado"])
-                # Si hay mezcla o solo no-consumibles, queda "pendiente"
+                # -------- DESCUENTO DE STOCK (UN UPDATE CONDICIONAL) --------
+                # stock_disponible = stock_disponible - n WHERE stock_disponible >= n + reservado,
+                # así dos pañoleros en paralelo no pueden prestar el mismo stock.
+                descontar_stock_lote(movimientos)
 
                 if prep_origen is not None:
                     prep_origen.estado = "usado"
                     prep_origen.save(update_fields=["estado", "updated_at"])
 
+                # Los UPDATE directos no pasan por Herramienta.save()
+                indice_herramientas.notificar_cambio(movimientos)
+
+                # El recomendador suma estas líneas al confirmar (sin reentrenar)
+                rec.notificar_uso()
+
                 mensaje = f"Préstamo creado correctamente. Código: {prestamo.codigo_prestamo}"
+                idempotencia.guardar_resultado(
+                    solicitud, mensaje=mensaje, codigo=prestamo.codigo_prestamo
+                )
 
+        except idempotencia.SolicitudDuplicada:
+            previo = idempotencia.resultado_previo(clave_idempotencia, "prestamo") or {}
+            mensaje = previo.get("mensaje") or "Este préstamo ya había sido registrado."
+        except StockInsuficiente:
+            # La transacción ya se deshizo: releemos el stock para explicar qué faltó
+            error = "Error: " + _detalle_stock_insuficiente(movimientos, desde_preparacion)
         except Exception as e:
             error = f"Error: {e}"
 
@@ -658,7 +810,6 @@ def crear_prestamo(request):
             "error": error,
             "docentes": Docente.objects.filter(activo=True).order_by("nombre"),
             "asignaturas": Asignatura.objects.all().order_by("nombre"),
-            "herramientas": Herramienta.objects.all().order_by("nombre"),
         })
 
     # GET → formulario vacío
@@ -667,7 +818,6 @@ def crear_prestamo(request):
         "error": None,
         "docentes": Docente.objects.filter(activo=True).order_by("nombre"),
         "asignaturas": Asignatura.objects.all().order_by("nombre"),
-        "herramientas": Herramienta.objects.all().order_by("nombre"),
     })
 
 
@@ -817,10 +967,11 @@ def lista_preparaciones(request):
             | Q(estado__icontains=q)
         )
 
-    preparaciones = preparaciones.order_by("-fecha", "-id")
+    pagina = paginacion.paginar(preparaciones, request.GET, contar=True)
 
     return render(request, "inventario/lista_preparaciones.html", {
-        "preparaciones": preparaciones,
+        "preparaciones": pagina,
+        "pagina": pagina,
         "query": q,
         "fecha": fecha_str,
     })
@@ -882,6 +1033,19 @@ def crear_preparacion(request):
     # SI ES POST → GUARDAR
     # -------------------------------
     if request.method == "POST":
+        # Reintento de un envío ya registrado: se devuelve el resultado original
+        clave_idempotencia = idempotencia.obtener_clave(request)
+        previo = idempotencia.resultado_previo(clave_idempotencia, "preparacion")
+        if previo is not None:
+            return render(request, "inventario/crear_preparacion.html", {
+                "mensaje": previo.get("mensaje"),
+                "error": None,
+                "docentes": Docente.objects.filter(activo=True).order_by("nombre"),
+                "asignaturas": Asignatura.objects.all().order_by("nombre"),
+                "es_docente": es_docente,
+                "docente_actual": docente_actual,
+            })
+
         tipo_solicitante   = request.POST.get("tipo_solicitante", "docente")
         docente_codigo     = request.POST.get("docente_codigo", "").strip()
         asignatura_nombre  = request.POST.get("asignatura_nombre", "").strip()
@@ -995,8 +1159,11 @@ def crear_preparacion(request):
         # REGISTRO DE PREPARACIÓN (SIN tocar stock_disponible)
         # ---------------------------------------------
         try:
+            # Igual que en préstamos: el código se reserva antes de la transacción
+            codigo_preparacion = nuevo_codigo_preparacion()
+
             with transaction.atomic():
-                codigo_preparacion = "C" + timezone.now().strftime("%Y%m%d%H%M%S")
+                solicitud = idempotencia.registrar(clave_idempotencia, "preparacion", request.user)
 
                 prep = Preparacion.objects.create(
                     codigo_preparacion=codigo_preparacion,
@@ -1010,34 +1177,35 @@ def crear_preparacion(request):
                     observaciones=observaciones,
                 )
 
-                for codigo, cantidad in lineas_validas:
-                    herramienta = Herramienta.objects.filter(codigo=codigo).first()
-                    if herramienta is None:
-                        herramienta = Herramienta.objects.filter(
-                            codigo_barra=codigo
-                        ).first()
+                # Se resuelven todas las líneas con una sola consulta
+                resueltas = indice_herramientas.resolver_codigos(c for c, _ in lineas_validas)
 
+                solicitadas = {}   # {codigo_herramienta: cantidad total}
+                herramientas = {}
+                lineas = []
+                for codigo, cantidad in lineas_validas:
+                    herramienta = resueltas.get(codigo)
                     if herramienta is None:
                         raise ValueError(
                             f"No se encontró ninguna herramienta con código/código de barra '{codigo}'."
                         )
+                    herramientas[herramienta.codigo] = herramienta
+                    lineas.append((herramienta, cantidad))
+                    solicitadas[herramienta.codigo] = solicitadas.get(herramienta.codigo, 0) + cantidad
+
+                # 🔹 Stock efectivo de TODAS las herramientas para el MISMO
+                #     bloque (misma fecha y misma hora de inicio, ventana de
+                #     0 minutos), solo preparaciones PENDIENTES: una consulta agrupada.
+                disponibles = stock_disponible_respetando_preps_lote(
+                    list(herramientas),
+                    ahora=timezone.datetime.combine(fecha, hora_inicio),
+                    minutos=0,
+                )
 
-                    # 🔹 Reservas ya existentes para ESTA herramienta,
-                    #     en la MISMA fecha y MISMA hora de inicio,
-                    #     solo en preparaciones PENDIENTES.
-                    reservas_existentes = (
-                        PreparacionDetalle.objects
-                        .filter(
-                            herramienta=herramienta,
-                            preparacion__estado="pendiente",
-                            preparacion__fecha=fecha,
-                            preparacion__hora_inicio=hora_inicio,
-                        )
-                        .aggregate(total=Sum("cantidad_solicitada"))["total"] or 0
-                    )
-
-                    # Stock disponible real para ese bloque horario
-                    disponible_para_bloque = herramienta.stock_disponible - reservas_existentes
+                for codigo_h, cantidad in solicitadas.items():
+                    herramienta = herramientas[codigo_h]
+                    disponible_para_bloque = disponibles.get(codigo_h, 0)
+                    reservas_existentes = herramienta.stock_disponible - disponible_para_bloque
 
                     if disponible_para_bloque < cantidad:
                         raise ValueError(
@@ -1048,18 +1216,30 @@ def crear_preparacion(request):
                             f"solicitado ahora: {cantidad}."
                         )
 
-                    # Se registra la línea de preparación (reserva lógica)
-                    PreparacionDetalle.objects.create(
+                # Se registran las líneas de preparación (reserva lógica)
+                PreparacionDetalle.objects.bulk_create([
+                    PreparacionDetalle(
                         preparacion=prep,
                         herramienta=herramienta,
                         cantidad_solicitada=cantidad,
                     )
+                    for herramienta, cantidad in lineas
+                ])
+
+                # El recomendador suma estas líneas al confirmar (sin reentrenar)
+                rec.notificar_uso()
 
                 mensaje = (
                     f"Preparación creada correctamente. "
                     f"Código: {prep.codigo_preparacion}"
                 )
+                idempotencia.guardar_resultado(
+                    solicitud, mensaje=mensaje, codigo=prep.codigo_preparacion
+                )
 
+        except idempotencia.SolicitudDuplicada:
+            previo = idempotencia.resultado_previo(clave_idempotencia, "preparacion") or {}
+            mensaje = previo.get("mensaje") or "Esta preparación ya había sido registrada."
         except Exception as e:
             error = f"Error al crear la preparación: {e}"
 
@@ -1392,38 +1572,138 @@ def registrar_baja(request):
 
 #####
 #Stock ectivo considerando preparaciones 
-def stock_disponible_respetando_preps(herramienta, ahora=None):
+def _ventana_reservas(ahora=None, minutos=None):
     """
-    Devuelve el stock disponible efectivo de una herramienta, descontando
-    las preparaciones PENDIENTES del día cuya hora_inicio está en los
-    próximos 15 minutos.
+    (fecha, hora_desde, hora_hasta) de la ventana de reservas a respetar:
+    preparaciones del día que parten entre 'ahora' y 'ahora + minutos'.
+    Por defecto usa settings.VENTANA_MINUTOS_RESERVA (15 min).
     """
     if ahora is None:
         ahora = timezone.localtime()
+    if minutos is None:
+        minutos = getattr(settings, "VENTANA_MINUTOS_RESERVA", 15)
+
+    ventana_fin = ahora + timedelta(minutes=minutos)
+    return ahora.date(), ahora.time(), ventana_fin.time()
 
-    hoy = ahora.date()
-    ventana_fin = ahora + timedelta(minutes=15)
-  
 
+def reservas_proximas(herramienta, ahora=None):
+    """
+    Cantidad de la herramienta reservada en preparaciones PENDIENTES del día
+    cuya hora_inicio está en los próximos 15 minutos.
+    """
+    return reservas_proximas_lote([herramienta], ahora).get(herramienta.codigo, 0)
 
-    # Stock disponible físico en pañol
-    base = herramienta.stock_disponible
 
-    # Cantidad reservada en preparaciones pendientes del día,
-    # con hora_inicio entre ahora y ahora+15 min
-    reservas = (
+def reservas_proximas_lote(herramientas, ahora=None, minutos=None):
+    """
+    Versión agrupada de reservas_proximas: UNA consulta con GROUP BY
+    para varias herramientas. Recibe códigos (o instancias) y devuelve
+    { codigo: cantidad_reservada } (solo las que tienen reservas).
+    """
+    codigos = [getattr(h, "codigo", h) for h in herramientas]
+    if not codigos:
+        return {}
+
+    hoy, desde, hasta = _ventana_reservas(ahora, minutos)
+
+    filas = (
         PreparacionDetalle.objects
         .filter(
-            herramienta=herramienta,
+            herramienta_id__in=codigos,
             preparacion__estado="pendiente",
             preparacion__fecha=hoy,
-            preparacion__hora_inicio__gte=ahora.time(),
-            preparacion__hora_inicio__lte=ventana_fin.time(),
+            preparacion__hora_inicio__gte=desde,
+            preparacion__hora_inicio__lte=hasta,
         )
-        .aggregate(total=Sum("cantidad_solicitada"))["total"] or 0
+        .values("herramienta_id")
+        .annotate(total=Sum("cantidad_solicitada"))
     )
+    return {f["herramienta_id"]: f["total"] or 0 for f in filas}
+
+
+def _detalle_stock_insuficiente(movimientos, desde_preparacion):
+    """Mensaje para el usuario cuando descontar_stock_lote no pudo descontar."""
+    actuales = {
+        h["codigo"]: h
+        for h in Herramienta.objects
+        .filter(codigo__in=list(movimientos))
+        .values("codigo", "nombre", "stock_disponible")
+    }
 
-    return base - reservas
+    partes = []
+    for codigo, mov in movimientos.items():
+        h = actuales.get(codigo, {"nombre": codigo, "stock_disponible": 0})
+        disponible = h["stock_disponible"] - mov["reservado"]
+        if disponible >= mov["cantidad"]:
+            continue
+        if desde_preparacion:
+            partes.append(
+                f"No hay suficiente stock disponible para {h['nombre']} "
+                f"al momento de entregar la preparación. "
+                f"Disponible: {h['stock_disponible']}, solicitado: {mov['cantidad']}"
+            )
+        else:
+            partes.append(
+                f"No hay suficiente stock disponible para {h['nombre']} "
+                f"considerando preparaciones próximas. "
+                f"Disponible efectivo: {max(disponible, 0)}, "
+                f"solicitado: {mov['cantidad']}"
+            )
+
+    if not partes:
+        return "El stock cambió mientras se registraba el préstamo. Intenta nuevamente."
+    return " | ".join(partes)
+
+
+def stock_disponible_respetando_preps_lote(herramientas, ahora=None, minutos=None):
+    """
+    Stock disponible efectivo de VARIAS herramientas en UNA consulta agrupada:
+
+        stock_disponible - SUM(cantidad_solicitada de preparaciones PENDIENTES
+                               del día que parten dentro de la ventana)
+
+    'herramientas' puede ser una lista de códigos o de instancias.
+    'minutos' es el largo de la ventana (por defecto VENTANA_MINUTOS_RESERVA).
+    Devuelve { codigo: stock_efectivo } (las que no existen no aparecen).
+    """
+    codigos = [getattr(h, "codigo", h) for h in herramientas]
+    if not codigos:
+        return {}
+
+    hoy, desde, hasta = _ventana_reservas(ahora, minutos)
+
+    filas = (
+        Herramienta.objects
+        .filter(codigo__in=codigos)
+        .annotate(
+            reservado=Coalesce(
+                Sum(
+                    "preparaciones_detalle__cantidad_solicitada",
+                    filter=Q(
+                        preparaciones_detalle__preparacion__estado="pendiente",
+                        preparaciones_detalle__preparacion__fecha=hoy,
+                        preparaciones_detalle__preparacion__hora_inicio__gte=desde,
+                        preparaciones_detalle__preparacion__hora_inicio__lte=hasta,
+                    ),
+                ),
+                0,
+            )
+        )
+        .values_list("codigo", "stock_disponible", "reservado")
+    )
+    return {codigo: disponible - reservado for codigo, disponible, reservado in filas}
+
+
+def stock_disponible_respetando_preps(herramienta, ahora=None):
+    """
+    Devuelve el stock disponible efectivo de una herramienta, descontando
+    las preparaciones PENDIENTES del día cuya hora_inicio está en los
+    próximos 15 minutos.
+    """
+    return stock_disponible_respetando_preps_lote([herramienta], ahora).get(
+        herramienta.codigo, 0
+    )
 
 
 #Lista de bajas 
@@ -1466,10 +1746,11 @@ def lista_bajas(request):
             | Q(asignatura__nombre__icontains=q)
         )
 
-    bajas = bajas.order_by("-fecha_registro", "-id")
+    pagina = paginacion.paginar(bajas, request.GET, campo_fecha="fecha_registro", contar=True)
 
     return render(request, "inventario/lista_bajas.html", {
-        "bajas": bajas,
+        "bajas": pagina,
+        "pagina": pagina,
         "query": q,
         "fecha_desde": fecha_desde,
         "fecha_hasta": fecha_hasta,
@@ -1582,134 +1863,17 @@ def informe_prestamos(request):
     - Top 5 pañoleros por cantidad de préstamos gestionados.
     """
 
-    fecha_desde = request.GET.get("fecha_desde", "").strip()
-    fecha_hasta = request.GET.get("fecha_hasta", "").strip()
-    estado      = request.GET.get("estado", "").strip()
-    q           = request.GET.get("q", "").strip()
-
-    # ------------------ BASE QUERY DE PRÉSTAMOS ------------------
-    prestamos = Prestamo.objects.select_related(
-        "panolero", "docente", "estudiante", "asignatura"
-    ).all()
+    filtros = kpis.leer_filtros(request.GET, kpis.FILTROS_INFORME)
+    fecha_desde = filtros["fecha_desde"]
+    fecha_hasta = filtros["fecha_hasta"]
+    estado      = filtros["estado"]
+    q           = filtros["q"]
 
-    # Filtro por fecha desde/hasta
-    if fecha_desde:
-        try:
-            fd = timezone.datetime.strptime(fecha_desde, "%Y-%m-%d").date()
-            prestamos = prestamos.filter(fecha__gte=fd)
-        except ValueError:
-            pass
+    # Listado paginado por cursor; los totales vienen del motor de KPIs
+    pagina = paginacion.paginar(kpis.prestamos_filtrados(filtros), request.GET)
 
-    if fecha_hasta:
-        try:
-            fh = timezone.datetime.strptime(fecha_hasta, "%Y-%m-%d").date()
-            prestamos = prestamos.filter(fecha__lte=fh)
-        except ValueError:
-            pass
-
-    # --------- Filtro por estado ---------
-    if estado:
-        prestamos = prestamos.filter(estado__iexact=estado)
-
-    # Búsqueda por texto (docente/estudiante/asignatura/pañolero)
-    if q:
-        prestamos = prestamos.filter(
-            Q(docente__nombre__icontains=q)
-            | Q(estudiante__nombre__icontains=q)
-            | Q(estudiante__carrera__icontains=q)
-            | Q(asignatura__nombre__icontains=q)
-            | Q(panolero__nombre__icontains=q)
-        )
-
-    prestamos = prestamos.order_by("-fecha", "-id")
-
-    # ------------------ RESUMEN GENERALES ------------------
-    total_prestamos    = prestamos.count()
-    total_docentes     = (
-        prestamos.exclude(docente__isnull=True)
-        .values("docente_id")
-        .distinct()
-        .count()
-    )
-    total_estudiantes  = (
-        prestamos.exclude(estudiante__isnull=True)
-        .values("estudiante_id")
-        .distinct()
-        .count()
-    )
-    total_asignaturas  = (
-        prestamos.exclude(asignatura__isnull=True)
-        .values("asignatura_id")
-        .distinct()
-        .count()
-    )
-    total_panoleros    = (
-        prestamos.exclude(panolero__isnull=True)
-        .values("panolero_id")
-        .distinct()
-        .count()
-    )
-
-    # Detalles filtrados por los mismos préstamos (para top herramientas, llaves, etc.)
-    detalles = PrestamoDetalle.objects.filter(
-        prestamo__in=prestamos
-    ).select_related("herramienta")
-
-    # ------------------ TOP 5 HERRAMIENTAS MÁS PRESTADAS ------------------
-    top_herramientas = (
-        detalles.values("herramienta__codigo", "herramienta__nombre", "herramienta__tipo")
-        .annotate(
-            total_prestada=Sum("cantidad_entregada"),
-            num_prestamos=Count("prestamo", distinct=True),
-        )
-        .order_by("-total_prestada")[:5]
-    )
-
-    # ------------------ TOP 5 LLAVES (incluye todo tipo 'llave*') ------------------
-    top_llaves = (
-        detalles.filter(herramienta__tipo__icontains="llave")
-        .values("herramienta__codigo", "herramienta__nombre", "herramienta__tipo")
-        .annotate(
-            total_prestada=Sum("cantidad_entregada"),
-            num_prestamos=Count("prestamo", distinct=True),
-        )
-        .order_by("-num_prestamos")[:5]
-    )
-
-    # ------------------ TOP 5 AUTOS (llaves de auto, tipo contiene 'llave_auto') ------------------
-    top_autos = (
-        detalles.filter(herramienta__tipo__icontains="llave_auto")
-        .values("herramienta__codigo", "herramienta__nombre")
-        .annotate(
-            total_prestada=Sum("cantidad_entregada"),
-            num_prestamos=Count("prestamo", distinct=True),
-        )
-        .order_by("-num_prestamos")[:5]
-    )
-
-    # ------------------ TOP 5 DOCENTES ------------------
-    top_docentes = (
-        prestamos.filter(docente__isnull=False)
-        .values("docente__codigo", "docente__nombre")
-        .annotate(num_prestamos=Count("id"))
-        .order_by("-num_prestamos")[:5]
-    )
-
-    # ------------------ TOP 5 ASIGNATURAS ------------------
-    top_asignaturas = (
-        prestamos.filter(asignatura__isnull=False)
-        .values("asignatura__id", "asignatura__nombre")
-        .annotate(num_prestamos=Count("id"))
-        .order_by("-num_prestamos")[:5]
-    )
-
-    # ------------------ TOP 5 PAÑOLEROS ------------------
-    top_panoleros = (
-        prestamos.filter(panolero__isnull=False)
-        .values("panolero__id", "panolero__nombre")
-        .annotate(num_prestamos=Count("id"))
-        .order_by("-num_prestamos")[:5]
-    )
+    # ------------------ RESUMEN Y TOPs (motor de KPIs sobre los resúmenes diarios) ------------------
+    datos = cache_kpis.obtener(filtros)
 
     # 🔹 HERRAMIENTAS SIN STOCK DISPONIBLE
     # Versión básica: todas las herramientas del pañol con stock_disponible <= 0
@@ -1718,30 +1882,25 @@ def informe_prestamos(request):
         .filter(stock_disponible__lte=0)
         .order_by("nombre")
     )
-    # Si quieres mostrar solo las que hayan participado en los préstamos filtrados:
-    # ids_usadas = detalles.values_list("herramienta_id", flat=True).distinct()
-    # herramientas_sin_stock = Herramienta.objects.filter(
-    #     id__in=ids_usadas,
-    #     stock_disponible__lte=0
-    # ).order_by("nombre")
 
     context = {
-        "prestamos": prestamos,
+        "prestamos": pagina,
+        "pagina": pagina,
 
         "resumen": {
-            "total_prestamos": total_prestamos,
-            "total_docentes": total_docentes,
-            "total_estudiantes": total_estudiantes,
-            "total_asignaturas": total_asignaturas,
-            "total_panoleros": total_panoleros,
+            "total_prestamos": datos["total_prestamos"],
+            "total_docentes": datos["total_docentes"],
+            "total_estudiantes": datos["total_estudiantes"],
+            "total_asignaturas": datos["total_asignaturas"],
+            "total_panoleros": datos["total_panoleros"],
         },
 
-        "top_herramientas": top_herramientas,
-        "top_llaves": top_llaves,
-        "top_autos": top_autos,
-        "top_docentes": top_docentes,
-        "top_asignaturas": top_asignaturas,
-        "top_panoleros": top_panoleros,
+        "top_herramientas": datos["top_herramientas"],
+        "top_llaves": datos["top_llaves"],
+        "top_autos": datos["top_autos"],
+        "top_docentes": datos["top_docentes"],
+        "top_asignaturas": datos["top_asignaturas"],
+        "top_panoleros": datos["top_panoleros"],
 
         # 👇 NUEVO: lista de herramientas sin stock
         "herramientas_sin_stock": herramientas_sin_stock,
@@ -1756,194 +1915,72 @@ def informe_prestamos(request):
     return render(request, "inventario/informe_prestamos.html", context)
 
 
-#KPI DASBOAR
-
 @login_required
-def panel_kpis(request):
-    semestre = request.GET.get("semestre", "")              # ej. "2025-1"
-    carrera_filtro = request.GET.get("carrera", "")         # carrera de estudiante
-    asignatura_filtro = request.GET.get("asignatura", "")   # nombre asignatura
-
-    # Rango de fechas (YYYY-MM-DD) desde el formulario
-    fecha_desde_str = request.GET.get("fecha_desde", "").strip()
-    fecha_hasta_str = request.GET.get("fecha_hasta", "").strip()
-
-    # 1) Si NO hay ningún filtro, aplicamos por defecto "últimos 90 días"
-    if not semestre and not carrera_filtro and not asignatura_filtro and not fecha_desde_str and not fecha_hasta_str:
-        hoy = timezone.localdate()
-        fecha_desde_default = hoy - timedelta(days=90)
-        fecha_desde_str = fecha_desde_default.strftime("%Y-%m-%d")
-        fecha_hasta_str = hoy.strftime("%Y-%m-%d")
-
-    # Base de préstamos (con relaciones)
-    prestamos = Prestamo.objects.select_related(
-        "docente", "estudiante", "asignatura", "panolero"
-    )
+def exportar_prestamos_detalle(request):
+    """
+    Préstamos con sus líneas de detalle (una fila por herramienta prestada),
+    con los mismos filtros que informe_prestamos:
 
-    # --- FILTRO POR SEMESTRE ---
-    if semestre:
-        try:
-            año_str, sem_str = semestre.split("-")  # "2025-1"
-            año = int(año_str)
-            if sem_str == "1":   # 1er semestre (ejemplo marzo–julio)
-                prestamos = prestamos.filter(
-                    fecha__year=año,
-                    fecha__month__in=[3, 4, 5, 6, 7],
-                )
-            elif sem_str == "2": # 2º semestre (agosto–diciembre)
-                prestamos = prestamos.filter(
-                    fecha__year=año,
-                    fecha__month__in=[8, 9, 10, 11, 12],
-                )
-        except ValueError:
-            pass
+      - ?formato=csv    (por defecto) → CSV para Excel
+      - ?formato=ndjson               → un objeto JSON por línea
 
-    # --- FILTRO POR RANGO DE FECHAS ---
-    if fecha_desde_str:
-        try:
-            fecha_desde = timezone.datetime.strptime(
-                fecha_desde_str, "%Y-%m-%d"
-            ).date()
-            prestamos = prestamos.filter(fecha__gte=fecha_desde)
-        except ValueError:
-            fecha_desde = None
-    else:
-        fecha_desde = None
+    Se envía en streaming por bloques: el archivo empieza a descargarse de
+    inmediato y la memoria no depende de cuántas líneas haya.
+    """
+    filtros = kpis.leer_filtros(request.GET, kpis.FILTROS_INFORME)
+    formato = request.GET.get("formato", "csv").lower()
 
-    if fecha_hasta_str:
-        try:
-            fecha_hasta = timezone.datetime.strptime(
-                fecha_hasta_str, "%Y-%m-%d"
-            ).date()
-            prestamos = prestamos.filter(fecha__lte=fecha_hasta)
-        except ValueError:
-            fecha_hasta = None
+    if formato == "ndjson":
+        response = StreamingHttpResponse(
+            exportaciones.detalle_ndjson(filtros),
+            content_type="application/x-ndjson; charset=utf-8",
+        )
+        nombre = "prestamos_detalle.ndjson"
     else:
-        fecha_hasta = None
-
-    # --- FILTRO POR CARRERA (solo préstamos de estudiantes) ---
-    if carrera_filtro:
-        prestamos = prestamos.filter(estudiante__carrera=carrera_filtro)
-
-    # --- FILTRO POR ASIGNATURA ---
-    if asignatura_filtro:
-        prestamos = prestamos.filter(asignatura__nombre=asignatura_filtro)
-
-    # ========== IMPORTANTE ==========
-    # Usaremos `prestamos_qs` para KPIs y rankings (TODOS los registros filtrados)
-    # y luego paginaremos SOLO para la tabla.
-    # =================================
-    prestamos_qs = prestamos
-
-    # ---------------- KPIs GENERALES ----------------
-    total_prestamos = prestamos_qs.count()
-
-    total_herramientas = (
-        PrestamoDetalle.objects
-        .filter(prestamo__in=prestamos_qs)
-        .aggregate(total=Sum("cantidad_entregada"))["total"] or 0
-    )
-
-    total_prest_docente = prestamos_qs.filter(docente__isnull=False).count()
-    total_prest_estudiante = prestamos_qs.filter(estudiante__isnull=False).count()
-    total_prest_otros = total_prestamos - total_prest_docente - total_prest_estudiante
-
-    # 🔹 cuántos pañoleros distintos han intervenido en estos préstamos
-    total_panoleros = (
-        prestamos_qs.exclude(panolero__isnull=True)
-        .values("panolero")
-        .distinct()
-        .count()
-    )
-
-    # ---------------- TOPs PARA GRÁFICOS ----------------
-
-    # Top 5 docentes por cantidad de préstamos
-    top_docentes = (
-        prestamos_qs.filter(docente__isnull=False)
-        .values("docente__nombre", "docente__codigo")
-        .annotate(total_prestamos=Count("id"))
-        .order_by("-total_prestamos")[:5]
-    )
-
-    # Top 5 carreras (préstamos de estudiantes)
-    top_carreras = (
-        prestamos_qs.filter(estudiante__isnull=False, estudiante__carrera__isnull=False)
-        .values("estudiante__carrera")
-        .annotate(total_prestamos=Count("id"))
-        .order_by("-total_prestamos")[:5]
-    )
+        response = StreamingHttpResponse(
+            exportaciones.detalle_csv(filtros),
+            content_type="text/csv; charset=utf-8",
+        )
+        nombre = "prestamos_detalle.csv"
 
-    # Detalles filtrados (para herramientas / autos)
-    detalles_filtrados = PrestamoDetalle.objects.filter(prestamo__in=prestamos_qs)
+    response["Content-Disposition"] = f'attachment; filename="{nombre}"'
+    return response
 
-    # Top 5 herramientas más despachadas (general)
-    top_herramientas = (
-        detalles_filtrados
-        .values("herramienta__nombre", "herramienta__codigo")
-        .annotate(total_cant=Sum("cantidad_entregada"))
-        .order_by("-total_cant")[:5]
-    )
 
-    # 🔹 Top 5 herramientas FIJAS
-    top_herramientas_fijas = (
-        detalles_filtrados
-        .filter(herramienta__tipo__icontains="fijo")
-        .values("herramienta__nombre", "herramienta__codigo")
-        .annotate(total_cant=Sum("cantidad_entregada"))
-        .order_by("-total_cant")[:5]
-    )
+#KPI DASBOAR
 
-    # 🔹 Top 5 herramientas CONSUMIBLES
-    top_herramientas_consumibles = (
-        detalles_filtrados
-        .filter(herramienta__tipo__icontains="consumible")
-        .values("herramienta__nombre", "herramienta__codigo")
-        .annotate(total_cant=Sum("cantidad_entregada"))
-        .order_by("-total_cant")[:5]
-    )
+@login_required
+def panel_kpis(request):
+    filtros = kpis.leer_filtros(request.GET, kpis.FILTROS_PANEL)
+    semestre = filtros["semestre"]                  # ej. "2025-1"
+    carrera_filtro = filtros["carrera"]             # carrera de estudiante
+    asignatura_filtro = filtros["asignatura"]       # nombre asignatura
 
-    # Top 5 llaves de auto (asumiendo tipo contiene "llave_auto")
-    top_autos = (
-        detalles_filtrados
-        .filter(herramienta__tipo__icontains="llave_auto")
-        .values("herramienta__nombre", "herramienta__codigo")
-        .annotate(total_prestamos=Count("prestamo", distinct=True))
-        .order_by("-total_prestamos")[:5]
-    )
+    # 1) Si NO hay ningún filtro, aplicamos por defecto "últimos 90 días"
+    if not any(filtros.values()):
+        hoy = timezone.localdate()
+        filtros["fecha_desde"] = (hoy - timedelta(days=90)).strftime("%Y-%m-%d")
+        filtros["fecha_hasta"] = hoy.strftime("%Y-%m-%d")
 
-    # Top 5 asignaturas
-    top_asignaturas = (
-        prestamos_qs.filter(asignatura__isnull=False)
-        .values("asignatura__nombre")
-        .annotate(total_prestamos=Count("id"))
-        .order_by("-total_prestamos")[:5]
-    )
+    # Rango de fechas (YYYY-MM-DD) para el formulario y la exportación
+    fecha_desde_str = filtros["fecha_desde"]
+    fecha_hasta_str = filtros["fecha_hasta"]
 
-    # Top 5 pañoleros por cantidad de préstamos registrados
-    top_panoleros = (
-        prestamos_qs.filter(panolero__isnull=False)
-        .values("panolero__nombre")
-        .annotate(total_prestamos=Count("id"))
-        .order_by("-total_prestamos")[:5]
-    )
+    # ========== IMPORTANTE ==========
+    # Los KPIs y rankings salen del motor de KPIs (resúmenes diarios de
+    # TODOS los registros filtrados) y luego paginamos SOLO para la tabla.
+    # =================================
+    datos = cache_kpis.obtener(filtros)
+    prestamos_qs = kpis.prestamos_filtrados(filtros)
 
     # ---------------- PAGINACIÓN PARA LA TABLA ----------------
-    # Ordenamos y paginamos SOLO para la tabla de "Listado de préstamos"
-    prestamos_qs = prestamos_qs.order_by("-fecha", "-id")
-
-    paginator = Paginator(prestamos_qs, 100)  # 100 préstamos por página (ajusta a gusto)
-    page_number = request.GET.get("page")
-    page_obj = paginator.get_page(page_number)
-
-    # Para construir los links de paginación sin duplicar el parámetro "page"
-    query_params = request.GET.copy()
-    if "page" in query_params:
-        query_params.pop("page")
-    querystring = query_params.urlencode()
+    # Página por cursor (-fecha, -id) SOLO para la tabla de "Listado de préstamos":
+    # sin COUNT ni OFFSET, las páginas profundas cuestan lo mismo que la primera.
+    pagina = paginacion.paginar(prestamos_qs, request.GET)
 
     # ---------------- LISTAS PARA LOS SELECT ----------------
-    lista_semestres = ["2024-1", "2024-2", "2025-1", "2025-2"]
+    # Semestres desde el calendario académico (en memoria, sin consultar la BD)
+    lista_semestres = periodos.codigos()
 
     lista_carreras = (
         Estudiante.objects
@@ -1963,27 +2000,26 @@ def panel_kpis(request):
 
     context = {
         # PRESTAMOS PAGINADOS (para la tabla)
-        "page_obj": page_obj,
-        "querystring": querystring,
+        "pagina": pagina,
 
         # KPIs
-        "total_prestamos": total_prestamos,
-        "total_herramientas": total_herramientas,
-        "total_prest_docente": total_prest_docente,
-        "total_prest_estudiante": total_prest_estudiante,
-        "total_prest_otros": total_prest_otros,
+        "total_prestamos": datos["total_prestamos"],
+        "total_herramientas": datos["total_herramientas"],
+        "total_prest_docente": datos["total_prest_docente"],
+        "total_prest_estudiante": datos["total_prest_estudiante"],
+        "total_prest_otros": datos["total_prest_otros"],
 
-        "total_panoleros": total_panoleros,
-        "top_panoleros": top_panoleros,
+        "total_panoleros": datos["total_panoleros"],
+        "top_panoleros": datos["top_panoleros"],
 
         # TOPs
-        "top_docentes": top_docentes,
-        "top_carreras": top_carreras,
-        "top_herramientas": top_herramientas,
-        "top_herramientas_fijas": top_herramientas_fijas,
-        "top_herramientas_consumibles": top_herramientas_consumibles,
-        "top_autos": top_autos,
-        "top_asignaturas": top_asignaturas,
+        "top_docentes": datos["top_docentes"],
+        "top_carreras": datos["top_carreras"],
+        "top_herramientas": datos["top_herramientas"],
+        "top_herramientas_fijas": datos["top_herramientas_fijas"],
+        "top_herramientas_consumibles": datos["top_herramientas_consumibles"],
+        "top_autos": datos["top_autos"],
+        "top_asignaturas": datos["top_asignaturas"],
 
         # Filtros para los select
         "lista_semestres": lista_semestres,
@@ -1999,354 +2035,135 @@ def panel_kpis(request):
     }
     return render(request, "inventario/panel_kpis.html", context)
 
-# Exportar
 @login_required
-def exportar_panel_kpis(request):
-    semestre = request.GET.get("semestre", "")
-    carrera = request.GET.get("carrera", "")
-    asignatura_nombre = request.GET.get("asignatura", "")
-    fecha_desde = request.GET.get("fecha_desde", "")
-    fecha_hasta = request.GET.get("fecha_hasta", "")
-
-    # ================== BASE QUERY ==================
-    prestamos = Prestamo.objects.select_related(
-        "docente", "estudiante", "asignatura", "panolero"
-    )
-
-    # ----- Filtro por semestre -----
-    if semestre:
-        try:
-            año_str, sem_str = semestre.split("-")  # "2025-1"
-            año = int(año_str)
-            if sem_str == "1":   # 1er semestre
-                prestamos = prestamos.filter(
-                    fecha__year=año,
-                    fecha__month__in=[3, 4, 5, 6, 7],
-                )
-            elif sem_str == "2":  # 2º semestre
-                prestamos = prestamos.filter(
-                    fecha__year=año,
-                    fecha__month__in=[8, 9, 10, 11, 12],
-                )
-        except ValueError:
-            pass
-
-    # ----- Filtro por carrera -----
-    if carrera:
-        prestamos = prestamos.filter(estudiante__carrera=carrera)
-
-    # ----- Filtro por asignatura -----
-    if asignatura_nombre:
-        prestamos = prestamos.filter(asignatura__nombre=asignatura_nombre)
-
-    # ----- Filtro por rango de fechas -----
-    # Si tu input date está en formato YYYY-MM-DD (lo normal del navegador),
-    # con este formato basta. Si tuvieras DD-MM-YYYY, se intenta también.
-    if fecha_desde:
-        parseado = None
-        for fmt in ("%Y-%m-%d", "%d-%m-%Y"):
-            try:
-                parseado = datetime.strptime(fecha_desde, fmt).date()
-                break
-            except ValueError:
-                continue
-        if parseado:
-            prestamos = prestamos.filter(fecha__gte=parseado)
-
-    if fecha_hasta:
-        parseado = None
-        for fmt in ("%Y-%m-%d", "%d-%m-%Y"):
-            try:
-                parseado = datetime.strptime(fecha_hasta, fmt).date()
-                break
-            except ValueError:
-                continue
-        if parseado:
-            prestamos = prestamos.filter(fecha__lte=parseado)
-
-    # ================== CÁLCULO DE KPIs (SOLO CON FILTROS APLICADOS) ==================
-    total_prestamos = prestamos.count()
-
-    total_herramientas = (
-        PrestamoDetalle.objects
-        .filter(prestamo__in=prestamos)
-        .aggregate(total=Sum("cantidad_entregada"))["total"] or 0
-    )
+def api_series_prestamos(request):
+    """
+    Serie de tiempo para los gráficos del panel (JSON):
 
-    total_prest_docente = prestamos.filter(docente__isnull=False).count()
-    total_prest_estudiante = prestamos.filter(estudiante__isnull=False).count()
-    total_prest_otros = total_prestamos - total_prest_docente - total_prest_estudiante
+      GET ?granularidad=dia|semana|mes
+          &fecha_desde=&fecha_hasta=&semestre=&carrera=&asignatura=
+          &herramienta=<código>&tipo_solicitante=docente|estudiante|otro
 
-    total_panoleros = (
-        prestamos.exclude(panolero__isnull=True)
-        .values("panolero")
-        .distinct()
-        .count()
-    )
+    → {"granularidad", "desde", "hasta", "puntos": [{"periodo", "prestamos", "unidades"}]}
 
-    # ----- Top 5 docentes -----
-    top_docentes = (
-        prestamos.filter(docente__isnull=False)
-        .values("docente__nombre", "docente__codigo")
-        .annotate(total_prestamos=Count("id"))
-        .order_by("-total_prestamos")[:5]
-    )
+    Sale de los resúmenes diarios y del caché de KPIs; con If-None-Match
+    y datos sin cambios se responde 304 sin calcular.
+    """
+    try:
+        filtros = series.leer_parametros(request.GET)
+    except series.SerieInvalida as e:
+        return JsonResponse({"error": str(e)}, status=400)
 
-    # ----- Top 5 carreras -----
-    top_carreras = (
-        prestamos.filter(estudiante__isnull=False, estudiante__carrera__isnull=False)
-        .values("estudiante__carrera")
-        .annotate(total_prestamos=Count("id"))
-        .order_by("-total_prestamos")[:5]
-    )
+    etag = cache_kpis.etag("serie", filtros)
+    if etag in request.headers.get("If-None-Match", ""):
+        respuesta = HttpResponse(status=304)
+    else:
+        respuesta = JsonResponse(cache_kpis.obtener_serie(filtros))
 
-    # Detalles filtrados (para herramientas / autos)
-    detalles_filtrados = PrestamoDetalle.objects.filter(prestamo__in=prestamos)
+    respuesta["ETag"] = etag
+    respuesta["Cache-Control"] = "private, no-cache"
+    return respuesta
 
-    # ----- Top 5 herramientas -----
-    top_herramientas = (
-        detalles_filtrados
-        .values("herramienta__nombre", "herramienta__codigo")
-        .annotate(total_cant=Sum("cantidad_entregada"))
-        .order_by("-total_cant")[:5]
-    )
+@login_required
+@user_passes_test(es_jefe_panol)
+def api_kpis_cache(request):
+    """
+    Estadísticas del caché de KPIs de este proceso (aciertos, fallos,
+    entradas vencidas/descartadas), para ajustar KPIS_CACHE_MAX_ENTRADAS.
+    """
+    return JsonResponse(cache_kpis.estadisticas())
 
-    # ----- Top 5 autos (llaves auto) -----
-    top_autos = (
-        detalles_filtrados
-        .filter(herramienta__tipo__icontains="llave_auto")
-        .values("herramienta__nombre", "herramienta__codigo")
-        .annotate(total_prestamos=Count("prestamo", distinct=True))
-        .order_by("-total_prestamos")[:5]
-    )
+# Exportar
+@login_required
+def exportar_panel_kpis(request):
+    filtros = kpis.leer_filtros(request.GET, kpis.FILTROS_PANEL)
 
-    # ----- Top 5 asignaturas -----
-    top_asignaturas = (
-        prestamos.filter(asignatura__isnull=False)
-        .values("asignatura__nombre")
-        .annotate(total_prestamos=Count("id"))
-        .order_by("-total_prestamos")[:5]
-    )
-
-    # ----- Top 5 pañoleros -----
-    top_panoleros = (
-        prestamos.filter(panolero__isnull=False)
-        .values("panolero__nombre")
-        .annotate(total_prestamos=Count("id"))
-        .order_by("-total_prestamos")[:5]
-    )
+    # ================== KPIs (mismos filtros y motor que el panel) ==================
+    prestamos = kpis.prestamos_filtrados(filtros)
+    datos = cache_kpis.obtener(filtros)
 
     formato = request.GET.get("formato", "excel").lower()
 
     # ======================================================
     #   EXPORTAR A EXCEL (detalle completo filtrado)
+    #   Workbook write-only a un archivo temporal, entregado en bloques:
+    #   la memoria no crece con la cantidad de préstamos del rango.
     # ======================================================
     if formato == "excel":
-        import openpyxl
-
-        wb = openpyxl.Workbook()
-
-        # --- Hoja 1: KPIs ---
-        ws_kpi = wb.active
-        ws_kpi.title = "KPIs"
-
-        ws_kpi.append(["KPI", "Valor"])
-        ws_kpi.append(["Total de préstamos", total_prestamos])
-        ws_kpi.append(["Herramientas entregadas", total_herramientas])
-        ws_kpi.append(["Préstamos a docentes", total_prest_docente])
-        ws_kpi.append(["Préstamos a estudiantes", total_prest_estudiante])
-        ws_kpi.append(["Préstamos otros", total_prest_otros])
-        ws_kpi.append(["Pañoleros activos", total_panoleros])
-
-        ws_kpi.append([])
-        ws_kpi.append(["Top 5 docentes", "Préstamos"])
-        for d in top_docentes:
-            ws_kpi.append([d["docente__nombre"], d["total_prestamos"]])
-
-        ws_kpi.append([])
-        ws_kpi.append(["Top 5 carreras", "Préstamos"])
-        for c in top_carreras:
-            ws_kpi.append([c["estudiante__carrera"], c["total_prestamos"]])
-
-        ws_kpi.append([])
-        ws_kpi.append(["Top 5 herramientas", "Cantidad entregada"])
-        for h in top_herramientas:
-            ws_kpi.append([h["herramienta__nombre"], h["total_cant"]])
-
-        ws_kpi.append([])
-        ws_kpi.append(["Top 5 asignaturas", "Préstamos"])
-        for a in top_asignaturas:
-            ws_kpi.append([a["asignatura__nombre"], a["total_prestamos"]])
-
-        ws_kpi.append([])
-        ws_kpi.append(["Top 5 llaves de auto", "Préstamos"])
-        for au in top_autos:
-            ws_kpi.append([au["herramienta__nombre"], au["total_prestamos"]])
-
-        ws_kpi.append([])
-        ws_kpi.append(["Top 5 pañoleros", "Préstamos"])
-        for p in top_panoleros:
-            ws_kpi.append([p["panolero__nombre"], p["total_prestamos"]])
-
-        # --- Hoja 2: detalle de préstamos filtrados ---
-        ws = wb.create_sheet(title="Préstamos")
-
-        encabezados = [
-            "Código", "Fecha", "Hora inicio", "Hora fin",
-            "Solicitante", "Asignatura", "Pañolero", "Estado",
-        ]
-        ws.append(encabezados)
-
-        for p in prestamos:
-            if p.docente:
-                solicitante = f"{p.docente.nombre} (Docente)"
-            elif p.estudiante:
-                solicitante = f"{p.estudiante.nombre} ({p.estudiante.carrera})"
-            else:
-                solicitante = "-"
-
-            asignatura = p.asignatura.nombre if p.asignatura else "-"
-            panolero = p.panolero.nombre if p.panolero else "-"
-
-            ws.append([
-                p.codigo_prestamo,
-                p.fecha.strftime("%Y-%m-%d") if p.fecha else "",
-                p.hora_inicio.strftime("%H:%M") if p.hora_inicio else "",
-                p.hora_fin.strftime("%H:%M") if p.hora_fin else "",
-                solicitante,
-                asignatura,
-                panolero,
-                p.estado,
-            ])
-
-        response = HttpResponse(
-            content_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+        archivo = exportaciones.kpis_xlsx(datos, prestamos)
+        return FileResponse(
+            archivo,
+            as_attachment=True,
+            filename="panel_kpis.xlsx",
+            content_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
         )
-        response["Content-Disposition"] = 'attachment; filename=\"panel_kpis.xlsx\"'
-        wb.save(response)
-        return response
 
     # ======================================================
     #   EXPORTAR A PDF (KPIs + rankings, todos con filtros)
     # ======================================================
     if formato == "pdf":
-        from reportlab.pdfgen import canvas
-        from reportlab.lib.pagesizes import letter
-        from reportlab.lib.utils import ImageReader
-        import urllib.request
-
         response = HttpResponse(content_type="application/pdf")
         response["Content-Disposition"] = 'attachment; filename=\"panel_kpis.pdf\"'
+        exportaciones.kpis_pdf(datos, filtros, response)
+        return response
 
-        c = canvas.Canvas(response, pagesize=letter)
-        width, height = letter
+    return HttpResponse("Formato no soportado", status=400)
 
-        # -------- LOGO --------
-        try:
-            logo_url = (
-                "https://afeva.cl/wp-content/uploads/"
-                "bfi_thumb/logo-02-3de0hedts90kzsj5so5p6cawzz6fhdkja52f67wjd5s94pl8w.png"
-            )
-            logo_stream = urllib.request.urlopen(logo_url)
-            logo_image = ImageReader(logo_stream)
-
-            logo_width = 80
-            logo_height = 40
-            x = width - logo_width - 40
-            y = height - logo_height - 30
-
-            c.drawImage(
-                logo_image,
-                x,
-                y,
-                width=logo_width,
-                height=logo_height,
-                preserveAspectRatio=True,
-                mask="auto",
-            )
-        except Exception as e:
-            print("No se pudo cargar el logo desde URL:", e)
-
-        # -------- TÍTULO Y FILTROS --------
-        y = height - 60
-        c.setFont("Helvetica-Bold", 14)
-        c.drawString(40, y, "Panel de KPIs - Resumen")
-        y -= 20
-
-        c.setFont("Helvetica", 9)
-        filtros = [
-            f"Semestre: {semestre or 'Todos'}",
-            f"Carrera: {carrera or 'Todas'}",
-            f"Asignatura: {asignatura_nombre or 'Todas'}",
-            f"Fecha desde: {fecha_desde or '---'}",
-            f"Fecha hasta: {fecha_hasta or '---'}",
-        ]
-        for linea in filtros:
-            c.drawString(40, y, linea)
-            y -= 12
-
-        # -------- KPIs GENERALES (FILTRADOS) --------
-        y -= 8
-        c.setFont("Helvetica-Bold", 11)
-        c.drawString(40, y, "KPIs generales")
-        y -= 15
-        c.setFont("Helvetica", 9)
-
-        kpis = [
-            f"Total de préstamos: {total_prestamos}",
-            f"Herramientas entregadas: {total_herramientas}",
-            f"Préstamos a docentes: {total_prest_docente}",
-            f"Préstamos a estudiantes: {total_prest_estudiante}",
-            f"Préstamos otros: {total_prest_otros}",
-            f"Pañoleros activos: {total_panoleros}",
-        ]
-        for l in kpis:
-            c.drawString(40, y, l)
-            y -= 12
-
-        def check_page(y_actual):
-            if y_actual < 60:
-                c.showPage()
-                return height - 40
-            return y_actual
-
-        # -------- RANKINGS (FILTRADOS) --------
-        secciones_rank = [
-            ("Top 5 docentes (por préstamos)", top_docentes,
-             lambda d: f"{d['docente__nombre']}: {d['total_prestamos']}"),
-            ("Top 5 carreras (préstamos a estudiantes)", top_carreras,
-             lambda r: f"{r['estudiante__carrera']}: {r['total_prestamos']}"),
-            ("Top 5 herramientas (cantidad entregada)", top_herramientas,
-             lambda h: f"{h['herramienta__nombre']}: {h['total_cant']}"),
-            ("Top 5 asignaturas (préstamos)", top_asignaturas,
-             lambda a: f"{a['asignatura__nombre']}: {a['total_prestamos']}"),
-            ("Top 5 llaves de auto (préstamos)", top_autos,
-             lambda au: f"{au['herramienta__nombre']}: {au['total_prestamos']}"),
-            ("Top 5 pañoleros (préstamos registrados)", top_panoleros,
-             lambda p: f"{p['panolero__nombre']}: {p['total_prestamos']}"),
-        ]
+# ---------------------------------------------------
+# REPORTES EN SEGUNDO PLANO (cola 'trabajos_reportes')
+#   El panel pide la exportación, consulta el estado cada
+#   pocos segundos y descarga el archivo al terminar.
+# ---------------------------------------------------
+def _estado_trabajo(trabajo):
+    datos = {"id": trabajo.id, "estado": trabajo.estado}
+    if trabajo.estado == "listo":
+        datos["url_descarga"] = reverse("descargar_reporte", args=[trabajo.id])
+    elif trabajo.estado == "error":
+        datos["error"] = trabajo.error
+    return datos
 
-        for titulo, lista, fmt in secciones_rank:
-            y = check_page(y - 10)
-            c.setFont("Helvetica-Bold", 11)
-            c.drawString(40, y, titulo)
-            y -= 15
-            c.setFont("Helvetica", 9)
 
-            if not lista:
-                c.drawString(50, y, "Sin registros para este ranking.")
-                y -= 12
-            else:
-                for item in lista:
-                    y = check_page(y)
-                    c.drawString(50, y, f"- {fmt(item)}")
-                    y -= 12
+@login_required
+def solicitar_reporte_kpis(request):
+    """
+    POST con formato=excel|pdf y los filtros del panel → {id, estado, ...}.
+    Si ya hay un reporte igual en curso, o uno terminado con los mismos
+    datos, se devuelve ese en vez de generar otro.
+    """
+    if request.method != "POST":
+        return JsonResponse({"error": "Método no permitido."}, status=405)
 
-        c.showPage()
-        c.save()
-        return response
+    filtros = kpis.leer_filtros(request.POST, kpis.FILTROS_PANEL)
+    formato = request.POST.get("formato", "excel").lower()
 
-    return HttpResponse("Formato no soportado", status=400)
+    try:
+        trabajo = reportes.solicitar("panel_kpis", formato, filtros, request.user)
+    except reportes.ReporteInvalido as e:
+        return JsonResponse({"error": str(e)}, status=400)
+
+    return JsonResponse(_estado_trabajo(trabajo))
+
+
+@login_required
+def estado_reporte(request, trabajo_id):
+    trabajo = get_object_or_404(TrabajoReporte, id=trabajo_id)
+    return JsonResponse(_estado_trabajo(trabajo))
+
+
+@login_required
+def descargar_reporte(request, trabajo_id):
+    trabajo = get_object_or_404(TrabajoReporte, id=trabajo_id, estado="listo")
+    try:
+        archivo = open(trabajo.archivo, "rb")
+    except OSError:
+        raise Http404("El archivo del reporte ya no está disponible.")
+
+    return FileResponse(
+        archivo,
+        as_attachment=True,
+        filename=reportes.nombre_descarga(trabajo),
+        content_type=reportes.content_type(trabajo),
+    )
 
 #IA
 def asignatura_recomendaciones(request, asig_id):
@@ -2366,7 +2183,13 @@ def asignatura_recomendaciones(request, asig_id):
     asignatura = get_object_or_404(Asignatura, id=asig_id)
 
     # llamamos al modelo de recomendación
-    recs = rec.recomendar_herramientas(asig_id, top_n=50)  # puedes subir/bajar el top_n
+    try:
+        recs = rec.recomendar_herramientas(asig_id, top_n=50)  # puedes subir/bajar el top_n
+    except rec.ModeloNoDisponible:
+        return JsonResponse(
+            {"error": "Las recomendaciones no están disponibles por ahora."},
+            status=503,
+        )
 
     data = {
         "id": asignatura.id,
@@ -2382,19 +2205,3 @@ def asignatura_recomendaciones(request, asig_id):
     }
 
     return JsonResponse(data)
-    # 1) Buscar la asignatura
-    asignatura = get_object_or_404(Asignatura, id=asig_id)
-
-    # 2) Entrenar modelo (por si no está entrenado en este proceso)
-    rec.entrenar_modelo()
-
-    # 3) Obtener recomendaciones (puedes cambiar top_n)
-    recomendaciones = rec.recomendar_herramientas(asignatura, top_n=20)
-
-    # 4) Renderizar template
-    contexto = {
-        "asignatura": asignatura,
-        "recomendaciones": recomendaciones,
-    }
-    return render(request, "inventario/asignatura_recomendaciones.html", contexto)
-
@@ -149,6 +149,12 @@ LOGOUT_REDIRECT_URL = 'login'  # o 'logout_msg' si quieres
 # --- PARÁMETROS DE NEGOCIO (puedes dejarlos en settings.py si prefieres) ---
 ANTELACION_DIAS_PREPARACION = 3      # en producción: 2 o 3
 VENTANA_MINUTOS_RESERVA = 15         # en producción: 15 min
+IDEMPOTENCIA_HORAS = 24              # cuánto se recuerda una clave de idempotencia
+KPIS_CACHE_MAX_ENTRADAS = 200        # combinaciones de filtros del panel guardadas por proceso
+REPORTES_DIR = BASE_DIR / "reportes_generados"   # archivos de la cola de reportes
+REPORTES_HORAS = 24                  # cuánto se guardan (y reutilizan) los reportes generados
+MARCA_CACHE_DIR = BASE_DIR / "cache_marca"      # copia local del logo de los PDF (ver static/img/logo.png)
+RECOMENDADOR_MODELO_PATH = BASE_DIR / "modelos" / "recomendador.pkl"  # python manage.py entrenar_recomendador
 
 
 # Para desarrollo: los mails se muestran en la consola
@@ -35,6 +35,14 @@ urlpatterns = [
     path('inventario/api/herramienta/', inventario_views.api_herramienta_por_codigo,
          name='api_herramienta_por_codigo'),
 
+    # API: resolver varios códigos / códigos de barra en una sola llamada (ráfagas del escáner)
+    path('inventario/api/herramientas/lote/', inventario_views.api_herramientas_por_codigos,
+         name='api_herramientas_por_codigos'),
+
+    # API: catálogo versionado (completo o delta ?desde=) con ETag, para las estaciones
+    path('inventario/api/catalogo/', inventario_views.api_catalogo,
+         name='api_catalogo'),
+
     # API: buscar preparación por código (para cargar en crear_prestamo)
     path('inventario/api/preparacion/', inventario_views.api_preparacion_por_codigo,
          name='api_preparacion_por_codigo'),
@@ -102,6 +110,10 @@ urlpatterns = [
     path('informes/prestamos/', inventario_views.informe_prestamos,
          name='informe_prestamos'),
 
+    # Exportar préstamos con sus líneas de detalle (CSV / NDJSON en streaming)
+    path('informes/prestamos/exportar/', inventario_views.exportar_prestamos_detalle,
+         name='exportar_prestamos_detalle'),
+
     # Panel de KPIs (dashboard)
     path('informes/panel/', inventario_views.panel_kpis, name='panel_kpis'),
 
@@ -109,6 +121,22 @@ urlpatterns = [
     path('informes/panel/exportar/', inventario_views.exportar_panel_kpis,
          name='exportar_panel_kpis'),
 
+    # Serie de tiempo (préstamos / unidades por día, semana o mes) para gráficos
+    path('informes/panel/series/', inventario_views.api_series_prestamos,
+         name='api_series_prestamos'),
+
+    # Estadísticas del caché de KPIs (aciertos / fallos), solo jefatura
+    path('informes/panel/cache/', inventario_views.api_kpis_cache,
+         name='api_kpis_cache'),
+
+    # Reportes en segundo plano: pedir, consultar estado y descargar
+    path('informes/reportes/solicitar/', inventario_views.solicitar_reporte_kpis,
+         name='solicitar_reporte_kpis'),
+    path('informes/reportes/<int:trabajo_id>/', inventario_views.estado_reporte,
+         name='estado_reporte'),
+    path('informes/reportes/<int:trabajo_id>/descargar/', inventario_views.descargar_reporte,
+         name='descargar_reporte'),
+
      path("ia/recomendaciones/<int:asig_id>/", inventario_views.asignatura_recomendaciones, name="asignatura_recomendaciones",),
 
   
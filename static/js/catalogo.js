@@ -0,0 +1,98 @@
+// static/js/catalogo.js
+//
+// Catálogo (herramientas, docentes, asignaturas) guardado en el navegador.
+// Se descarga completo una sola vez; después solo se piden los cambios
+// (/inventario/api/catalogo/?desde=<version>), que normalmente responden 304.
+
+const Catalogo = (function() {
+    const URL_API = "/inventario/api/catalogo/";
+    const CLAVE_STORAGE = "panol.catalogo";
+
+    // { version, herramientas: {codigo: h}, docentes: [], asignaturas: [] }
+    let datos = null;
+    let porBarra = {};
+
+    function reindexar() {
+        porBarra = {};
+        Object.values(datos.herramientas).forEach(h => {
+            if (h.codigo_barra) porBarra[h.codigo_barra] = h.codigo;
+        });
+    }
+
+    function leerGuardado() {
+        try {
+            const crudo = localStorage.getItem(CLAVE_STORAGE);
+            return crudo ? JSON.parse(crudo) : null;
+        } catch (e) {
+            return null;
+        }
+    }
+
+    function guardar() {
+        try {
+            localStorage.setItem(CLAVE_STORAGE, JSON.stringify(datos));
+        } catch (e) {
+            // Sin espacio o modo privado: seguimos solo en memoria
+            console.warn("No se pudo guardar el catálogo local", e);
+        }
+    }
+
+    function aplicar(resp) {
+        if (resp.completo || !datos) {
+            datos = { version: null, herramientas: {}, docentes: [], asignaturas: [] };
+        }
+        (resp.herramientas || []).forEach(h => { datos.herramientas[h.codigo] = h; });
+        (resp.eliminadas || []).forEach(c => { delete datos.herramientas[c]; });
+        if (resp.docentes) datos.docentes = resp.docentes;
+        if (resp.asignaturas) datos.asignaturas = resp.asignaturas;
+        datos.version = resp.version;
+
+        reindexar();
+        guardar();
+    }
+
+    function sincronizar() {
+        const url = (datos && datos.version)
+            ? URL_API + "?desde=" + encodeURIComponent(datos.version)
+            : URL_API;
+
+        return fetch(url, { credentials: "same-origin" })
+            .then(r => {
+                if (r.status === 304) return datos;
+                if (!r.ok) throw new Error("HTTP " + r.status);
+                return r.json().then(resp => { aplicar(resp); return datos; });
+            });
+    }
+
+    function cargar() {
+        datos = leerGuardado();
+        if (datos) reindexar();
+        return sincronizar().catch(err => {
+            console.error("Error al sincronizar el catálogo", err);
+            return datos;
+        });
+    }
+
+    // Busca por código o código de barra (igual prioridad que el servidor)
+    function buscar(codigo) {
+        if (!datos || !codigo) return null;
+        return datos.herramientas[codigo]
+            || datos.herramientas[porBarra[codigo]]
+            || null;
+    }
+
+    function recordar(h) {
+        if (!datos || !h) return;
+        datos.herramientas[h.codigo] = Object.assign({}, datos.herramientas[h.codigo], h);
+        if (h.codigo_barra) porBarra[h.codigo_barra] = h.codigo;
+    }
+
+    return {
+        cargar: cargar,
+        sincronizar: sincronizar,
+        buscar: buscar,
+        recordar: recordar,
+        docentes: () => (datos ? datos.docentes : []),
+        asignaturas: () => (datos ? datos.asignaturas : []),
+    };
+})();